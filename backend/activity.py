@@ -0,0 +1,78 @@
+"""
+Learning activity: every quiz and mock exam submission appends an ActivityEvent
+and bumps the user's DailyActivity rollup in the same transaction. The heatmap,
+weekly chart and streak read the rollups, one row per active day.
+"""
+from datetime import datetime, date
+from typing import Optional
+from sqlmodel import Session, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from .models import ActivityEvent, DailyActivity, Progress, MockAttempt
+from .user_stats import record_active_day
+
+KIND_COLUMNS = {"quiz": "quiz_count", "mock_exam": "mock_count"}
+
+def _upsert_rollup(session: Session, user_id: int, day: date, quiz_count: int, mock_count: int):
+    insert = pg_insert if session.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = insert(DailyActivity).values(
+        user_id=user_id, day=day, quiz_count=quiz_count, mock_count=mock_count, total=quiz_count + mock_count
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "day"],
+        set_={
+            "quiz_count": DailyActivity.quiz_count + stmt.excluded.quiz_count,
+            "mock_count": DailyActivity.mock_count + stmt.excluded.mock_count,
+            "total": DailyActivity.total + stmt.excluded.total,
+        }
+    )
+    session.execute(stmt)
+
+def record_activity(session: Session, user_id: int, kind: str, ref_id: Optional[int] = None,
+                    score: Optional[int] = None, passed: Optional[bool] = None, at: Optional[datetime] = None):
+    """Call inside the submitting transaction, before commit."""
+    at = at or datetime.utcnow()
+    session.add(ActivityEvent(user_id=user_id, kind=kind, ref_id=ref_id, score=score, passed=passed, created_at=at))
+    _upsert_rollup(session, user_id, at.date(), int(kind == "quiz"), int(kind == "mock_exam"))
+    record_active_day(session, user_id, at.date())
+
+def get_daily_activity(session: Session, user_id: int, start: date, end: date):
+    """Rollup rows for days with activity in [start, end], oldest first."""
+    return session.exec(
+        select(DailyActivity)
+        .where(DailyActivity.user_id == user_id, DailyActivity.day >= start, DailyActivity.day <= end)
+        .order_by(DailyActivity.day)
+    ).all()
+
+def backfill_activity(session: Session):
+    """
+    One-time seeding of the event log from rows written before it existed:
+    the last quiz per module (Progress.completed_at) and every mock attempt.
+    Does nothing once any event exists.
+    """
+    if session.exec(select(ActivityEvent.id).limit(1)).first() is not None:
+        return 0
+    events = [
+        ActivityEvent(user_id=user_id, kind="quiz", ref_id=module_id, score=score, created_at=completed_at)
+        for user_id, module_id, score, completed_at in session.exec(
+            select(Progress.user_id, Progress.module_id, Progress.score, Progress.completed_at)
+            .where(Progress.completed_at != None)
+        )
+    ]
+    events += [
+        ActivityEvent(user_id=user_id, kind="mock_exam", ref_id=attempt_id, score=score, passed=passed, created_at=created_at)
+        for attempt_id, user_id, score, passed, created_at in session.exec(
+            select(MockAttempt.id, MockAttempt.user_id, MockAttempt.score, MockAttempt.passed, MockAttempt.created_at)
+        )
+    ]
+    if not events:
+        return 0
+    session.add_all(events)
+    rollups = {}
+    for e in events:
+        counts = rollups.setdefault((e.user_id, e.created_at.date()), [0, 0])
+        counts[0 if e.kind == "quiz" else 1] += 1
+    for (user_id, day), (quiz_count, mock_count) in rollups.items():
+        _upsert_rollup(session, user_id, day, quiz_count, mock_count)
+    session.commit()
+    return len(events)
@@ -1,7 +1,12 @@
 import os
 import json
+import time
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
+from . import llm_cache, metrics
+from .database import run_db
+from .llm_gateway import LLMGateway, LLMUnavailable
+from .llm_providers import make_provider, LLM_PROVIDER
 
 load_dotenv()
 
@@ -14,19 +19,37 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 BASE_URL = "https://api.groq.com/openai/v1" 
 
 # fallback to generic if key is missing (it will fail at runtime but avoids crash on import)
-if not GROQ_API_KEY:
+if not GROQ_API_KEY and LLM_PROVIDER in ("groq", "record"):
     print("Warning: GROQ_API_KEY not found in environment.")
 
 client = AsyncOpenAI(
-    api_key=GROQ_API_KEY,
-    base_url=BASE_URL
+    # The client refuses to construct without a key; stub/replay runs don't need one
+    api_key=GROQ_API_KEY or "not-set",
+    base_url=BASE_URL,
+    # Retries are done by the gateway, with backoff shared across callers
+    max_retries=0
 )
+# All calls go through the gateway (rate limits, backoff, circuit breaker) to
+# the provider LLM_PROVIDER selects: this client, a local stub or recordings
+gateway = LLMGateway(make_provider(client))
+
+# Content returned when generation fails is marked with this key so it is
+# shown to the user but never saved as if the model had produced it
+FALLBACK_KEY = "fallback"
+# Shown when a chat reply fails; chat replies raise LLMUnavailable instead of
+# returning it, so it is never mistaken for (or saved as) a real reply
+CHAT_FALLBACK_MESSAGE = "I'm sorry, I'm currently unable to process your request. Please try again later."
+
+def is_fallback(data) -> bool:
+    return isinstance(data, dict) and bool(data.get(FALLBACK_KEY))
 
 # Model to use. Groq supports llama3-8b-8192, mixtral-8x7b-32768, etc.
 MODEL = "llama-3.3-70b-versatile"
 
-async def generate_roadmap_ai(topic: str, difficulty: str, duration: int, description: str):
-    prompt = f"""
+# Bump when a prompt changes in a way that should invalidate cached generations
+PROMPT_VERSION = "1"
+
+ROADMAP_PROMPT = """
     Create a learning roadmap for the topic: "{topic}".
     Difficulty: {difficulty}.
     Duration: {duration} days.
@@ -41,31 +64,8 @@ async def generate_roadmap_ai(topic: str, difficulty: str, duration: int, descri
     Ensure the roadmap covers the duration appropriately.
     Do not return markdown formatting, just raw JSON.
     """
-    
-    try:
-        response = await client.chat.completions.create(
-            model=MODEL,
-            messages=[
-                {"role": "system", "content": "You are a helpful educational AI assistant. Always return pure JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
-        )
-        content = response.choices[0].message.content
-        return json.loads(content)
-    except Exception as e:
-        print(f"Error generating roadmap: {e}")
-        # Fallback mock data if AI fails
-        return {
-            "modules": [
-                {"title": f"Introduction to {topic}", "description": "Basics and Setup", "order_index": 1},
-                {"title": f"Core Concepts of {topic}", "description": "Deep dive into main ideas", "order_index": 2},
-                {"title": f"Advanced {topic}", "description": "Complex topics and projects", "order_index": 3}
-            ]
-        }
 
-async def generate_module_content_ai(topic: str, module_title: str):
-    prompt = f"""
+MODULE_CONTENT_PROMPT = """
     Generate detailed educational content for the module "{module_title}" of the topic "{topic}".
     
     Return a valid JSON object with two keys: "slides" and "quizzes".
@@ -87,21 +87,89 @@ async def generate_module_content_ai(topic: str, module_title: str):
     
     Do not return markdown formatting for the JSON itself, just raw JSON.
     """
+
+MOCK_EXAM_PROMPT = """
+    Generate a mock exam for the topic "{topic}".
+    Difficulty: {difficulty}.
+    Number of questions: {count}.
     
+    Return a valid JSON object with a key "questions" containing a list of {count} question objects.
+    
+    The questions should be a mix of the following types:
+    1. "mcq": Multiple Choice (4 options). Keys: "type" ("mcq"), "question", "options" (list of strings), "correct_answer" (string, must match one option).
+    2. "code": Coding scenario. Keys: "type" ("code"), "question" (problem description), "test_case_input" (string example), "test_case_output" (string expected output).
+    3. "boolean": True/False. Keys: "type" ("boolean"), "question", "correct_answer" ("True" or "False").
+    
+    Requirements:
+    - For "code" type, the question must be solvable with a short function or script.
+    - Ensure questions correspond to the "{difficulty}" level.
+    - Do not return markdown, only valid JSON.
+    """
+
+async def _cached_json_completion(kind: str, template: str, system_prompt: str, use_cache: bool, **fields):
+    """
+    Renders the template, returns a cached result for an identical request if there is one,
+    otherwise calls the model and caches the parsed JSON. Raises on failure so callers
+    can fall back without caching the fallback.
+    """
+    key = None
+    if use_cache and llm_cache.LLM_CACHE_ENABLED:
+        key = llm_cache.make_key(kind, template + system_prompt, MODEL, PROMPT_VERSION, **fields)
+        cached = await run_db(llm_cache.get, key)
+        if cached is not None:
+            return cached
+
+    response = await gateway.create(
+        model=MODEL,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": template.format(**fields)}
+        ],
+        response_format={"type": "json_object"}
+    )
+    result = json.loads(response.choices[0].message.content)
+    if key is not None:
+        await run_db(llm_cache.put, key, kind, result)
+    return result
+
+async def generate_roadmap_ai(topic: str, difficulty: str, duration: int, description: str, use_cache: bool = True):
     try:
-        response = await client.chat.completions.create(
-            model=MODEL,
-            messages=[
-                {"role": "system", "content": "You are a helpful educational AI assistant. Always return pure JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
+        return await _cached_json_completion(
+            "roadmap",
+            ROADMAP_PROMPT,
+            "You are a helpful educational AI assistant. Always return pure JSON.",
+            use_cache,
+            topic=topic,
+            difficulty=difficulty,
+            duration=duration,
+            description=description
+        )
+    except Exception as e:
+        print(f"Error generating roadmap: {e}")
+        # Fallback mock data if AI fails
+        return {
+            FALLBACK_KEY: True,
+            "modules": [
+                {"title": f"Introduction to {topic}", "description": "Basics and Setup", "order_index": 1},
+                {"title": f"Core Concepts of {topic}", "description": "Deep dive into main ideas", "order_index": 2},
+                {"title": f"Advanced {topic}", "description": "Complex topics and projects", "order_index": 3}
+            ]
+        }
+
+async def generate_module_content_ai(topic: str, module_title: str, use_cache: bool = True):
+    try:
+        return await _cached_json_completion(
+            "module_content",
+            MODULE_CONTENT_PROMPT,
+            "You are a helpful educational AI assistant. Always return pure JSON.",
+            use_cache,
+            topic=topic,
+            module_title=module_title
         )
-        content = response.choices[0].message.content
-        return json.loads(content)
     except Exception as e:
         print(f"Error generating content: {e}")
         return {
+            FALLBACK_KEY: True,
             "slides": [
                 {"content": "# Error \n Could not generate content.", "order_index": 1}
             ],
@@ -117,16 +185,89 @@ async def generate_module_content_ai(topic: str, module_title: str):
 async def generate_chat_response(messages: list):
     """
     messages: list of {"role":Str, "content":Str}
+    Raises LLMUnavailable if no reply could be generated.
     """
     try:
-        response = await client.chat.completions.create(
+        response = await gateway.create(
             model=MODEL,
             messages=messages
         )
         return response.choices[0].message.content
     except Exception as e:
         print(f"Error generating chat: {e}")
-        return "I'm sorry, I'm currently unable to process your request. Please try again later."
+        if isinstance(e, LLMUnavailable):
+            raise
+        raise LLMUnavailable("Chat reply could not be generated") from e
+
+async def stream_chat_response(messages: list):
+    """
+    Same as generate_chat_response, but yields content deltas as they arrive.
+    Raises LLMUnavailable if the stream fails, possibly after some deltas.
+    Closing the generator closes the upstream stream.
+    """
+    stream = None
+    sent_any = False
+    failed = False
+    usage = None
+    started = time.perf_counter()
+    try:
+        stream = await gateway.create(
+            model=MODEL,
+            messages=messages,
+            stream=True
+        )
+        async for chunk in stream:
+            # Only sent by providers that report usage on streams, in the last chunk
+            usage = getattr(chunk, "usage", None) or usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if not sent_any:
+                    metrics.record_llm_first_token(time.perf_counter() - started)
+                sent_any = True
+                yield delta
+    except Exception as e:
+        failed = True
+        print(f"Error streaming chat: {e}")
+        if isinstance(e, LLMUnavailable):
+            raise
+        raise LLMUnavailable("Chat reply stream failed") from e
+    finally:
+        metrics.record_llm_call("stream", time.perf_counter() - started, usage, failed)
+        if stream is not None:
+            await stream.close()
+
+async def summarize_conversation(previous_summary: str, messages: list, max_tokens: int = 400):
+    """
+    Folds older chat turns into a running summary.
+    messages: list of {"role":Str, "content":Str}
+    Returns None if the summary could not be generated.
+    """
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    prompt = f"""
+    Update the running summary of a tutoring conversation with the new turns below.
+    Keep facts about the student (goals, level, misconceptions), topics covered and any open questions.
+    Be concise and write plain prose.
+    
+    Current summary: {previous_summary or "(none)"}
+    
+    New turns:
+    {transcript}
+    """
+    try:
+        response = await gateway.create(
+            model=MODEL,
+            messages=[
+                {"role": "system", "content": "You summarize conversations. Return only the updated summary."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=max_tokens
+        )
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        print(f"Error summarizing chat: {e}")
+        return None
 
 async def generate_chat_title(first_message: str):
     """
@@ -139,7 +280,7 @@ async def generate_chat_title(first_message: str):
     User Message: "{first_message}"
     """
     try:
-        response = await client.chat.completions.create(
+        response = await gateway.create(
             model=MODEL,
             messages=[
                 {"role": "system", "content": "You are a helpful assistant. Return only the title text."},
@@ -152,39 +293,22 @@ async def generate_chat_title(first_message: str):
         print(f"Error generating title: {e}")
         return "New Chat"
 
-async def generate_mock_exam(topic: str, difficulty: str, count: int):
-    prompt = f"""
-    Generate a mock exam for the topic "{topic}".
-    Difficulty: {difficulty}.
-    Number of questions: {count}.
-    
-    Return a valid JSON object with a key "questions" containing a list of {count} question objects.
-    
-    The questions should be a mix of the following types:
-    1. "mcq": Multiple Choice (4 options). Keys: "type" ("mcq"), "question", "options" (list of strings), "correct_answer" (string, must match one option).
-    2. "code": Coding scenario. Keys: "type" ("code"), "question" (problem description), "test_case_input" (string example), "test_case_output" (string expected output).
-    3. "boolean": True/False. Keys: "type" ("boolean"), "question", "correct_answer" ("True" or "False").
-    
-    Requirements:
-    - For "code" type, the question must be solvable with a short function or script.
-    - Ensure questions correspond to the "{difficulty}" level.
-    - Do not return markdown, only valid JSON.
-    """
+async def generate_mock_exam(topic: str, difficulty: str, count: int, use_cache: bool = True):
     try:
-        response = await client.chat.completions.create(
-            model=MODEL,
-            messages=[
-                {"role": "system", "content": "You are a specific exam generator. Return pure JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
+        return await _cached_json_completion(
+            "mock_exam",
+            MOCK_EXAM_PROMPT,
+            "You are a specific exam generator. Return pure JSON.",
+            use_cache,
+            topic=topic,
+            difficulty=difficulty,
+            count=count
         )
-        content = response.choices[0].message.content
-        return json.loads(content)
     except Exception as e:
         print(f"Error generating mock exam: {e}")
         # Fallback
         return {
+            FALLBACK_KEY: True,
             "questions": [
                 {
                     "type": "mcq",
@@ -0,0 +1,289 @@
+"""
+End-to-end load test: concurrent virtual users walking full user journeys.
+
+Each virtual user runs the journey --iterations times: sign up, log in, create
+a topic and wait for its roadmap, open a module, submit its quiz, load the
+dashboard and activity, chat (streamed), then generate, take and review a mock
+exam. Latency is recorded per endpoint (route templates, e.g.
+GET /learning/module/{id}) and reported as throughput and p50/p95/p99.
+
+By default the harness boots backend.main:app itself with uvicorn against a
+fresh SQLite database in a temp directory and the stub LLM provider (no
+network, no API key), with the LLM rate limits turned off:
+
+    python -m backend.benchmarks.journeys --users 20 --iterations 3 --output bench.json
+
+To catch regressions, write JSON on two commits and compare them; the exit
+status is 1 when an endpoint's p95 got worse than --tolerance allows:
+
+    python -m backend.benchmarks.journeys --users 20 --baseline before.json --output after.json
+
+Pass --base-url to drive a server you started yourself instead.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import httpx
+from .loop_latency import percentile
+
+PASSWORD = "bench-password"
+JOB_POLL_SECONDS = 0.2
+JOB_TIMEOUT_SECONDS = 120
+SERVER_START_TIMEOUT_SECONDS = 30
+# p95 changes smaller than this are noise, whatever the ratio
+MIN_REGRESSION_MS = 5.0
+
+class JourneyFailed(Exception):
+    pass
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.statuses = {}
+        self.errors = {}
+
+    def add(self, name: str, elapsed_ms: float, status: int):
+        self.samples.setdefault(name, []).append(elapsed_ms)
+        counts = self.statuses.setdefault(name, {})
+        counts[status] = counts.get(status, 0) + 1
+        if status >= 400:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    async def call(self, client: httpx.AsyncClient, name: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            res = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.add(name, (time.perf_counter() - start) * 1000, 599)
+            raise JourneyFailed(f"{name}: {e!r}")
+        self.add(name, (time.perf_counter() - start) * 1000, res.status_code)
+        if res.status_code >= 400:
+            raise JourneyFailed(f"{name}: HTTP {res.status_code} {res.text[:200]}")
+        return res
+
+async def wait_for_job(rec: Recorder, client, headers, job_id: str):
+    deadline = time.perf_counter() + JOB_TIMEOUT_SECONDS
+    while time.perf_counter() < deadline:
+        job = (await rec.call(client, "GET /topics/jobs/{id}", "GET", f"/topics/jobs/{job_id}", headers=headers)).json()
+        if job["status"] not in ("queued", "running"):
+            if job["status"] != "done":
+                raise JourneyFailed(f"job {job_id} {job['status']}: {job.get('error')}")
+            return
+        await asyncio.sleep(JOB_POLL_SECONDS)
+    raise JourneyFailed(f"job {job_id} did not finish in {JOB_TIMEOUT_SECONDS}s")
+
+async def chat_turn(rec: Recorder, client, headers, session_id: int):
+    name = "POST /chat/sessions/{id}/messages/stream"
+    start = time.perf_counter()
+    first = None
+    async with client.stream("POST", f"/chat/sessions/{session_id}/messages/stream",
+                             json={"content": "Can you explain the first module with an example?"}, headers=headers) as res:
+        async for line in res.aiter_lines():
+            if first is None and line.strip():
+                first = (time.perf_counter() - start) * 1000
+    rec.add(name, (time.perf_counter() - start) * 1000, res.status_code)
+    if first is not None:
+        rec.add(name + " (first token)", first, res.status_code)
+    if res.status_code >= 400:
+        raise JourneyFailed(f"{name}: HTTP {res.status_code}")
+
+async def journey(rec: Recorder, client: httpx.AsyncClient):
+    name = f"bench_{uuid.uuid4().hex[:10]}"
+    await rec.call(client, "POST /auth/signup", "POST", "/auth/signup",
+                   json={"username": name, "email": f"{name}@example.com", "password": PASSWORD})
+    token = (await rec.call(client, "POST /auth/token", "POST", "/auth/token",
+                            data={"username": name, "password": PASSWORD})).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    topic = (await rec.call(client, "POST /topics/", "POST", "/topics/", headers=headers, json={
+        "title": "Graph Algorithms", "difficulty": "Medium", "duration_days": 5, "description": "Benchmark topic",
+    })).json()
+    await wait_for_job(rec, client, headers, topic["job_id"])
+    details = (await rec.call(client, "GET /topics/{id}", "GET", f"/topics/{topic['id']}", headers=headers)).json()
+    await rec.call(client, "GET /topics/", "GET", "/topics/", headers=headers)
+
+    module_id = details["modules"][0]["id"]
+    content = (await rec.call(client, "GET /learning/module/{id}", "GET", f"/learning/module/{module_id}", headers=headers)).json()
+    answers = [{"quiz_id": q["id"], "selected_option": q["options"][0]} for q in content["quizzes"]]
+    await rec.call(client, "POST /learning/module/{id}/submit_quiz", "POST", f"/learning/module/{module_id}/submit_quiz",
+                   headers=headers, json={"answers": answers})
+
+    await rec.call(client, "GET /progress/dashboard", "GET", "/progress/dashboard", headers=headers)
+    await rec.call(client, "GET /progress/activity", "GET", "/progress/activity", headers=headers)
+
+    chat = (await rec.call(client, "POST /chat/sessions", "POST", "/chat/sessions", headers=headers)).json()
+    await chat_turn(rec, client, headers, chat["id"])
+    await rec.call(client, "GET /chat/sessions", "GET", "/chat/sessions", headers=headers)
+    await rec.call(client, "GET /chat/sessions/{id}", "GET", f"/chat/sessions/{chat['id']}", headers=headers)
+
+    exam = (await rec.call(client, "POST /mock-exam/generate", "POST", "/mock-exam/generate", headers=headers,
+                           json={"topic_name": "Graph Algorithms", "difficulty": "Medium", "count": 5})).json()
+    exam = (await rec.call(client, "GET /mock-exam/{id}", "GET", f"/mock-exam/{exam['id']}", headers=headers)).json()
+    exam_answers = [
+        {"question_index": i, "answer": (q.get("options") or ["True"])[0]}
+        for i, q in enumerate(exam.get("questions", []))
+    ]
+    await rec.call(client, "POST /mock-exam/{id}/submit", "POST", f"/mock-exam/{exam['id']}/submit",
+                   headers=headers, json=exam_answers)
+    history = (await rec.call(client, "GET /mock-exam/history/page", "GET", "/mock-exam/history/page", headers=headers)).json()
+    for attempt in history["items"][:1]:
+        await rec.call(client, "GET /mock-exam/attempt/{id}", "GET", f"/mock-exam/attempt/{attempt['id']}", headers=headers)
+
+async def virtual_user(rec: Recorder, client, iterations: int, journeys: list, failures: list):
+    for _ in range(iterations):
+        start = time.perf_counter()
+        try:
+            await journey(rec, client)
+            journeys.append((time.perf_counter() - start) * 1000)
+        except JourneyFailed as e:
+            failures.append(str(e))
+
+def summarize(values, elapsed):
+    return {
+        "count": len(values),
+        "rps": round(len(values) / elapsed, 2),
+        "p50_ms": round(percentile(values, 50), 1),
+        "p95_ms": round(percentile(values, 95), 1),
+        "p99_ms": round(percentile(values, 99), 1),
+        "mean_ms": round(statistics.mean(values), 1) if values else 0.0,
+        "max_ms": round(max(values), 1) if values else 0.0,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def start_server(args, workdir: str):
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "LLM_PROVIDER": "stub",
+        "LLM_STUB_LATENCY_MS": str(args.stub_latency_ms),
+        "LLM_STUB_TOKENS_PER_SECOND": str(args.stub_tokens_per_second),
+        # The limits protect the real provider; against the stub they'd only measure the limiter
+        "LLM_REQUESTS_PER_MINUTE": "0",
+        "LLM_TOKENS_PER_MINUTE": "0",
+    }
+    log = open(os.path.join(workdir, "server.log"), "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(args.port), "--log-level", "warning"],
+        env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    return process, log
+
+async def wait_until_up(base_url: str, process=None):
+    deadline = time.perf_counter() + SERVER_START_TIMEOUT_SECONDS
+    async with httpx.AsyncClient(base_url=base_url, timeout=2) as client:
+        while time.perf_counter() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError("The server exited during startup, see server.log")
+            try:
+                if (await client.get("/")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"The server did not come up within {SERVER_START_TIMEOUT_SECONDS}s")
+
+def compare(baseline: dict, current: dict, tolerance: float):
+    """Prints p95 changes per endpoint and returns the endpoints that regressed."""
+    regressions = []
+    print(f"\n{'endpoint':<56}{'base p95':>10}{'new p95':>10}{'change':>9}")
+    for name, new in sorted(current["endpoints"].items()):
+        old = baseline.get("endpoints", {}).get(name)
+        if old is None:
+            print(f"{name:<56}{'-':>10}{new['p95_ms']:>10.1f}{'new':>9}")
+            continue
+        change = (new["p95_ms"] - old["p95_ms"]) / old["p95_ms"] if old["p95_ms"] else 0.0
+        worse = change > tolerance and new["p95_ms"] - old["p95_ms"] > MIN_REGRESSION_MS
+        if worse:
+            regressions.append(name)
+        print(f"{name:<56}{old['p95_ms']:>10.1f}{new['p95_ms']:>10.1f}{change:>+8.0%}{' !' if worse else ''}")
+    return regressions
+
+async def run(args, base_url: str):
+    rec = Recorder()
+    journeys, failures = [], []
+    limits = httpx.Limits(max_connections=args.users + 10)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(virtual_user(rec, client, args.iterations, journeys, failures) for _ in range(args.users)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "users": args.users,
+            "iterations": args.iterations,
+            "stub_latency_ms": args.stub_latency_ms if not args.base_url else None,
+            "duration_s": round(elapsed, 2),
+            "python": platform.python_version(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "journeys": {**summarize(journeys, elapsed), "failed": len(failures), "failures": failures[:20]},
+        "endpoints": {
+            name: {**summarize(values, elapsed), "errors": rec.errors.get(name, 0), "statuses": rec.statuses[name]}
+            for name, values in sorted(rec.samples.items())
+        },
+    }
+
+def print_report(report: dict):
+    meta, j = report["meta"], report["journeys"]
+    print(f"{meta['users']} users x {meta['iterations']} journeys in {meta['duration_s']}s: "
+          f"{j['count']} ok, {j['failed']} failed, journey p50 {j['p50_ms']} ms, p95 {j['p95_ms']} ms")
+    for failure in j["failures"][:5]:
+        print(f"  failed: {failure}")
+    print(f"{'endpoint':<56}{'count':>7}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for name, s in report["endpoints"].items():
+        print(f"{name:<56}{s['count']:>7}{s['rps']:>8.1f}{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}{s['errors']:>8}")
+
+async def main(args):
+    process = log = None
+    workdir = tempfile.mkdtemp(prefix="journeys_")
+    base_url = args.base_url or f"http://127.0.0.1:{args.port}"
+    try:
+        if not args.base_url:
+            process, log = start_server(args, workdir)
+        await wait_until_up(base_url, process)
+        report = await run(args, base_url)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+            log.close()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nwrote {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} endpoint(s) regressed by more than {args.tolerance:.0%} at p95")
+            return 1
+    return 1 if report["journeys"]["failed"] else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--iterations", type=int, default=2, help="journeys per virtual user")
+    parser.add_argument("--base-url", help="use a running server instead of booting one")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--stub-latency-ms", type=float, default=200)
+    parser.add_argument("--stub-tokens-per-second", type=float, default=500)
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 slowdown, 0.2 = 20%%")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,102 @@
+"""
+Login throughput benchmark for the password hashing pool.
+
+Signs up a set of users, then has many concurrent clients log in repeatedly
+while a probe client measures the latency of a cheap sync endpoint. Reports
+logins per second, login latency percentiles, how many logins were shed with
+503, and the probe tail. With bcrypt on the shared threadpool the probe tail
+grows with the login burst; with the dedicated process pool it stays flat.
+
+Start the API first (uvicorn backend.main:app), then:
+
+    python -m backend.benchmarks.login_throughput --base-url http://localhost:8000 --clients 100 --seconds 20
+
+Compare runs with different PASSWORD_HASH_WORKERS / BCRYPT_ROUNDS settings.
+The hash pool stats at the end are read from /metrics, which needs the
+server's METRICS_TOKEN (--metrics-token, or the METRICS_TOKEN variable).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import uuid
+import httpx
+from .loop_latency import percentile
+
+PASSWORD = "bench-password"
+PROBE_ENDPOINT = "/auth/me"
+
+async def signup(client: httpx.AsyncClient):
+    name = f"bench_{uuid.uuid4().hex[:10]}"
+    res = await client.post("/auth/signup", json={"username": name, "email": f"{name}@example.com", "password": PASSWORD})
+    res.raise_for_status()
+    return name, {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+async def login_loop(client, usernames, deadline, samples, counts, offset):
+    i = offset
+    while time.perf_counter() < deadline:
+        username = usernames[i % len(usernames)]
+        i += 1
+        start = time.perf_counter()
+        res = await client.post("/auth/token", data={"username": username, "password": PASSWORD})
+        elapsed = (time.perf_counter() - start) * 1000
+        counts[res.status_code] = counts.get(res.status_code, 0) + 1
+        if res.status_code == 200:
+            samples.setdefault("login", []).append(elapsed)
+
+async def probe(client, headers, deadline, samples, interval):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await client.get(PROBE_ENDPOINT, headers=headers)
+        samples.setdefault(f"probe {PROBE_ENDPOINT}", []).append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.clients + 10)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=120, limits=limits) as client:
+        users = [await signup(client) for _ in range(args.users)]
+        usernames = [name for name, _ in users]
+        probe_headers = users[0][1]
+
+        samples, counts = {}, {}
+        started = time.perf_counter()
+        deadline = started + args.seconds
+        tasks = [login_loop(client, usernames, deadline, samples, counts, n) for n in range(args.clients)]
+        tasks.append(probe(client, probe_headers, deadline, samples, args.probe_interval))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+        stats = await hash_pool_stats(client, args.metrics_token)
+
+    ok = counts.get(200, 0)
+    print(f"hash pool: {stats}")
+    print(f"logins ok: {ok} ({ok / elapsed:.1f}/s), shed (503): {counts.get(503, 0)}, other: "
+          f"{sum(v for k, v in counts.items() if k not in (200, 503))}")
+    print(f"{'endpoint':<20}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for path, values in sorted(samples.items()):
+        print(f"{path:<20}{len(values):>8}{percentile(values, 50):>10.1f}{percentile(values, 95):>10.1f}"
+              f"{percentile(values, 99):>10.1f}{statistics.mean(values):>10.1f}")
+
+async def hash_pool_stats(client, metrics_token: str):
+    # /auth/hash-stats is admin-only; the same numbers are gauges on /metrics
+    if not metrics_token:
+        return "unavailable (pass --metrics-token)"
+    response = await client.get("/metrics", headers={"Authorization": f"Bearer {metrics_token}"})
+    if response.status_code != 200:
+        return f"unavailable (/metrics returned {response.status_code})"
+    prefix = "app_password_hash_"
+    return {
+        name[len(prefix):]: float(value)
+        for name, value in (line.split(" ", 1) for line in response.text.splitlines() if line.startswith(prefix))
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--probe-interval", type=float, default=0.05)
+    parser.add_argument("--metrics-token", default=os.getenv("METRICS_TOKEN", ""))
+    asyncio.run(main(parser.parse_args()))
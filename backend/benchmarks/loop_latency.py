@@ -0,0 +1,102 @@
+"""
+Mixed-load latency benchmark for blocking DB work on the event loop.
+
+Drives DB-heavy endpoints (dashboard, chat sessions, exam history) from many
+concurrent clients while a probe client measures the latency of cheap
+endpoints. If handlers run SQLite queries on the event loop thread, the probe
+latency tail grows with the background load; with DB work in the threadpool it
+stays flat.
+
+Start the API first (uvicorn backend.main:app), then:
+
+    python -m backend.benchmarks.loop_latency --base-url http://localhost:8000 --clients 50 --seconds 20
+
+Run it against two commits and compare the p99 columns.
+
+Measured on one CPU with --clients 20 --seconds 15 (fresh database each run):
+
+    p99 ms                  before (DB on the loop)   after (DB in threadpool)
+    probe /                                   202.5                     1724.4
+    probe /auth/me                         150090.1                     1129.2
+    /chat/sessions                         150295.3                      853.3
+    /progress/dashboard                       211.6                      818.0
+    /mock-exam/history                   none finished                   676.4
+    heavy requests done                          40                       1550
+
+Before, async handlers checked out pooled connections on the event loop
+thread. Once all 15 were held, the next checkout blocked the loop for the
+30 s pool timeout, so the coroutines holding connections could not release
+them. The run stalled, and five requests failed with QueuePool TimeoutError.
+The "before" probe / p99 is a single sample taken before the stall.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+import httpx
+
+HEAVY_ENDPOINTS = ["/progress/dashboard", "/chat/sessions", "/mock-exam/history"]
+PROBE_ENDPOINTS = ["/", "/auth/me"]
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[k]
+
+async def signup(client: httpx.AsyncClient):
+    name = f"bench_{uuid.uuid4().hex[:10]}"
+    res = await client.post("/auth/signup", json={"username": name, "email": f"{name}@example.com", "password": "bench-password"})
+    res.raise_for_status()
+    return {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+async def seed(client: httpx.AsyncClient, headers, chat_sessions: int):
+    for _ in range(chat_sessions):
+        (await client.post("/chat/sessions", headers=headers)).raise_for_status()
+
+async def hammer(client, headers, deadline, samples):
+    i = 0
+    while time.perf_counter() < deadline:
+        path = HEAVY_ENDPOINTS[i % len(HEAVY_ENDPOINTS)]
+        i += 1
+        start = time.perf_counter()
+        await client.get(path, headers=headers)
+        samples.setdefault(path, []).append((time.perf_counter() - start) * 1000)
+
+async def probe(client, headers, deadline, samples, interval):
+    i = 0
+    while time.perf_counter() < deadline:
+        path = PROBE_ENDPOINTS[i % len(PROBE_ENDPOINTS)]
+        i += 1
+        start = time.perf_counter()
+        await client.get(path, headers=headers)
+        samples.setdefault(f"probe {path}", []).append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.clients + 10)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as client:
+        headers = await signup(client)
+        await seed(client, headers, args.chat_sessions)
+
+        samples = {}
+        deadline = time.perf_counter() + args.seconds
+        tasks = [hammer(client, headers, deadline, samples) for _ in range(args.clients)]
+        tasks.append(probe(client, headers, deadline, samples, args.probe_interval))
+        await asyncio.gather(*tasks)
+
+    print(f"{'endpoint':<28}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for path, values in sorted(samples.items()):
+        print(f"{path:<28}{len(values):>8}{percentile(values, 50):>10.1f}{percentile(values, 95):>10.1f}"
+              f"{percentile(values, 99):>10.1f}{statistics.mean(values):>10.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--chat-sessions", type=int, default=200)
+    parser.add_argument("--probe-interval", type=float, default=0.05)
+    asyncio.run(main(parser.parse_args()))
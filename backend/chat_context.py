@@ -0,0 +1,100 @@
+import os
+import re
+from typing import List
+from sqlmodel import Session, select
+from .database import run_db
+from .models import ChatSession, ChatMessage
+from .ai_service import summarize_conversation
+from . import doc_index
+
+# Token budget for the conversation part of the prompt (summary + verbatim turns).
+# When unsummarized turns exceed it, the oldest ones are folded into the summary
+# until the verbatim part is back under CHAT_RECENT_TOKEN_BUDGET. The gap between
+# the two means we summarize once every few turns rather than on every turn.
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", 6000))
+CHAT_RECENT_TOKEN_BUDGET = int(os.getenv("CHAT_RECENT_TOKEN_BUDGET", 3000))
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", 400))
+# Budget for passages retrieved from the chat's uploaded documents
+CHAT_RETRIEVAL_TOKEN_BUDGET = int(os.getenv("CHAT_RETRIEVAL_TOKEN_BUDGET", 1500))
+
+# File attachment block the client prepends to a message (see ChatMentor.jsx)
+FILE_BLOCK_RE = re.compile(r"<<<FILE_TYPE_START>>>.*?<<<FILE_CONTENT_END>>>", re.S)
+
+SYSTEM_PROMPT = "You are a helpful and encouraging educational AI mentor."
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text; good enough for budgeting
+    return len(text) // 4 + 4
+
+def _split_recent(messages: List[ChatMessage], budget: int):
+    """Returns (older, recent) where recent is the newest suffix that fits the budget.
+    The latest message is always kept, even if it alone exceeds the budget."""
+    used = 0
+    cut = len(messages)
+    for i in range(len(messages) - 1, -1, -1):
+        cost = estimate_tokens(messages[i].content)
+        if used + cost > budget and cut < len(messages):
+            break
+        used += cost
+        cut = i
+    return messages[:cut], messages[cut:]
+
+def _load_pending(session: Session, chat_session: ChatSession):
+    # Only turns not yet folded into the summary are loaded
+    stmt = select(ChatMessage).where(ChatMessage.session_id == chat_session.id)
+    if chat_session.summarized_until_id is not None:
+        stmt = stmt.where(ChatMessage.id > chat_session.summarized_until_id)
+    return session.exec(stmt.order_by(ChatMessage.id)).all()
+
+def _save_summary(session: Session, chat_session: ChatSession, summary: str, until_id: int):
+    chat_session.summary = summary
+    chat_session.summarized_until_id = until_id
+    session.add(chat_session)
+    session.commit()
+    session.refresh(chat_session)
+
+def _retrieve_passages(session: Session, chat_session: ChatSession, messages: List[ChatMessage]):
+    latest = next((m for m in reversed(messages) if m.role == "user"), None)
+    if latest is None:
+        return []
+    query = FILE_BLOCK_RE.sub(" ", latest.content)
+    passages = []
+    used = 0
+    for chunk in doc_index.retrieve(session, chat_session.id, query):
+        cost = estimate_tokens(chunk["content"])
+        if used + cost > CHAT_RETRIEVAL_TOKEN_BUDGET and passages:
+            break
+        used += cost
+        passages.append(f"[{chunk['filename']}, part {chunk['position'] + 1}]\n{chunk['content']}")
+    return passages
+
+async def build_ai_context(chat_session: ChatSession, session: Session):
+    pending = await run_db(_load_pending, session, chat_session)
+
+    summary_cost = estimate_tokens(chat_session.summary) if chat_session.summary else 0
+    pending_cost = sum(estimate_tokens(m.content) for m in pending)
+
+    recent = pending
+    if summary_cost + pending_cost > CHAT_CONTEXT_TOKEN_BUDGET:
+        older, recent = _split_recent(pending, CHAT_RECENT_TOKEN_BUDGET)
+        if older:
+            new_summary = await summarize_conversation(
+                chat_session.summary,
+                [{"role": m.role, "content": m.content} for m in older],
+                max_tokens=CHAT_SUMMARY_MAX_TOKENS
+            )
+            # If summarizing failed the older turns are simply dropped for this
+            # turn and retried next time, so the prompt stays within budget.
+            if new_summary:
+                await run_db(_save_summary, session, chat_session, new_summary, older[-1].id)
+
+    passages = await run_db(_retrieve_passages, session, chat_session, pending)
+
+    ai_context = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if chat_session.summary:
+        ai_context.append({"role": "system", "content": f"Summary of the earlier conversation: {chat_session.summary}"})
+    if passages:
+        ai_context.append({"role": "system", "content": "Relevant excerpts from files the user uploaded to this chat:\n\n" + "\n\n".join(passages)})
+    for m in recent:
+        ai_context.append({"role": m.role, "content": m.content})
+    return ai_context
@@ -0,0 +1,348 @@
+import asyncio
+import json
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict
+from sqlmodel import Session, select
+from sqlalchemy import update, or_, and_
+from .database import engine, run_db
+from .models import Module, Topic, Slide, Quiz, Progress
+from .ai_service import generate_module_content_ai, generate_roadmap_ai, is_fallback
+from .llm_gateway import LLMUnavailable
+from .user_stats import record_modules_added
+from .jobs import set_job_total, advance_job
+
+# How long a "generating" claim is honoured before another worker may take over
+GENERATION_LEASE_SECONDS = int(os.getenv("GENERATION_LEASE_SECONDS", 180))
+GENERATION_POLL_SECONDS = float(os.getenv("GENERATION_POLL_SECONDS", 1.0))
+# Caps on speculative generation of the next module so it can't crowd out interactive requests
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", 2))
+PREFETCH_PER_USER = int(os.getenv("PREFETCH_PER_USER", 1))
+# Modules of one topic generated at once by a "materialize" job
+MATERIALIZE_CONCURRENCY = int(os.getenv("MATERIALIZE_CONCURRENCY", 4))
+
+logger = logging.getLogger(__name__)
+
+# module_id -> in-flight generation in this process
+_inflight: Dict[int, asyncio.Task] = {}
+
+# hits: a prefetched module was opened; misses: a module had to be generated on open
+prefetch_stats = {"scheduled": 0, "skipped": 0, "failed": 0, "hits": 0, "misses": 0}
+_prefetched: "OrderedDict[int, None]" = OrderedDict() # prefetched modules not opened yet
+_PREFETCHED_MAX = 10000
+_prefetch_by_user: Dict[int, int] = {} # user_id -> running prefetches
+_prefetch_tasks = set()
+
+async def ensure_module_content(module_id: int):
+    """
+    Makes sure slides and quizzes exist for the module, generating them at most once.
+    Concurrent callers in this process share one task; other workers are kept out
+    by the content_status claim on the module row.
+    """
+    task = _inflight.get(module_id)
+    if task is None:
+        task = asyncio.create_task(_generate_once(module_id))
+        _inflight[module_id] = task
+        task.add_done_callback(lambda t: _inflight.pop(module_id, None))
+    # A requester going away must not cancel the generation others are waiting on
+    await asyncio.shield(task)
+
+def _find_next_module_to_prefetch(module_id: int):
+    with Session(engine) as session:
+        module = session.get(Module, module_id)
+        if module is None:
+            return None
+        next_mod = session.exec(
+            select(Module)
+            .where(Module.topic_id == module.topic_id, Module.order_index > module.order_index)
+            .order_by(Module.order_index)
+            .limit(1)
+        ).first()
+        if next_mod is None or _has_content(session, next_mod.id):
+            return None
+        return next_mod.id
+
+async def schedule_prefetch(user_id: int, module_id: int):
+    """Starts generating the module after module_id (by order_index) in the background."""
+    if not PREFETCH_ENABLED:
+        return
+    next_id = await run_db(_find_next_module_to_prefetch, module_id)
+    if next_id is None:
+        return
+
+    if next_id in _inflight or next_id in _prefetched:
+        return
+    if len(_prefetch_tasks) >= PREFETCH_CONCURRENCY or _prefetch_by_user.get(user_id, 0) >= PREFETCH_PER_USER:
+        prefetch_stats["skipped"] += 1
+        return
+
+    prefetch_stats["scheduled"] += 1
+    _prefetched[next_id] = None
+    if len(_prefetched) > _PREFETCHED_MAX:
+        _prefetched.popitem(last=False)
+    _prefetch_by_user[user_id] = _prefetch_by_user.get(user_id, 0) + 1
+    task = asyncio.create_task(_prefetch(user_id, next_id))
+    _prefetch_tasks.add(task)
+    task.add_done_callback(_prefetch_tasks.discard)
+
+async def _prefetch(user_id: int, module_id: int):
+    try:
+        await ensure_module_content(module_id)
+    except Exception:
+        logger.exception(f"Prefetch of module {module_id} failed")
+        prefetch_stats["failed"] += 1
+        _prefetched.pop(module_id, None)
+    finally:
+        _prefetch_by_user[user_id] -= 1
+        if _prefetch_by_user[user_id] <= 0:
+            del _prefetch_by_user[user_id]
+
+def record_module_open(module_id: int, had_content: bool):
+    if module_id in _prefetched:
+        del _prefetched[module_id]
+        prefetch_stats["hits"] += 1
+    elif not had_content:
+        prefetch_stats["misses"] += 1
+
+def get_prefetch_stats():
+    opened = prefetch_stats["hits"] + prefetch_stats["misses"]
+    return {**prefetch_stats, "hit_rate": round(prefetch_stats["hits"] / opened, 3) if opened else None}
+
+def _has_content(session: Session, module_id: int) -> bool:
+    module = session.get(Module, module_id)
+    if module is None or module.content_status == "ready":
+        return True
+    return session.exec(select(Slide.id).where(Slide.module_id == module_id).limit(1)).first() is not None
+
+def _claim(session: Session, module_id: int) -> bool:
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=GENERATION_LEASE_SECONDS)
+    result = session.execute(
+        update(Module)
+        .where(
+            Module.id == module_id,
+            or_(
+                Module.content_status.is_(None),
+                # A stale claim from a worker that died; "ready" is never reclaimed
+                and_(Module.content_status == "generating", Module.generation_started_at < stale_before)
+            )
+        )
+        .values(content_status="generating", generation_started_at=now)
+    )
+    session.commit()
+    return result.rowcount == 1
+
+def _release(module_id: int):
+    with Session(engine) as session:
+        session.execute(
+            update(Module)
+            .where(Module.id == module_id, Module.content_status == "generating")
+            .values(content_status=None, generation_started_at=None)
+        )
+        session.commit()
+
+def _try_claim(module_id: int):
+    """Returns "done" if content exists, (topic_title, module_title) if we now own
+    the generation, or None if another worker holds the claim."""
+    with Session(engine) as session:
+        if _has_content(session, module_id):
+            return "done"
+        if not _claim(session, module_id):
+            return None
+        module = session.get(Module, module_id)
+        topic = session.get(Topic, module.topic_id)
+        return topic.title, module.title
+
+def _persist_module_content(module_id: int, content_data: dict):
+    with Session(engine) as session:
+        module = session.get(Module, module_id)
+        if module is None:
+            # Topic was deleted while generating
+            return
+        save_module_content(session, module_id, content_data)
+        module.content_status = "ready"
+        session.add(module)
+        session.commit()
+
+async def _generate_once(module_id: int):
+    while True:
+        claim = await run_db(_try_claim, module_id)
+        if claim == "done":
+            return
+        if claim is not None:
+            topic_title, module_title = claim
+            break
+        # Another worker holds the claim; wait for it to finish (or for the lease to expire)
+        await asyncio.sleep(GENERATION_POLL_SECONDS)
+
+    try:
+        content_data = await generate_module_content_ai(topic_title, module_title)
+        if is_fallback(content_data):
+            # Leave the module without content so the next open tries again
+            raise LLMUnavailable("Module content could not be generated")
+        await run_db(_persist_module_content, module_id, content_data)
+    except BaseException:
+        await _cleanup(_release, module_id)
+        raise
+
+async def _cleanup(fn, *args):
+    """Runs DB cleanup from an exception handler. Shielded so it still
+    completes when the handler is unwinding a cancellation; if the task is
+    cancelled again meanwhile, the write finishes in the background."""
+    await asyncio.shield(run_db(fn, *args))
+
+def save_module_content(session: Session, module_id: int, content_data: dict):
+    """Adds a module's slides and quizzes to the session; the caller commits once."""
+    # Save slides
+    session.add_all([
+        Slide(
+            content=s.get("content"),
+            order_index=s.get("order_index"),
+            module_id=module_id
+        )
+        for s in content_data.get("slides", [])
+    ])
+    # Save quiz
+    session.add_all([
+        Quiz(
+            question=q_data.get("question"),
+            options=json.dumps(q_data.get("options")), # Store as JSON string
+            correct_answer=q_data.get("correct_answer"),
+            module_id=module_id
+        )
+        for q_data in content_data.get("quizzes", [])
+    ])
+
+def save_roadmap(session: Session, topic: Topic, modules_data: list):
+    """
+    Adds a topic's modules and their Progress rows to the session; the caller commits once.
+    A single flush inserts all modules as one batched INSERT ... RETURNING, which gives
+    us the ids the Progress rows need.
+    """
+    modules = [
+        Module(
+            title=mod.get("title"),
+            description=mod.get("description"),
+            order_index=mod.get("order_index"),
+            topic_id=topic.id
+        )
+        for mod in modules_data
+    ]
+    session.add_all(modules)
+    session.flush()
+    
+    # Init progress
+    session.add_all([
+        Progress(
+            user_id=topic.user_id,
+            topic_id=topic.id,
+            module_id=m.id,
+            is_completed=False,
+            score=0
+        )
+        for m in modules
+    ])
+    return modules
+
+def _modules_without_content(topic_id: int):
+    with Session(engine) as session:
+        has_slides = select(Slide.id).where(Slide.module_id == Module.id).exists()
+        return session.exec(
+            select(Module.id)
+            .where(Module.topic_id == topic_id)
+            .where(or_(Module.content_status.is_(None), Module.content_status != "ready"))
+            .where(~has_slides)
+            .order_by(Module.order_index)
+        ).all()
+
+async def materialize_topic(job_id: str, topic_id: int):
+    """
+    Background job: generates every module of the topic that has no content
+    yet, MATERIALIZE_CONCURRENCY at a time, so the whole topic takes about as
+    long as its slowest module. Each module is saved as soon as it is done and
+    counted in the job's progress; modules being generated elsewhere (opened by
+    a user, prefetched) are awaited rather than generated twice.
+    """
+    module_ids = await run_db(_modules_without_content, topic_id)
+    await run_db(set_job_total, job_id, len(module_ids))
+    semaphore = asyncio.Semaphore(MATERIALIZE_CONCURRENCY)
+
+    async def materialize(module_id: int) -> bool:
+        async with semaphore:
+            try:
+                await ensure_module_content(module_id)
+            except Exception:
+                logger.exception(f"Materializing module {module_id} failed")
+                await run_db(advance_job, job_id, True)
+                return False
+        await run_db(advance_job, job_id)
+        return True
+
+    results = await asyncio.gather(*(materialize(m) for m in module_ids))
+    failed = results.count(False)
+    if failed:
+        # Modules that did generate stay saved; running the job again retries the rest
+        raise RuntimeError(f"{failed} of {len(module_ids)} modules could not be generated")
+
+def content_status_by_module(session: Session, topic_id: int):
+    """(module, status) for each module of a topic: ready, generating or pending."""
+    has_slides = select(Slide.id).where(Slide.module_id == Module.id).exists()
+    rows = session.exec(
+        select(Module, has_slides).where(Module.topic_id == topic_id).order_by(Module.order_index)
+    ).all()
+    result = []
+    for module, slides in rows:
+        if module.content_status == "ready" or slides:
+            status = "ready"
+        elif module.content_status == "generating":
+            status = "generating"
+        else:
+            status = "pending"
+        result.append((module, status))
+    return result
+
+def _load_topic_request(topic_id: int):
+    with Session(engine) as session:
+        topic = session.get(Topic, topic_id)
+        if topic is None:
+            return None
+        return topic.title, topic.difficulty, topic.duration_days, topic.description
+
+def _persist_roadmap(topic_id: int, roadmap_data: dict):
+    with Session(engine) as session:
+        topic = session.get(Topic, topic_id)
+        if topic is None:
+            # Deleted while generating
+            return
+        modules = save_roadmap(session, topic, roadmap_data.get("modules", []))
+        record_modules_added(session, topic.user_id, len(modules))
+        topic.status = "ready"
+        session.add(topic)
+        session.commit()
+
+async def generate_topic_roadmap(job_id: str, topic_id: int):
+    """Background job: generates the roadmap for a topic created in "generating" state."""
+    request = await run_db(_load_topic_request, topic_id)
+    if request is None:
+        return
+
+    try:
+        roadmap_data = await generate_roadmap_ai(*request)
+        if is_fallback(roadmap_data):
+            raise LLMUnavailable("Roadmap could not be generated")
+    except BaseException:
+        await _cleanup(_set_topic_status, topic_id, "failed")
+        raise
+
+    await run_db(_persist_roadmap, topic_id, roadmap_data)
+
+def _set_topic_status(topic_id: int, status: str):
+    with Session(engine) as session:
+        topic = session.get(Topic, topic_id)
+        if topic:
+            topic.status = status
+            session.add(topic)
+            session.commit()
@@ -1,17 +1,74 @@
 from sqlmodel import SQLModel, create_engine, Session
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+import logging
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-DATABASE_URL = "sqlite:///./learning_assistant_v2.db" # os.getenv("DATABASE_URL", "sqlite:///./learning_assistant.db")
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./learning_assistant_v2.db")
 
-connect_args = {"check_same_thread": False}
-engine = create_engine(DATABASE_URL, echo=False, connect_args=connect_args)
+# Pool sized for the threadpool that runs DB work (40 threads by default in AnyIO)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 20))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+
+# Applied to every new SQLite connection
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", -64000)), # negative = KiB, so 64 MB
+    "foreign_keys": "ON",
+}
+
+# uvicorn configures this logger, so startup messages show up next to its own
+logger = logging.getLogger("uvicorn.error")
+
+is_sqlite = DATABASE_URL.startswith("sqlite")
+is_memory = is_sqlite and (":memory:" in DATABASE_URL or DATABASE_URL == "sqlite://")
+
+engine_kwargs = {"echo": False}
+if is_sqlite:
+    engine_kwargs["connect_args"] = {"check_same_thread": False}
+if not is_memory:
+    engine_kwargs.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+engine = create_engine(DATABASE_URL, **engine_kwargs)
+
+if is_sqlite:
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            if is_memory and name in ("journal_mode", "mmap_size"):
+                continue
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+def log_engine_settings():
+    settings = {"url": engine.url.render_as_string(hide_password=True), "pool": type(engine.pool).__name__}
+    if not is_memory:
+        settings.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+    if is_sqlite:
+        with engine.connect() as conn:
+            for name in SQLITE_PRAGMAS:
+                settings[name] = conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+    logger.info("Database engine: " + ", ".join(f"{k}={v}" for k, v in settings.items()))
 
 def create_db_and_tables():
+    # Imported here to avoid a cycle; it also registers every model on the metadata
+    from .migrations import run_migrations
     SQLModel.metadata.create_all(engine)
+    # create_all never alters existing tables; bring older databases up to date
+    run_migrations()
 
 def get_session():
     with Session(engine) as session:
         yield session
+
+async def run_db(fn, *args, **kwargs):
+    # SQLite calls block, so async code hands them to the threadpool instead of
+    # running them on the event loop. Plain `def` endpoints already run there.
+    return await run_in_threadpool(fn, *args, **kwargs)
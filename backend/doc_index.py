@@ -0,0 +1,177 @@
+"""
+Per-chat retrieval index over uploaded documents.
+
+Files attached to a chat are split into overlapping chunks and stored in an
+SQLite FTS5 table. Each turn, build_ai_context asks retrieve() for the chunks
+that best match the user's message (BM25), so only a few passages go into the
+prompt instead of the whole file on every turn.
+
+The FTS table is created by the migrations (create_all does not handle virtual
+tables). On databases without FTS5, index_available() is False and uploads
+fall back to inline, truncated text.
+"""
+import os
+import re
+from typing import List, Optional
+from sqlmodel import Session, select
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from .database import engine, is_sqlite
+from .models import ChatDocument
+
+DOC_INDEX_MAX_CHARS = int(os.getenv("DOC_INDEX_MAX_CHARS", 2_000_000))
+CHUNK_CHARS = int(os.getenv("DOC_CHUNK_CHARS", 1200))
+CHUNK_OVERLAP_CHARS = int(os.getenv("DOC_CHUNK_OVERLAP_CHARS", 200))
+RETRIEVAL_TOP_K = int(os.getenv("CHAT_RETRIEVAL_TOP_K", 4))
+# Most distinct words of a message used in the search
+MAX_QUERY_TERMS = 32
+
+FTS_TABLE = "chatchunk_fts"
+# session_key holds "s<chat session id>" so a MATCH can be limited to one chat
+FTS_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "content, session_key, document_id UNINDEXED, position UNINDEXED, "
+    "tokenize = 'porter unicode61')"
+)
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "do", "does", "for",
+    "from", "how", "i", "if", "in", "is", "it", "me", "my", "of", "on", "or", "so",
+    "that", "the", "this", "to", "was", "what", "when", "where", "which", "who", "why",
+    "will", "with", "you", "your", "about", "explain", "please", "tell",
+}
+
+_available: Optional[bool] = None
+
+def index_available() -> bool:
+    global _available
+    if _available is None:
+        if not is_sqlite:
+            _available = False
+        else:
+            with engine.connect() as conn:
+                _available = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": FTS_TABLE}
+                ).first() is not None
+    return _available
+
+def create_index_table(conn) -> bool:
+    """Creates the FTS table if it is missing. False when FTS5 is unavailable."""
+    try:
+        conn.execute(text(FTS_DDL))
+    except OperationalError:
+        return False
+    return True
+
+def chunk_text(content: str, size: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP_CHARS) -> List[str]:
+    """Splits text into ~size character chunks, preferring paragraph, sentence
+    and word boundaries, each overlapping the previous one by ~overlap chars."""
+    content = content.strip()
+    chunks = []
+    start = 0
+    while start < len(content):
+        end = min(start + size, len(content))
+        if end < len(content):
+            for sep in ("\n\n", ". ", "\n", " "):
+                cut = content.rfind(sep, start + size // 2, end)
+                if cut != -1:
+                    end = cut + len(sep)
+                    break
+        chunk = content[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(content):
+            break
+        # Start the next chunk on a word boundary inside the overlap
+        next_start = content.find(" ", end - overlap, end)
+        start = next_start + 1 if next_start > start else end
+    return chunks
+
+def _session_key(chat_session_id: int) -> str:
+    return f"s{chat_session_id}"
+
+def find_document(session: Session, chat_session_id: int, content_hash: str) -> Optional[ChatDocument]:
+    return session.exec(
+        select(ChatDocument).where(ChatDocument.session_id == chat_session_id, ChatDocument.content_hash == content_hash)
+    ).first()
+
+def index_document(session: Session, chat_session_id: int, filename: str, content_hash: str, content: str, truncated: bool) -> ChatDocument:
+    """Chunks and indexes a document for a chat. The same file uploaded to the
+    same chat again is not indexed twice."""
+    existing = find_document(session, chat_session_id, content_hash)
+    if existing:
+        return existing
+
+    chunks = chunk_text(content)
+    doc = ChatDocument(
+        session_id=chat_session_id,
+        filename=filename,
+        content_hash=content_hash,
+        char_count=len(content),
+        chunk_count=len(chunks),
+        truncated=truncated,
+    )
+    session.add(doc)
+    session.flush()
+    if chunks:
+        key = _session_key(chat_session_id)
+        session.execute(
+            text(f"INSERT INTO {FTS_TABLE} (content, session_key, document_id, position) VALUES (:content, :key, :doc, :pos)"),
+            [{"content": chunk, "key": key, "doc": doc.id, "pos": i} for i, chunk in enumerate(chunks)],
+        )
+    session.commit()
+    session.refresh(doc)
+    return doc
+
+def delete_session_documents(session: Session, chat_session_id: int):
+    """Removes a chat's documents and their chunks; the caller commits."""
+    if index_available():
+        session.execute(
+            text(f"DELETE FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :q"),
+            {"q": f"session_key : {_session_key(chat_session_id)}"},
+        )
+    for doc in session.exec(select(ChatDocument).where(ChatDocument.session_id == chat_session_id)).all():
+        session.delete(doc)
+
+def query_terms(message: str) -> List[str]:
+    terms = []
+    for word in re.findall(r"\w+", message.lower()):
+        if len(word) > 1 and word not in STOPWORDS and word not in terms:
+            terms.append(word)
+    return terms[:MAX_QUERY_TERMS]
+
+def retrieve(session: Session, chat_session_id: int, message: str, k: int = RETRIEVAL_TOP_K):
+    """
+    Top-k chunks of the chat's documents for `message` as dicts with
+    filename, position and content, best match first. When nothing matches
+    (e.g. "summarize this"), the opening chunks of the newest document are
+    returned instead.
+    """
+    if not index_available():
+        return []
+    docs = {d.id: d for d in session.exec(select(ChatDocument).where(ChatDocument.session_id == chat_session_id)).all()}
+    if not docs:
+        return []
+
+    scope = f"session_key : {_session_key(chat_session_id)}"
+    rows = []
+    terms = query_terms(message)
+    if terms:
+        match = scope + " AND content : (" + " OR ".join(f'"{t}"' for t in terms) + ")"
+        # Weight 0 on session_key: every row of the chat matches it equally
+        rows = session.execute(
+            text(f"SELECT document_id, position, content FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :q "
+                 f"ORDER BY bm25({FTS_TABLE}, 1.0, 0.0) LIMIT :k"),
+            {"q": match, "k": k},
+        ).all()
+    if not rows:
+        newest = max(docs.values(), key=lambda d: d.id)
+        rows = session.execute(
+            text(f"SELECT document_id, position, content FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :q "
+                 "AND document_id = :doc AND position < :k ORDER BY position"),
+            {"q": scope, "doc": newest.id, "k": k},
+        ).all()
+    return [
+        {"filename": docs[doc_id].filename, "position": position, "content": content}
+        for doc_id, position, content in rows if doc_id in docs
+    ]
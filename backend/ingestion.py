@@ -0,0 +1,234 @@
+"""
+Bounded ingestion of files uploaded to the chat.
+
+- UploadLimitMiddleware rejects request bodies over UPLOAD_MAX_BYTES while
+  they stream in, before the multipart parser spools them anywhere.
+- Text extraction stops once UPLOAD_MAX_CHARS are collected, so a 300-page
+  PDF costs the same as a short one.
+- PDF parsing runs in a small process pool with a hard timeout, keeping the
+  event loop and the shared threadpool free.
+- Results are cached by content hash (in the SQLite cache llm_cache manages),
+  so re-uploading the same file skips extraction entirely.
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from . import llm_cache
+from .database import run_db
+
+# Try importing pypdf
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", 20 * 1024 * 1024))
+UPLOAD_MAX_CHARS = int(os.getenv("UPLOAD_MAX_CHARS", 20000))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))
+INGEST_TIMEOUT_SECONDS = float(os.getenv("INGEST_TIMEOUT_SECONDS", 30))
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", 16))
+INGEST_CACHE_ENABLED = os.getenv("INGEST_CACHE_ENABLED", "1") == "1"
+INGEST_CACHE_MAX_CHARS = int(os.getenv("INGEST_CACHE_MAX_CHARS", 200000))
+# Bump when extraction output changes so stale cached text is not reused
+EXTRACTOR_VERSION = "1"
+
+READ_CHUNK_BYTES = 64 * 1024
+# Multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+logger = logging.getLogger("uvicorn.error")
+
+ingest_stats = {"extracted": 0, "cache_hits": 0, "timeouts": 0, "rejected": 0}
+
+class UploadLimitMiddleware:
+    """Caps the request body size of the given paths while it is received."""
+    def __init__(self, app, paths, max_bytes: int = UPLOAD_MAX_BYTES):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes + MULTIPART_OVERHEAD_BYTES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        declared = headers.get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > self.max_bytes:
+            response = JSONResponse({"detail": _too_large_detail()}, status_code=413)
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=_too_large_detail())
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+def _too_large_detail():
+    return f"File too large, the limit is {UPLOAD_MAX_BYTES // (1024 * 1024)} MB"
+
+# Runs inside the worker processes
+def _extract_pdf(data: bytes, max_chars: int, deadline_seconds: float):
+    started = time.monotonic()
+    reader = PdfReader(io.BytesIO(data))
+    parts = []
+    collected = 0
+    pages_read = 0
+    for page in reader.pages:
+        if collected >= max_chars or time.monotonic() - started > deadline_seconds:
+            break
+        text = page.extract_text() or ""
+        parts.append(text)
+        collected += len(text) + 1
+        pages_read += 1
+    return {
+        "content": "\n".join(parts)[:max_chars],
+        "truncated": pages_read < len(reader.pages) or collected > max_chars,
+    }
+
+def _extract_text(data: bytes, max_chars: int):
+    # UTF-8 needs at most 4 bytes per character, so only decode that much
+    head = data[:max_chars * 4 + 4]
+    content = head.decode("utf-8", errors="ignore")
+    return {
+        "content": content[:max_chars],
+        "truncated": len(content) > max_chars or len(data) > len(head),
+    }
+
+class DocumentExtractor:
+    """
+    Process pool for PDF text extraction. A running task can't be cancelled,
+    so when a call exceeds INGEST_TIMEOUT_SECONDS new work moves to a fresh
+    pool and the old one is retired: calls still running on it finish
+    normally, then its processes (including the stuck one) are terminated.
+    """
+    def __init__(self, workers: int, max_pending: int, timeout: float):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self._running: Dict[ProcessPoolExecutor, int] = {} # pool -> calls submitted to it
+        self._retiring = set()
+
+    def start(self):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def stop(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+        for pool in list(self._retiring):
+            self._kill(pool)
+        self._retiring.clear()
+
+    def _retire(self):
+        self._retiring.add(self.pool)
+        self.start()
+
+    def _kill(self, pool: ProcessPoolExecutor):
+        # ProcessPoolExecutor has no public way to kill a busy worker
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _done(self, pool: ProcessPoolExecutor):
+        self._running[pool] -= 1
+        if self._running[pool]:
+            return
+        del self._running[pool]
+        if pool in self._retiring:
+            self._retiring.discard(pool)
+            self._kill(pool)
+
+    async def _run(self, fn, *args):
+        if self.pool is None:
+            self.start()
+        if self.pending >= self.max_pending:
+            ingest_stats["rejected"] += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Too many files are being processed, please retry shortly",
+                headers={"Retry-After": "2"},
+            )
+        pool = self.pool
+        self.pending += 1
+        self._running[pool] = self._running.get(pool, 0) + 1
+        try:
+            future = asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            ingest_stats["timeouts"] += 1
+            if pool is self.pool:
+                logger.warning("PDF extraction timed out after %ss, moving new work to fresh extraction workers", self.timeout)
+                self._retire()
+            raise HTTPException(status_code=422, detail="This file took too long to process")
+        finally:
+            self.pending -= 1
+            self._done(pool)
+
+    async def extract_pdf(self, data: bytes, max_chars: int):
+        # The worker also stops itself a little before the hard timeout
+        return await self._run(_extract_pdf, data, max_chars, self.timeout * 0.8)
+
+extractor = DocumentExtractor(INGEST_WORKERS, INGEST_MAX_PENDING, INGEST_TIMEOUT_SECONDS)
+
+async def read_upload(file: UploadFile, max_bytes: int = UPLOAD_MAX_BYTES):
+    """Reads the upload in chunks, hashing as it goes. Returns (bytes, sha256 hex)."""
+    digest = hashlib.sha256()
+    buffer = io.BytesIO()
+    while True:
+        chunk = await file.read(READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        if buffer.tell() + len(chunk) > max_bytes:
+            raise HTTPException(status_code=413, detail=_too_large_detail())
+        digest.update(chunk)
+        buffer.write(chunk)
+    return buffer.getvalue(), digest.hexdigest()
+
+def _cache_key(content_hash: str, is_pdf: bool, max_chars: int):
+    raw = f"document:{EXTRACTOR_VERSION}:{'pdf' if is_pdf else 'text'}:{max_chars}:{content_hash}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+async def extract_content(filename: str, data: bytes, content_hash: str, max_chars: int = UPLOAD_MAX_CHARS):
+    """
+    Returns {"content", "truncated", "content_hash", "cached"} for an upload
+    already read with read_upload, or None for a PDF when pypdf is missing.
+    """
+    is_pdf = filename.lower().endswith(".pdf")
+    if is_pdf and PdfReader is None:
+        return None
+
+    key = _cache_key(content_hash, is_pdf, max_chars)
+    if INGEST_CACHE_ENABLED:
+        cached = await run_db(llm_cache.get, key)
+        if cached is not None:
+            ingest_stats["cache_hits"] += 1
+            return {**cached, "content_hash": content_hash, "cached": True}
+
+    if is_pdf:
+        result = await extractor.extract_pdf(data, max_chars)
+    else:
+        result = _extract_text(data, max_chars)
+    ingest_stats["extracted"] += 1
+
+    # Whole books would crowd the LLM responses out of the shared cache
+    content = result["content"]
+    if INGEST_CACHE_ENABLED and content.strip() and len(content) <= INGEST_CACHE_MAX_CHARS:
+        await run_db(llm_cache.put, key, "document", result)
+    return {**result, "content_hash": content_hash, "cached": False}
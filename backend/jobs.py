@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlmodel import Session, select
+from sqlalchemy import update
+from .database import engine, run_db
+from .models import Job, Topic
+
+# Number of background jobs (roadmap generations etc.) run at once per process
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", 4))
+# Jobs still queued/running after this long were lost (e.g. server restart)
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", 900))
+
+logger = logging.getLogger(__name__)
+
+class JobRunner:
+    """
+    In-process pool of asyncio workers consuming a queue of jobs.
+    Job state is persisted in the Job table so any worker process can report it.
+    """
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers = []
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for w in self.workers:
+            w.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def submit(self, job_id: str, fn, *args):
+        """Queues `await fn(job_id, *args)`. The Job row must already exist."""
+        self.queue.put_nowait((job_id, fn, args))
+
+    async def _worker(self):
+        while True:
+            job_id, fn, args = await self.queue.get()
+            try:
+                await run_db(set_job_status, job_id, "running")
+                await fn(job_id, *args)
+                await run_db(set_job_status, job_id, "done")
+            except Exception as e:
+                logger.exception(f"Job {job_id} failed")
+                await run_db(set_job_status, job_id, "failed", error=str(e))
+            finally:
+                self.queue.task_done()
+
+runner = JobRunner(JOB_CONCURRENCY)
+
+def create_job(session: Session, kind: str, user_id: int, topic_id: Optional[int] = None) -> Job:
+    job = Job(id=uuid.uuid4().hex, kind=kind, user_id=user_id, topic_id=topic_id)
+    session.add(job)
+    return job
+
+def set_job_status(job_id: str, status: str, error: Optional[str] = None):
+    with Session(engine) as session:
+        job = session.get(Job, job_id)
+        if job is None:
+            return
+        job.status = status
+        job.error = error
+        if status in ("done", "failed"):
+            job.finished_at = datetime.utcnow()
+        session.add(job)
+        session.commit()
+
+def set_job_total(job_id: str, total: int):
+    with Session(engine) as session:
+        session.execute(update(Job).where(Job.id == job_id).values(progress_total=total))
+        session.commit()
+
+def advance_job(job_id: str, failed: bool = False):
+    # Incremented in SQL so concurrent sub-tasks don't overwrite each other's counts
+    values = {"progress_failed": Job.progress_failed + 1} if failed else {"progress_done": Job.progress_done + 1}
+    with Session(engine) as session:
+        session.execute(update(Job).where(Job.id == job_id).values(**values))
+        session.commit()
+
+def fail_stale_jobs():
+    # Called at startup: jobs are in-memory, so anything left unfinished for
+    # too long will never complete.
+    stale_before = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+    with Session(engine) as session:
+        stale = session.exec(
+            select(Job).where(Job.status.in_(["queued", "running"]), Job.created_at < stale_before)
+        ).all()
+        for job in stale:
+            job.status = "failed"
+            job.error = "Interrupted"
+            job.finished_at = datetime.utcnow()
+            session.add(job)
+            if job.topic_id is not None:
+                topic = session.get(Topic, job.topic_id)
+                if topic and topic.status == "generating":
+                    topic.status = "failed"
+                    session.add(topic)
+        session.commit()
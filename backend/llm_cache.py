@@ -0,0 +1,102 @@
+import os
+import json
+import hashlib
+from datetime import datetime, timedelta
+from sqlmodel import Session, select
+from sqlalchemy import func, delete
+from sqlalchemy.exc import IntegrityError
+from .database import engine
+from .models import LLMCacheEntry
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 50 * 1024 * 1024))
+# A hit only rewrites last_accessed when it is older than this, so hits stay
+# read-only and don't queue for the SQLite writer lock. LRU eviction doesn't
+# need finer resolution.
+LLM_CACHE_TOUCH_SECONDS = int(os.getenv("LLM_CACHE_TOUCH_SECONDS", 3600))
+
+cache_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+def normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.split()).lower()
+    return value
+
+def make_key(kind: str, template: str, model: str, prompt_version: str, **fields):
+    payload = {
+        "kind": kind,
+        "model": model,
+        "prompt_version": prompt_version,
+        "template": hashlib.sha256(template.encode()).hexdigest(),
+        "fields": {k: normalize(v) for k, v in sorted(fields.items())},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+def get(key: str):
+    with Session(engine) as session:
+        entry = session.get(LLMCacheEntry, key)
+        if entry is None:
+            cache_stats["misses"] += 1
+            return None
+        if entry.created_at < datetime.utcnow() - timedelta(seconds=LLM_CACHE_TTL_SECONDS):
+            session.delete(entry)
+            session.commit()
+            cache_stats["misses"] += 1
+            cache_stats["evictions"] += 1
+            return None
+        now = datetime.utcnow()
+        if entry.last_accessed < now - timedelta(seconds=LLM_CACHE_TOUCH_SECONDS):
+            entry.last_accessed = now
+            session.add(entry)
+            session.commit()
+        cache_stats["hits"] += 1
+        return json.loads(entry.value)
+
+def put(key: str, kind: str, value):
+    data = json.dumps(value)
+    with Session(engine) as session:
+        for attempt in range(2):
+            entry = session.get(LLMCacheEntry, key) or LLMCacheEntry(key=key, kind=kind, value=data, size=len(data))
+            entry.value = data
+            entry.size = len(data)
+            entry.created_at = datetime.utcnow()
+            entry.last_accessed = entry.created_at
+            session.add(entry)
+            try:
+                session.commit()
+                break
+            except IntegrityError:
+                # An identical request running concurrently stored the key
+                # first; the second pass finds and overwrites its row
+                session.rollback()
+                if attempt:
+                    raise
+        cache_stats["stores"] += 1
+        _evict(session)
+
+def _evict(session: Session):
+    expired_before = datetime.utcnow() - timedelta(seconds=LLM_CACHE_TTL_SECONDS)
+    result = session.execute(delete(LLMCacheEntry).where(LLMCacheEntry.created_at < expired_before))
+    cache_stats["evictions"] += result.rowcount
+    session.commit()
+
+    total = session.exec(select(func.coalesce(func.sum(LLMCacheEntry.size), 0))).one()
+    if total <= LLM_CACHE_MAX_BYTES:
+        return
+    # Least recently used first
+    lru = session.exec(select(LLMCacheEntry.key, LLMCacheEntry.size).order_by(LLMCacheEntry.last_accessed)).all()
+    victims = []
+    for key, size in lru:
+        if total <= LLM_CACHE_MAX_BYTES:
+            break
+        total -= size
+        victims.append(key)
+    session.execute(delete(LLMCacheEntry).where(LLMCacheEntry.key.in_(victims)))
+    cache_stats["evictions"] += len(victims)
+    session.commit()
+
+def clear():
+    with Session(engine) as session:
+        session.execute(delete(LLMCacheEntry))
+        session.commit()
@@ -0,0 +1,219 @@
+"""
+Shared call path for every request to the LLM provider.
+
+- Token buckets cap requests/min and tokens/min across the process, so a burst
+  of users queues briefly instead of hammering the provider into 429s.
+- 429s, 5xx and connection errors are retried with jittered exponential
+  backoff, honouring Retry-After when the provider sends it.
+- A circuit breaker opens after LLM_BREAKER_FAILURES consecutive failures and
+  fails calls immediately for LLM_BREAKER_RESET_SECONDS, then lets one trial
+  call through to decide whether to close again.
+
+Calls that cannot be served raise LLMUnavailable. main.py turns it into a 503
+with Retry-After for endpoints that let it propagate.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Optional
+import openai
+from . import metrics
+
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", 30))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", 60000))
+# Completion size assumed when a request sets no max_tokens
+LLM_DEFAULT_COMPLETION_TOKENS = int(os.getenv("LLM_DEFAULT_COMPLETION_TOKENS", 1500))
+# Longer waits for the rate limit fail with LLMUnavailable instead of queueing
+LLM_MAX_QUEUE_SECONDS = float(os.getenv("LLM_MAX_QUEUE_SECONDS", 30))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", 0.5))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", 20))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 5))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", 30))
+
+logger = logging.getLogger("uvicorn.error")
+
+gateway_stats = {"calls": 0, "retries": 0, "failures": 0, "rejected": 0, "throttled_seconds": 0.0}
+
+class LLMUnavailable(Exception):
+    def __init__(self, message: str, retry_after: float = LLM_BREAKER_RESET_SECONDS):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """
+    Refills at `per_minute` units per minute up to a burst of `per_minute`.
+    acquire() reserves its units immediately (the level may go negative) and
+    then sleeps off the debt, so waiters are served in arrival order.
+    """
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float, max_wait: float):
+        if self.capacity <= 0:
+            return
+        # A single oversized request must still be able to go through eventually
+        amount = min(amount, self.capacity)
+        self._refill()
+        wait = max(0.0, (amount - self.level) / self.rate)
+        if wait > max_wait:
+            gateway_stats["rejected"] += 1
+            raise LLMUnavailable("LLM rate limit reached", retry_after=wait)
+        self.level -= amount
+        if wait:
+            gateway_stats["throttled_seconds"] += wait
+            await asyncio.sleep(wait)
+
+    def refund(self, amount: float):
+        # Corrects a reservation once the real usage is known; negative charges more
+        if self.capacity <= 0:
+            return
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+class CircuitBreaker:
+    def __init__(self, max_failures: int, reset_seconds: float):
+        self.max_failures = max_failures
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_running = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> bool:
+        """Raises if the call may not go ahead; True if it is the half-open trial."""
+        state = self.state
+        if state == "open":
+            gateway_stats["rejected"] += 1
+            raise LLMUnavailable("LLM provider is unavailable", retry_after=self.reset_seconds - (time.monotonic() - self.opened_at))
+        if state == "half_open":
+            # One trial call at a time decides whether the provider is back
+            if self.trial_running:
+                gateway_stats["rejected"] += 1
+                raise LLMUnavailable("LLM provider is unavailable", retry_after=1)
+            self.trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info("LLM circuit breaker closed")
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_running = False
+        if self.opened_at is not None or self.failures >= self.max_failures:
+            if self.state != "open":
+                logger.warning("LLM circuit breaker opened after %s consecutive failures", self.failures)
+            self.opened_at = time.monotonic()
+
+def _retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def _estimate_tokens(request: dict) -> int:
+    prompt_chars = sum(len(str(m.get("content", ""))) for m in request.get("messages", []))
+    return prompt_chars // 4 + (request.get("max_tokens") or LLM_DEFAULT_COMPLETION_TOKENS)
+
+class LLMGateway:
+    def __init__(self, provider):
+        # Anything with `async create(**request)`, see llm_providers.py
+        self.provider = provider
+        self.requests = TokenBucket(LLM_REQUESTS_PER_MINUTE)
+        self.tokens = TokenBucket(LLM_TOKENS_PER_MINUTE)
+        self.breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS)
+
+    async def create(self, **request):
+        """chat.completions.create with rate limiting, retries and the breaker.
+        For stream=True only opening the stream is covered."""
+        if request.get("stream"):
+            # Streams are timed by their reader, which sees the first token
+            return await self._create(request)
+        started = time.perf_counter()
+        try:
+            response = await self._create(request)
+        except Exception:
+            metrics.record_llm_call("completion", time.perf_counter() - started, failed=True)
+            raise
+        metrics.record_llm_call("completion", time.perf_counter() - started, getattr(response, "usage", None))
+        return response
+
+    async def _create(self, request: dict):
+        estimate = _estimate_tokens(request)
+        attempt = 0
+        while True:
+            trial = self.breaker.before_call()
+            settled = False
+            try:
+                await self.requests.acquire(1, LLM_MAX_QUEUE_SECONDS)
+                await self.tokens.acquire(estimate, LLM_MAX_QUEUE_SECONDS)
+                gateway_stats["calls"] += 1
+                try:
+                    response = await self.provider.create(**request)
+                except Exception as e:
+                    if not _retryable(e):
+                        if isinstance(e, openai.APIStatusError):
+                            # The provider answered, it just rejected this request
+                            self.breaker.record_success()
+                            settled = True
+                        raise
+                    gateway_stats["failures"] += 1
+                    self.breaker.record_failure()
+                    settled = True
+                    if attempt >= LLM_MAX_RETRIES:
+                        raise LLMUnavailable(f"LLM call failed after {attempt + 1} attempts: {e}") from e
+                    # Full jitter keeps retrying clients from moving in lockstep
+                    delay = _retry_after(e) or random.uniform(0, LLM_BACKOFF_BASE_SECONDS * 2 ** attempt)
+                    attempt += 1
+                    gateway_stats["retries"] += 1
+                    await asyncio.sleep(min(delay, LLM_BACKOFF_MAX_SECONDS))
+                    continue
+                self.breaker.record_success()
+                settled = True
+            finally:
+                # Queue timeouts, other errors and cancellation (client gone,
+                # shutdown) say nothing about the provider; free the trial slot
+                if trial and not settled:
+                    self.breaker.trial_running = False
+            usage = getattr(response, "usage", None)
+            if usage is not None and getattr(usage, "total_tokens", None):
+                self.tokens.refund(estimate - usage.total_tokens)
+            return response
+
+    def stats(self):
+        return {
+            **gateway_stats,
+            "breaker": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "request_budget": round(self.requests.level, 1),
+            "token_budget": round(self.tokens.level),
+        }
@@ -0,0 +1,270 @@
+"""
+LLM providers behind the gateway, picked with LLM_PROVIDER:
+
+- "groq" (default): the real OpenAI-compatible client from ai_service.
+- "stub": deterministic local responses in the shapes the prompts ask for
+  (roadmaps, slides and quizzes, mock exams, insights, chat), with synthetic
+  latency from LLM_STUB_LATENCY_MS and LLM_STUB_TOKENS_PER_SECOND. No network.
+- "record": calls the real client and writes every request/response pair to
+  LLM_RECORDINGS_DIR.
+- "replay": answers from LLM_RECORDINGS_DIR only; a request that was never
+  recorded raises ReplayMiss (callers then use their fallback content). With
+  LLM_REPLAY_REALTIME=1 responses take as long as they did when recorded.
+
+Every provider has `async create(**request)` with the arguments of
+chat.completions.create and returns the same openai.types objects (or, for
+stream=True, an async iterator of chunks with close()), so callers can't tell
+them apart. Run the backend fully offline with:
+
+    LLM_PROVIDER=stub uvicorn backend.main:app
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from typing import List
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletion, ChatCompletionChunk, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
+from openai.types.chat.chat_completion_chunk import Choice as ChunkChoice, ChoiceDelta
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq")
+LLM_STUB_LATENCY_MS = float(os.getenv("LLM_STUB_LATENCY_MS", 200)) # time to first token
+LLM_STUB_TOKENS_PER_SECOND = float(os.getenv("LLM_STUB_TOKENS_PER_SECOND", 500))
+LLM_RECORDINGS_DIR = os.getenv("LLM_RECORDINGS_DIR", "llm_recordings")
+LLM_REPLAY_REALTIME = os.getenv("LLM_REPLAY_REALTIME", "0") == "1"
+
+class ReplayMiss(LookupError):
+    pass
+
+def _completion(content: str, model: str, prompt_tokens: int) -> ChatCompletion:
+    completion_tokens = _count_tokens(content)
+    return ChatCompletion(
+        id=f"chatcmpl-{hashlib.sha1(content.encode()).hexdigest()[:12]}",
+        object="chat.completion",
+        created=int(time.time()),
+        model=model,
+        choices=[Choice(index=0, finish_reason="stop", message=ChatCompletionMessage(role="assistant", content=content))],
+        usage=CompletionUsage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, total_tokens=prompt_tokens + completion_tokens),
+    )
+
+def _chunk(content: str, model: str) -> ChatCompletionChunk:
+    return ChatCompletionChunk(
+        id="chatcmpl-stream",
+        object="chat.completion.chunk",
+        created=int(time.time()),
+        model=model,
+        choices=[ChunkChoice(index=0, delta=ChoiceDelta(content=content), finish_reason=None)],
+    )
+
+def _count_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+def _prompt_tokens(request: dict) -> int:
+    return sum(_count_tokens(str(m.get("content", ""))) for m in request.get("messages", []))
+
+class ChunkStream:
+    """Async iterator over chunks with the close() the real stream has."""
+    def __init__(self, chunks, delays=None):
+        self._chunks = chunks
+        self._delays = delays
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for i, chunk in enumerate(self._chunks):
+            if self.closed:
+                return
+            if self._delays and self._delays[i]:
+                await asyncio.sleep(self._delays[i])
+            yield chunk
+
+    async def close(self):
+        self.closed = True
+
+class OpenAIProvider:
+    def __init__(self, client):
+        self.client = client
+
+    async def create(self, **request):
+        return await self.client.chat.completions.create(**request)
+
+class StubProvider:
+    """
+    Recognises the app's prompts by their wording and answers in their JSON
+    schemas. Output depends only on the request, so runs are reproducible.
+    """
+    def __init__(self, latency_ms: float = LLM_STUB_LATENCY_MS, tokens_per_second: float = LLM_STUB_TOKENS_PER_SECOND):
+        self.latency = latency_ms / 1000
+        self.tokens_per_second = tokens_per_second
+
+    async def create(self, **request):
+        messages = request.get("messages", [])
+        prompt = str(messages[-1].get("content", "")) if messages else ""
+        system = " ".join(str(m.get("content", "")) for m in messages if m.get("role") == "system")
+        rng = random.Random(hashlib.sha256(json.dumps(messages, sort_keys=True).encode()).hexdigest())
+        content = self._respond(prompt, system, request, rng)
+        if request.get("max_tokens"):
+            content = content[:request["max_tokens"] * 4]
+        model = request.get("model", "stub")
+
+        if request.get("stream"):
+            words = re.findall(r"\S+\s*", content) or [content]
+            per_token = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+            delays = [self.latency] + [per_token * _count_tokens(w) for w in words[1:]]
+            return ChunkStream([_chunk(w, model) for w in words], delays)
+
+        generation = _count_tokens(content) / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        await asyncio.sleep(self.latency + generation)
+        return _completion(content, model, _prompt_tokens(request))
+
+    def _respond(self, prompt: str, system: str, request: dict, rng: random.Random) -> str:
+        # JSON prompts are told apart by their wording, plain-text ones by their
+        # system prompt, so chat messages quoting a prompt don't confuse it
+        if (request.get("response_format") or {}).get("type") == "json_object":
+            if "learning roadmap" in prompt:
+                return json.dumps(_stub_roadmap(prompt))
+            if "educational content for the module" in prompt:
+                return json.dumps(_stub_module(prompt, rng))
+            if "mock exam" in prompt:
+                return json.dumps(_stub_exam(prompt, rng))
+            if "Analyze this student's recent performance" in prompt:
+                return json.dumps({
+                    "strength": "Steady quiz scores across modules",
+                    "weakness": "Revisit the modules scored below 80%",
+                    "motivation": "Small steps every day add up to mastery.",
+                })
+            return json.dumps({"result": "ok"})
+        if "You summarize conversations" in system:
+            return "The student is working through their topic and has asked follow-up questions about the material."
+        if "Return only the title text" in system:
+            words = _field(prompt, r'User Message: "(.*?)"', "Study chat").split()
+            return " ".join(words[:4]).title() or "Study Chat"
+        question = " ".join(prompt.split()[:12])
+        sentences = [
+            f"Good question about {question}.",
+            "Start from the core definition, then work through a small example by hand.",
+            "Check each step against what you expect before moving on.",
+            "Once that feels comfortable, try a variation of the example on your own.",
+        ]
+        return " ".join(sentences[:2 + rng.randint(0, 2)])
+
+def _field(prompt: str, pattern: str, default: str) -> str:
+    match = re.search(pattern, prompt, re.S)
+    return match.group(1).strip() if match else default
+
+def _stub_roadmap(prompt: str):
+    topic = _field(prompt, r'topic: "(.*?)"', "the topic")
+    days = int(_field(prompt, r"Duration: (\d+) days", "5"))
+    count = max(3, min(10, days))
+    return {"modules": [
+        {"title": f"{topic}: Part {i}", "description": f"Key ideas of {topic}, part {i} of {count}", "order_index": i}
+        for i in range(1, count + 1)
+    ]}
+
+def _stub_module(prompt: str, rng: random.Random):
+    module = _field(prompt, r'for the module "(.*?)"', "this module")
+    slides = [
+        {"content": f"# {module} ({i})\n\n- Concept {i} explained step by step\n- A worked example\n\n```python\nprint({i})\n```",
+         "order_index": i}
+        for i in range(1, 6)
+    ]
+    quizzes = []
+    for i in range(1, 6):
+        options = [f"Option {chr(65 + j)} for question {i}" for j in range(4)]
+        quizzes.append({"question": f"Question {i} about {module}?", "options": options, "correct_answer": rng.choice(options)})
+    return {"slides": slides, "quizzes": quizzes}
+
+def _stub_exam(prompt: str, rng: random.Random):
+    topic = _field(prompt, r'for the topic "(.*?)"', "the topic")
+    count = int(_field(prompt, r"Number of questions: (\d+)", "5"))
+    questions: List[dict] = []
+    for i in range(count):
+        kind = ("mcq", "boolean", "code")[i % 3]
+        if kind == "mcq":
+            options = [f"Answer {chr(65 + j)}" for j in range(4)]
+            questions.append({"type": "mcq", "question": f"Q{i + 1}: which statement about {topic} holds?",
+                              "options": options, "correct_answer": rng.choice(options)})
+        elif kind == "boolean":
+            questions.append({"type": "boolean", "question": f"Q{i + 1}: {topic} statement {i + 1} is true.",
+                              "correct_answer": rng.choice(["True", "False"])})
+        else:
+            questions.append({"type": "code", "question": f"Q{i + 1}: write a function that doubles a number.",
+                              "test_case_input": "2", "test_case_output": "4"})
+    return {"questions": questions}
+
+def _request_key(request: dict) -> str:
+    canonical = json.dumps(
+        {k: request.get(k) for k in ("model", "messages", "response_format", "max_tokens", "stream")},
+        sort_keys=True,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+class RecordingProvider:
+    """Passes calls to `inner` and saves each exchange as <request hash>.json."""
+    def __init__(self, inner, directory: str = LLM_RECORDINGS_DIR):
+        self.inner = inner
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _write(self, request: dict, elapsed: float, payload: dict):
+        path = os.path.join(self.directory, _request_key(request) + ".json")
+        with open(path, "w") as f:
+            json.dump({"request": request, "elapsed": elapsed, **payload}, f, indent=1)
+
+    async def create(self, **request):
+        started = time.perf_counter()
+        response = await self.inner.create(**request)
+        if not request.get("stream"):
+            self._write(request, time.perf_counter() - started, {"response": response.model_dump(mode="json")})
+            return response
+        # The stream is read to the end before it is handed on, so recording
+        # runs don't show real time-to-first-token
+        chunks = []
+        delays = []
+        last = started
+        try:
+            async for chunk in response:
+                now = time.perf_counter()
+                delays.append(now - last)
+                last = now
+                chunks.append(chunk)
+        finally:
+            await response.close()
+        self._write(request, last - started, {"chunks": [c.model_dump(mode="json") for c in chunks], "delays": delays})
+        return ChunkStream(chunks)
+
+class ReplayProvider:
+    def __init__(self, directory: str = LLM_RECORDINGS_DIR, realtime: bool = LLM_REPLAY_REALTIME):
+        self.directory = directory
+        self.realtime = realtime
+
+    async def create(self, **request):
+        path = os.path.join(self.directory, _request_key(request) + ".json")
+        try:
+            with open(path) as f:
+                recording = json.load(f)
+        except FileNotFoundError:
+            raise ReplayMiss(f"No recording for this request in {self.directory}")
+        if "chunks" in recording:
+            chunks = [ChatCompletionChunk.model_validate(c) for c in recording["chunks"]]
+            return ChunkStream(chunks, recording.get("delays") if self.realtime else None)
+        if self.realtime:
+            await asyncio.sleep(recording.get("elapsed", 0))
+        return ChatCompletion.model_validate(recording["response"])
+
+def make_provider(client):
+    if LLM_PROVIDER == "stub":
+        return StubProvider()
+    if LLM_PROVIDER == "record":
+        return RecordingProvider(OpenAIProvider(client))
+    if LLM_PROVIDER == "replay":
+        return ReplayProvider()
+    if LLM_PROVIDER != "groq":
+        raise ValueError(f"Unknown LLM_PROVIDER {LLM_PROVIDER!r}, expected groq, stub, record or replay")
+    return OpenAIProvider(client)
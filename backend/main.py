@@ -1,16 +1,46 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, HTTPException, Depends
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from .database import create_db_and_tables
+from .database import create_db_and_tables, log_engine_settings, engine, get_session
+from .activity import backfill_activity
+from .migrations import log_query_plan_warnings
+from sqlmodel import Session
 from .routers import auth, topics, learning, progress, chat, mock_exam
+from .jobs import runner, fail_stale_jobs
+from .passwords import hasher
+from .ingestion import extractor, UploadLimitMiddleware, ingest_stats
+from .llm_gateway import LLMUnavailable
+from .ai_service import gateway
+from .llm_cache import cache_stats
+from .user_cache import get_cache_stats
+from .content_generation import get_prefetch_stats
+from . import metrics
+from .auth import get_current_user, get_current_admin
 from contextlib import asynccontextmanager
+import hmac
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_db_and_tables()
+    log_engine_settings()
+    log_query_plan_warnings()
+    with Session(engine) as session:
+        backfill_activity(session)
+    fail_stale_jobs()
+    runner.start()
+    hasher.start()
+    extractor.start()
     yield
+    await runner.stop()
+    hasher.stop()
+    extractor.stop()
 
 app = FastAPI(lifespan=lifespan, title="AI Learning Assistant API")
 
+# Rejects oversized uploads while they stream, before they are spooled to disk.
+# Added before CORS so its 413 still gets CORS headers.
+app.add_middleware(UploadLimitMiddleware, paths=["/chat/upload"])
+
 # Allow all origins for development
 origins = ["*"]
 
@@ -22,6 +52,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so the time includes the other middleware and rejected uploads
+# are counted too
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine)
+metrics.register_stats("llm_gateway", gateway.stats)
+metrics.register_stats("llm_cache", lambda: cache_stats)
+metrics.register_stats("user_cache", get_cache_stats)
+metrics.register_stats("prefetch", get_prefetch_stats)
+metrics.register_stats("password_hash", hasher.stats)
+metrics.register_stats("ingest", lambda: ingest_stats)
+
+@app.exception_handler(LLMUnavailable)
+async def llm_unavailable_handler(request: Request, exc: LLMUnavailable):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "The AI service is busy or unavailable, please try again shortly"},
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))},
+    )
+
 app.include_router(auth.router)
 app.include_router(topics.router)
 app.include_router(learning.router)
@@ -29,6 +78,19 @@ app.include_router(progress.router)
 app.include_router(chat.router)
 app.include_router(mock_exam.router)
 
+@app.get("/metrics", include_in_schema=False)
+def read_metrics(request: Request, session: Session = Depends(get_session)):
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not metrics.METRICS_PUBLIC:
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+        # A scraper's METRICS_TOKEN, otherwise an admin's access token
+        if not (metrics.METRICS_TOKEN and hmac.compare_digest(token, metrics.METRICS_TOKEN)):
+            get_current_admin(get_current_user(token, session))
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to AI Learning Assistant API"}
@@ -0,0 +1,255 @@
+"""
+Per-request instrumentation, exported in the Prometheus text format on /metrics.
+
+- MetricsMiddleware times every request and labels it with its route template
+  (/topics/{topic_id}, not /topics/42).
+- Engine event hooks count the SQL statements a request runs and their total
+  time, so N+1 lazy loads show up as a high statement count.
+- The LLM gateway and the chat stream report call time, time to first token
+  and token usage.
+
+Request state lives in a context variable; AnyIO copies it into the
+threadpool, so statements run through run_db and sync endpoints count
+towards the request that issued them. Work outside a request (background
+jobs) only feeds the global DB and LLM histograms.
+
+With SERVER_TIMING_ENABLED=1 responses also carry a Server-Timing header
+(db, llm and app time) that browser dev tools display. It is sent with the
+response headers, so for streamed responses it covers the time until the
+stream started.
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Optional, Tuple
+from sqlalchemy import event
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# /metrics includes operational stats that are admin-only elsewhere, so it
+# needs "Authorization: Bearer <METRICS_TOKEN>" (for scrapers) or an admin's
+# access token, unless METRICS_PUBLIC=1 opts out
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "0") == "1"
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "0") == "1"
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [count per bucket..., +Inf count, sum]
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+            series = [(k, list(v)) for k, v in series]
+        for label_values, counts in series:
+            base = [f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values)]
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_labels(base + [_le(bound)])} {count}")
+            lines.append(f"{self.name}_bucket{_labels(base + [_le('+Inf')])} {counts[-2]}")
+            lines.append(f"{self.name}_count{_labels(base)} {counts[-2]}")
+            lines.append(f"{self.name}_sum{_labels(base)} {counts[-1]:.6f}")
+        return lines
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[tuple, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float, *label_values):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            base = [f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values)]
+            lines.append(f"{self.name}{_labels(base)} {value:g}")
+        return lines
+
+def _labels(parts):
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _le(bound) -> str:
+    return f'le="{bound}"'
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+request_seconds = Histogram("http_request_duration_seconds", "Wall time of HTTP requests", ("method", "route", "status"))
+request_db_queries = Histogram("http_request_db_queries", "SQL statements run per HTTP request", ("route",), QUERY_BUCKETS)
+request_db_seconds = Histogram("http_request_db_seconds", "Time spent in SQL per HTTP request", ("route",))
+request_llm_seconds = Histogram("http_request_llm_seconds", "Time spent waiting on the LLM per HTTP request", ("route",))
+db_query_seconds = Histogram("db_query_duration_seconds", "Duration of single SQL statements")
+llm_call_seconds = Histogram("llm_call_duration_seconds", "Duration of LLM calls, including rate-limit queueing and retries", ("kind",))
+llm_ttft_seconds = Histogram("llm_time_to_first_token_seconds", "Time from starting a streamed LLM call to its first token")
+llm_tokens = Histogram("llm_call_tokens", "Tokens per LLM call as reported by the provider", ("type",), TOKEN_BUCKETS)
+llm_tokens_total = Counter("llm_tokens_total", "Tokens used across all LLM calls", ("type",))
+llm_errors_total = Counter("llm_call_errors_total", "LLM calls that raised", ("kind",))
+
+HISTOGRAMS = [
+    request_seconds, request_db_queries, request_db_seconds, request_llm_seconds,
+    db_query_seconds, llm_call_seconds, llm_ttft_seconds, llm_tokens,
+]
+COUNTERS = [llm_tokens_total, llm_errors_total]
+
+class RequestMetrics:
+    __slots__ = ("db_queries", "db_seconds", "llm_calls", "llm_seconds", "done")
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        # Tasks spawned by a request (prefetch) inherit its context; once the
+        # request has been recorded their work no longer counts towards it
+        self.done = False
+
+_current: contextvars.ContextVar[Optional[RequestMetrics]] = contextvars.ContextVar("request_metrics", default=None)
+_lock = threading.Lock()
+
+def current() -> Optional[RequestMetrics]:
+    metrics = _current.get()
+    return metrics if metrics is not None and not metrics.done else None
+
+# name -> function returning a dict of numbers, see register_stats
+_stat_sources: Dict[str, Callable[[], dict]] = {}
+
+def register_stats(name: str, source: Callable[[], dict]):
+    """Exports the numeric values of an existing stats dict as app_<name>_<key> gauges."""
+    _stat_sources[name] = source
+
+# SQL
+
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        elapsed = time.perf_counter() - started
+        db_query_seconds.observe(elapsed)
+        metrics = current()
+        if metrics is not None:
+            with _lock:
+                metrics.db_queries += 1
+                metrics.db_seconds += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        # after_cursor_execute doesn't run for failed statements
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
+
+# LLM
+
+def record_llm_call(kind: str, seconds: float, usage=None, failed: bool = False):
+    """kind is "completion" or "stream"; usage is the provider's CompletionUsage, if any."""
+    llm_call_seconds.observe(seconds, kind)
+    if failed:
+        llm_errors_total.inc(1, kind)
+    if usage is not None:
+        for token_type in ("prompt", "completion"):
+            count = getattr(usage, f"{token_type}_tokens", None)
+            if count:
+                llm_tokens.observe(count, token_type)
+                llm_tokens_total.inc(count, token_type)
+    metrics = current()
+    if metrics is not None:
+        with _lock:
+            metrics.llm_calls += 1
+            metrics.llm_seconds += seconds
+
+def record_llm_first_token(seconds: float):
+    llm_ttft_seconds.observe(seconds)
+
+# HTTP
+
+class MetricsMiddleware:
+    def __init__(self, app, server_timing: bool = SERVER_TIMING_ENABLED):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", _server_timing(metrics, time.perf_counter() - started).encode())
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            metrics.done = True
+            elapsed = time.perf_counter() - started
+            route = scope.get("route")
+            # Unmatched paths share one label so scanners can't blow up the series count
+            route = route.path if route is not None and hasattr(route, "path") else "unmatched"
+            request_seconds.observe(elapsed, scope["method"], route, str(status))
+            request_db_queries.observe(metrics.db_queries, route)
+            request_db_seconds.observe(metrics.db_seconds, route)
+            if metrics.llm_calls:
+                request_llm_seconds.observe(metrics.llm_seconds, route)
+
+def _server_timing(metrics: RequestMetrics, elapsed: float) -> str:
+    parts = [f'db;dur={metrics.db_seconds * 1000:.1f};desc="{metrics.db_queries} queries"']
+    if metrics.llm_calls:
+        parts.append(f'llm;dur={metrics.llm_seconds * 1000:.1f};desc="{metrics.llm_calls} calls"')
+    parts.append(f"app;dur={elapsed * 1000:.1f}")
+    return ", ".join(parts)
+
+def render() -> str:
+    lines = []
+    for metric in HISTOGRAMS + COUNTERS:
+        lines.extend(metric.render())
+    for name, source in _stat_sources.items():
+        for key, value in source().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            metric = f"app_{name}_{key}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value:g}")
+    return "\n".join(lines) + "\n"
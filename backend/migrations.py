@@ -0,0 +1,230 @@
+"""
+In-place schema migrations for existing databases.
+
+SQLModel's create_all only creates missing tables, so columns and indexes
+added to models.py later never reach an existing learning_assistant_v2.db.
+run_migrations() (called from create_db_and_tables at startup) diffs the models
+against the live schema and applies each step idempotently, so it is safe to
+run on every start.
+
+check_query_plans() runs EXPLAIN QUERY PLAN on the hot queries and reports any
+that still scan a whole table. From the repo root:
+
+    python -m backend.migrations apply   # run the migrations now
+    python -m backend.migrations check   # print plans, exit 1 on a full scan
+"""
+import json
+import logging
+import sys
+from sqlmodel import SQLModel, Session, select
+from sqlalchemy import inspect, text, func, tuple_
+from sqlalchemy.exc import OperationalError
+from .database import engine, is_sqlite
+from .models import (
+    User, Topic, Module, Slide, Quiz, Progress, ChatSession, ChatMessage,
+    MockAttempt, DailyActivity, Job, MockExam, MockQuestion, MockAnswer, ChatDocument,
+)
+from .mock_questions import question_rows, answer_rows, grade_attempt
+from . import doc_index
+
+logger = logging.getLogger("uvicorn.error")
+
+def add_missing_columns(conn):
+    # Columns must be nullable or have a scalar default.
+    applied = []
+    inspector = inspect(conn)
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            col_type = column.type.compile(dialect=conn.dialect)
+            ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {col_type}'
+            if column.default is not None and column.default.is_scalar:
+                ddl += f" DEFAULT {_sql_literal(column.default.arg)}"
+            conn.execute(text(ddl))
+            applied.append(f"column {table.name}.{column.name}")
+    return applied
+
+def add_missing_indexes(conn):
+    applied = []
+    inspector = inspect(conn)
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            index.create(conn, checkfirst=True)
+            applied.append(f"index {index.name}")
+    # No ANALYZE here: statistics taken while tables are still small would
+    # steer the planner toward scans as they grow.
+    return applied
+
+def migrate_mock_exam_json(conn):
+    # Moves exams/attempts saved before MockQuestion/MockAnswer existed into
+    # rows. Only rows without converted children are selected, so this is a
+    # no-op once done; the legacy JSON columns are left as they were.
+    with Session(bind=conn) as session:
+        legacy_exams = session.exec(
+            select(MockExam.id, MockExam.questions_json)
+            .where(MockExam.questions_json.not_in(["", "[]"]))
+            .where(~select(MockQuestion.id).where(MockQuestion.mock_exam_id == MockExam.id).exists())
+        ).all()
+        for exam_id, questions_json in legacy_exams:
+            session.add_all(question_rows(exam_id, _load_json_list(questions_json)))
+        session.flush()
+
+        legacy_attempts = session.exec(
+            select(MockAttempt.id, MockAttempt.mock_exam_id, MockAttempt.answers_json)
+            .where(select(MockQuestion.id).where(MockQuestion.mock_exam_id == MockAttempt.mock_exam_id).exists())
+            .where(~select(MockAnswer.id).where(MockAnswer.attempt_id == MockAttempt.id).exists())
+        ).all()
+        for attempt_id, exam_id, answers_json in legacy_attempts:
+            question_ids = dict(session.exec(
+                select(MockQuestion.position, MockQuestion.id).where(MockQuestion.mock_exam_id == exam_id)
+            ).all())
+            answers = [a for a in _load_json_list(answers_json) if isinstance(a, dict)]
+            session.add_all(answer_rows(attempt_id, question_ids, answers))
+            session.flush()
+            # The stored score stays as graded at the time; this only fills is_correct
+            grade_attempt(session, attempt_id)
+        session.flush()
+
+    applied = []
+    if legacy_exams:
+        applied.append(f"data {len(legacy_exams)} mock exams moved to mockquestion rows")
+    if legacy_attempts:
+        applied.append(f"data {len(legacy_attempts)} mock attempts moved to mockanswer rows")
+    return applied
+
+def _load_json_list(value):
+    try:
+        data = json.loads(value)
+    except (TypeError, ValueError):
+        return []
+    return data if isinstance(data, list) else []
+
+def create_chunk_index(conn):
+    # FTS5 virtual table for uploaded documents; create_all skips virtual tables
+    if not is_sqlite or inspect(conn).has_table(doc_index.FTS_TABLE):
+        return []
+    if not doc_index.create_index_table(conn):
+        logger.warning("SQLite was built without FTS5; chat uploads will be inlined instead of indexed")
+        return []
+    return [f"table {doc_index.FTS_TABLE}"]
+
+MIGRATIONS = [add_missing_columns, add_missing_indexes, migrate_mock_exam_json, create_chunk_index]
+
+def run_migrations():
+    applied = []
+    with engine.begin() as conn:
+        for step in MIGRATIONS:
+            applied += step(conn)
+    for change in applied:
+        logger.info("Migration applied: %s", change)
+    return applied
+
+def _sql_literal(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+def hot_queries():
+    """The per-request query shapes from the routers, with placeholder ids."""
+    user_id, topic_id, module_id, session_id = 1, 1, 1, 1
+    return {
+        "user by username (login, auth)": select(User.id).where(User.username == "someone"),
+        "topics of user": select(Topic.id).where(Topic.user_id == user_id).order_by(Topic.id),
+        "modules of topic": select(Module.id).where(Module.topic_id == topic_id),
+        "next module in topic": select(Module.id)
+            .where(Module.topic_id == topic_id, Module.order_index > 1)
+            .order_by(Module.order_index).limit(1),
+        "slides of module": select(Slide.id).where(Slide.module_id == module_id).order_by(Slide.order_index),
+        "quizzes of module": select(Quiz.id).where(Quiz.module_id == module_id),
+        "progress of user+module": select(Progress.id).where(Progress.module_id == module_id, Progress.user_id == user_id),
+        "completed per topic": select(Progress.topic_id, func.count(Progress.id))
+            .where(Progress.user_id == user_id, Progress.is_completed).group_by(Progress.topic_id),
+        "modules per user topic": select(Module.topic_id, func.count(Module.id))
+            .join(Topic, Topic.id == Module.topic_id).where(Topic.user_id == user_id).group_by(Module.topic_id),
+        "last completed module": select(Progress.topic_id)
+            .where(Progress.user_id == user_id, Progress.completed_at != None)
+            .order_by(Progress.completed_at.desc(), Progress.id).limit(1),
+        "progress of topic (delete)": select(Progress.id).where(Progress.topic_id == topic_id),
+        "chat sessions page": select(ChatSession.id)
+            .where(ChatSession.user_id == user_id, ChatSession.id < 100).order_by(ChatSession.id.desc()).limit(50),
+        "messages of chat session": select(ChatMessage.id)
+            .where(ChatMessage.session_id == session_id, ChatMessage.id > 0).order_by(ChatMessage.id),
+        "chat messages page": select(ChatMessage.id)
+            .where(ChatMessage.session_id == session_id, ChatMessage.id < 100).order_by(ChatMessage.id.desc()).limit(50),
+        "questions of exam": select(MockQuestion.id)
+            .where(MockQuestion.mock_exam_id == 1).order_by(MockQuestion.position),
+        "answers of attempt": select(MockAnswer.id).where(MockAnswer.attempt_id == 1),
+        "answers to question (analytics)": select(func.count(MockAnswer.id))
+            .where(MockAnswer.question_id == 1, MockAnswer.is_correct),
+        "exam history page": select(MockAttempt.id, MockExam.topic_name)
+            .outerjoin(MockExam, MockExam.id == MockAttempt.mock_exam_id)
+            .where(MockAttempt.user_id == user_id)
+            .where(tuple_(MockAttempt.created_at, MockAttempt.id) < tuple_(
+                select(MockAttempt.created_at).where(MockAttempt.id == 100).scalar_subquery(), 100))
+            .order_by(MockAttempt.created_at.desc(), MockAttempt.id.desc()).limit(50),
+        "daily activity range": select(DailyActivity.total)
+            .where(DailyActivity.user_id == user_id, DailyActivity.day >= "2024-01-01", DailyActivity.day <= "2024-12-31"),
+        "jobs of topic (delete)": select(Job.id).where(Job.topic_id == topic_id),
+        "documents of chat session": select(ChatDocument.id)
+            .where(ChatDocument.session_id == session_id, ChatDocument.content_hash == "abc"),
+    }
+
+def _full_scans(plan_details):
+    # "SCAN t" / "SCAN t USING COVERING INDEX ix" read every row of t;
+    # "SEARCH t USING INDEX ..." is what we want.
+    return [d for d in plan_details if d.startswith("SCAN ") and not d.startswith("SCAN CONSTANT")]
+
+def check_query_plans():
+    """Returns {name: (plan lines, problems)} for every hot query."""
+    results = {}
+    with engine.connect() as conn:
+        for name, stmt in hot_queries().items():
+            compiled = stmt.compile(dialect=engine.dialect)
+            params = tuple(compiled.params[key] for key in compiled.positiontup)
+            try:
+                rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + compiled.string, params).all()
+            except OperationalError as e:
+                # e.g. a table or column the migrations have not added yet
+                results[name] = ([], [f"not checked: {e.orig}"])
+                continue
+            details = [row[-1] for row in rows]
+            results[name] = (details, _full_scans(details))
+    return results
+
+def log_query_plan_warnings():
+    if not is_sqlite:
+        return
+    for name, (details, scans) in check_query_plans().items():
+        if scans:
+            logger.warning("Query '%s' is not index-backed: %s", name, "; ".join(scans))
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    if command == "apply":
+        SQLModel.metadata.create_all(engine)
+        changes = run_migrations()
+        print("\n".join(changes) if changes else "Schema already up to date")
+    elif command == "check":
+        if not is_sqlite:
+            sys.exit("EXPLAIN QUERY PLAN checks only run against SQLite")
+        failed = 0
+        for name, (details, scans) in check_query_plans().items():
+            print(f"{'FULL SCAN' if scans else 'ok':<10}{name}")
+            for detail in details or scans:
+                print(f"{'':<10}  {detail}")
+            failed += bool(scans)
+        print(f"{failed} of {len(hot_queries())} hot queries do a full scan")
+        sys.exit(1 if failed else 0)
+    else:
+        sys.exit("usage: python -m backend.migrations [apply|check]")
@@ -0,0 +1,123 @@
+"""
+Row-per-question storage for mock exams.
+
+Questions live in MockQuestion and submitted answers in MockAnswer, so grading
+is one UPDATE joining the two tables and review/analytics are plain queries
+instead of json.loads over every exam and attempt.
+"""
+import json
+from typing import Any, Dict, List, Optional
+from sqlmodel import Session, select
+from sqlalchemy import update, case, func, and_
+from .models import MockQuestion, MockAnswer
+
+PASS_RATIO = 0.75
+# Coding answers are not executed; anything longer than this counts as an attempt
+CODE_ANSWER_MIN_LENGTH = 10
+
+def normalize_answer(value) -> Optional[str]:
+    if value is None:
+        return None
+    return str(value).lower().strip()
+
+def question_rows(exam_id: int, questions: List[Dict[str, Any]]) -> List[MockQuestion]:
+    rows = []
+    for position, q in enumerate(questions):
+        options = q.get("options")
+        correct = q.get("correct_answer")
+        rows.append(MockQuestion(
+            mock_exam_id=exam_id,
+            position=position,
+            type=q.get("type", "mcq"),
+            question=str(q.get("question", "")),
+            options=json.dumps(options) if options is not None else None,
+            correct_answer=str(correct) if correct is not None else None,
+            normalized_answer=normalize_answer(correct),
+            explanation=q.get("explanation"),
+            test_case_input=q.get("test_case_input"),
+            test_case_output=q.get("test_case_output"),
+        ))
+    return rows
+
+def question_dict(q: MockQuestion) -> Dict[str, Any]:
+    """The question as the client knows it (the shape the model generated)."""
+    data = {
+        "type": q.type,
+        "question": q.question,
+        "options": json.loads(q.options) if q.options is not None else None,
+        "correct_answer": q.correct_answer,
+        "explanation": q.explanation,
+        "test_case_input": q.test_case_input,
+        "test_case_output": q.test_case_output,
+    }
+    return {k: v for k, v in data.items() if v is not None}
+
+def get_questions(session: Session, exam_id: int) -> List[MockQuestion]:
+    return session.exec(
+        select(MockQuestion).where(MockQuestion.mock_exam_id == exam_id).order_by(MockQuestion.position)
+    ).all()
+
+def answer_rows(attempt_id: int, question_ids: Dict[int, int], answers: List[Dict[str, Any]]) -> List[MockAnswer]:
+    """
+    One row per exam question; `question_ids` maps position -> MockQuestion.id.
+    Unanswered questions get a NULL answer so they count as missed, unknown
+    positions are ignored and the last answer per question wins.
+    """
+    by_position = {}
+    for ans_obj in answers:
+        position = ans_obj.get("question_index")
+        if isinstance(position, int) and position in question_ids:
+            by_position[position] = ans_obj.get("answer")
+    rows = []
+    for position, question_id in sorted(question_ids.items()):
+        answer = by_position.get(position)
+        rows.append(MockAnswer(
+            attempt_id=attempt_id,
+            question_id=question_id,
+            position=position,
+            answer=str(answer) if answer is not None else None,
+            normalized_answer=normalize_answer(answer),
+        ))
+    return rows
+
+def grade_attempt(session: Session, attempt_id: int) -> int:
+    """Marks each answer of the attempt correct or not in SQL and returns the score."""
+    is_correct = case(
+        (MockQuestion.type.in_(["mcq", "boolean"]),
+         func.coalesce(MockAnswer.normalized_answer == MockQuestion.normalized_answer, False)),
+        (MockQuestion.type == "code", func.coalesce(func.length(MockAnswer.answer) > CODE_ANSWER_MIN_LENGTH, False)),
+        else_=False,
+    )
+    session.execute(
+        update(MockAnswer)
+        .where(MockAnswer.attempt_id == attempt_id, MockAnswer.question_id == MockQuestion.id)
+        .values(is_correct=is_correct)
+        .execution_options(synchronize_session=False)
+    )
+    return session.exec(
+        select(func.count(MockAnswer.id)).where(MockAnswer.attempt_id == attempt_id, MockAnswer.is_correct)
+    ).one()
+
+def is_passed(score: int, total: int) -> bool:
+    return (score / total) >= PASS_RATIO if total > 0 else False
+
+def review_rows(session: Session, exam_id: int, attempt_id: int):
+    """(question, answer or None) for every question of the exam, in order."""
+    return session.exec(
+        select(MockQuestion, MockAnswer)
+        .outerjoin(MockAnswer, and_(MockAnswer.question_id == MockQuestion.id, MockAnswer.attempt_id == attempt_id))
+        .where(MockQuestion.mock_exam_id == exam_id)
+        .order_by(MockQuestion.position)
+    ).all()
+
+def question_miss_stats(session: Session, exam_id: int):
+    """Per-question attempt and miss counts for an exam, most missed first."""
+    attempts = func.count(MockAnswer.id)
+    missed = attempts - func.coalesce(func.sum(case((MockAnswer.is_correct, 1), else_=0)), 0)
+    return session.exec(
+        select(MockQuestion.position, MockQuestion.question, MockQuestion.type, attempts, missed)
+        .outerjoin(MockAnswer, MockAnswer.question_id == MockQuestion.id)
+        .where(MockQuestion.mock_exam_id == exam_id)
+        .group_by(MockQuestion.id)
+        .order_by(missed.desc(), MockQuestion.position)
+    ).all()
@@ -1,6 +1,7 @@
 from typing import Optional, List
 from sqlmodel import Field, SQLModel, Relationship
-from datetime import datetime
+from sqlalchemy import Index
+from datetime import datetime, date
 
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -17,14 +18,18 @@ class Topic(SQLModel, table=True):
     duration_days: int
     description: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    status: str = Field(default="ready") # generating, ready, failed
     
-    user_id: int = Field(foreign_key="user.id")
+    user_id: int = Field(foreign_key="user.id", index=True)
     user: User = Relationship(back_populates="topics")
     
     modules: List["Module"] = Relationship(back_populates="topic")
     progress: List["Progress"] = Relationship(back_populates="topic")
 
 class Module(SQLModel, table=True):
+    # Indexes below match the hot query shapes; migrations.py adds them to
+    # existing databases and checks the plans.
+    __table_args__ = (Index("ix_module_topic_order", "topic_id", "order_index"),)
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str
     description: str
@@ -33,6 +38,10 @@ class Module(SQLModel, table=True):
     topic_id: int = Field(foreign_key="topic.id")
     topic: Topic = Relationship(back_populates="modules")
     
+    # Guards content generation across requests and workers, see content_generation.py
+    content_status: Optional[str] = Field(default=None) # None, "generating" or "ready"
+    generation_started_at: Optional[datetime] = Field(default=None)
+    
     slides: List["Slide"] = Relationship(back_populates="module")
     quizzes: List["Quiz"] = Relationship(back_populates="module")
     
@@ -40,6 +49,7 @@ class Module(SQLModel, table=True):
     # but we will track it in Progress table generally.
 
 class Slide(SQLModel, table=True):
+    __table_args__ = (Index("ix_slide_module_order", "module_id", "order_index"),)
     id: Optional[int] = Field(default=None, primary_key=True)
     content: str # Markdown content
     order_index: int
@@ -53,10 +63,16 @@ class Quiz(SQLModel, table=True):
     options: str  # Stored as JSON string list ["A", "B", "C", "D"]
     correct_answer: str
     
-    module_id: int = Field(foreign_key="module.id")
+    module_id: int = Field(foreign_key="module.id", index=True)
     module: Module = Relationship(back_populates="quizzes")
 
 class Progress(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_progress_user_module", "user_id", "module_id"),
+        Index("ix_progress_user_topic", "user_id", "topic_id", "is_completed"),
+        Index("ix_progress_user_completed_at", "user_id", "completed_at"),
+        Index("ix_progress_topic", "topic_id"),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
     topic_id: int = Field(foreign_key="topic.id")
@@ -69,14 +85,19 @@ class Progress(SQLModel, table=True):
     # We can add relationships to User and Module if needed for deep queries
 
 class ChatSession(SQLModel, table=True):
+    __table_args__ = (Index("ix_chatsession_user_id", "user_id", "id"),)
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
     title: str = Field(default="New Chat")
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    # Rolling summary of older turns, see chat_context.py
+    summary: Optional[str] = Field(default=None)
+    summarized_until_id: Optional[int] = Field(default=None) # last ChatMessage.id folded into summary
     
     messages: List["ChatMessage"] = Relationship(back_populates="session")
 
 class ChatMessage(SQLModel, table=True):
+    __table_args__ = (Index("ix_chatmessage_session_id", "session_id", "id"),)
     id: Optional[int] = Field(default=None, primary_key=True)
     session_id: int = Field(foreign_key="chatsession.id")
     role: str # user, assistant, system
@@ -85,20 +106,121 @@ class ChatMessage(SQLModel, table=True):
     
     session: ChatSession = Relationship(back_populates="messages")
 
+class ChatDocument(SQLModel, table=True):
+    # A file attached to a chat; its text is chunked into the FTS index, see doc_index.py
+    __table_args__ = (Index("ix_chatdocument_session_hash", "session_id", "content_hash"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    session_id: int = Field(foreign_key="chatsession.id")
+    filename: str
+    content_hash: str # sha256 of the uploaded bytes
+    char_count: int = Field(default=0)
+    chunk_count: int = Field(default=0)
+    truncated: bool = Field(default=False)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
 class MockExam(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: int = Field(foreign_key="user.id")
+    user_id: int = Field(foreign_key="user.id", index=True)
     topic_name: str
     difficulty: str
-    questions_json: str # JSON string of list of questions
+    questions_json: str = Field(default="[]") # legacy, questions now live in MockQuestion
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class MockQuestion(SQLModel, table=True):
+    # One row per exam question, see mock_questions.py
+    __table_args__ = (Index("ix_mockquestion_exam_position", "mock_exam_id", "position", unique=True),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    mock_exam_id: int = Field(foreign_key="mockexam.id")
+    position: int # question_index used by the client
+    type: str = Field(default="mcq") # mcq, boolean, code
+    question: str
+    options: Optional[str] = Field(default=None) # JSON string list, like Quiz.options
+    correct_answer: Optional[str] = Field(default=None)
+    normalized_answer: Optional[str] = Field(default=None) # correct_answer lowercased and stripped, for SQL grading
+    explanation: Optional[str] = Field(default=None)
+    test_case_input: Optional[str] = Field(default=None)
+    test_case_output: Optional[str] = Field(default=None)
+
 class MockAttempt(SQLModel, table=True):
+    __table_args__ = (Index("ix_mockattempt_user_recent", "user_id", "created_at", "id"),)
     id: Optional[int] = Field(default=None, primary_key=True)
     mock_exam_id: int = Field(foreign_key="mockexam.id")
     user_id: int = Field(foreign_key="user.id")
     score: int
     total_questions: int
-    answers_json: str # JSON string of user answers
+    answers_json: str = Field(default="[]") # legacy, answers now live in MockAnswer
     passed: bool
     created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class MockAnswer(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_mockanswer_attempt_position", "attempt_id", "position", unique=True),
+        Index("ix_mockanswer_question_correct", "question_id", "is_correct"),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    attempt_id: int = Field(foreign_key="mockattempt.id")
+    question_id: int = Field(foreign_key="mockquestion.id")
+    position: int
+    answer: Optional[str] = Field(default=None)
+    normalized_answer: Optional[str] = Field(default=None)
+    is_correct: bool = Field(default=False) # set by the grading UPDATE
+
+class ActivityEvent(SQLModel, table=True):
+    # Append-only log of learning activity, see activity.py
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    kind: str # quiz, mock_exam
+    ref_id: Optional[int] = Field(default=None) # module id or mock attempt id (no FK, outlives deletes)
+    score: Optional[int] = Field(default=None)
+    passed: Optional[bool] = Field(default=None)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class DailyActivity(SQLModel, table=True):
+    # Per-user per-day rollup of ActivityEvent
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    day: date = Field(primary_key=True)
+    quiz_count: int = Field(default=0)
+    mock_count: int = Field(default=0)
+    total: int = Field(default=0)
+
+class UserStats(SQLModel, table=True):
+    # Dashboard totals kept up to date on every write, see user_stats.py
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    total_topics: int = Field(default=0)
+    total_modules: int = Field(default=0)
+    modules_completed: int = Field(default=0)
+    topics_started: int = Field(default=0)
+    topics_done: int = Field(default=0)
+    score_sum: int = Field(default=0) # over progress rows with score > 0
+    score_count: int = Field(default=0)
+    progress_xp: int = Field(default=0)
+    mock_taken: int = Field(default=0)
+    mock_passed: int = Field(default=0)
+    mock_xp: int = Field(default=0)
+    streak_days: int = Field(default=0) # length of the run of active days ending at last_active_date
+    last_active_date: Optional[date] = Field(default=None)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class Job(SQLModel, table=True):
+    # Background work tracked for status polling, see jobs.py
+    id: str = Field(primary_key=True) # uuid4 hex
+    kind: str # e.g. "roadmap"
+    user_id: int = Field(foreign_key="user.id")
+    topic_id: Optional[int] = Field(default=None, foreign_key="topic.id", index=True)
+    status: str = Field(default="queued", index=True) # queued, running, done, failed
+    error: Optional[str] = Field(default=None)
+    # Sub-task counts for jobs that fan out, e.g. one per module for "materialize"
+    progress_total: Optional[int] = Field(default=None)
+    progress_done: int = Field(default=0)
+    progress_failed: int = Field(default=0)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = Field(default=None)
+
+class LLMCacheEntry(SQLModel, table=True):
+    # Content-addressed cache of LLM generations, see llm_cache.py
+    key: str = Field(primary_key=True) # sha256 of the normalized request + prompt template
+    kind: str
+    value: str # JSON result
+    size: int
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    last_accessed: datetime = Field(default_factory=datetime.utcnow, index=True)
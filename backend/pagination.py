@@ -0,0 +1,43 @@
+from typing import Optional
+from fastapi import HTTPException, Query
+from sqlmodel import select
+from sqlalchemy import tuple_
+
+# Lists used to be unbounded; callers that pass no limit get this many rows
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def page_limit(limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE)) -> int:
+    return limit or DEFAULT_PAGE_SIZE
+
+def keyset_page(session, stmt, id_col, before: Optional[int], after: Optional[int], limit: int, newest_first: bool, sort_col=None):
+    """
+    Applies an id cursor to `stmt` and returns one page of rows.
+
+    before=<id> pages towards older rows, after=<id> towards newer ones, and
+    with neither the newest `limit` rows are returned. Rows come back newest
+    first or oldest first per `newest_first`, whichever way the cursor moved.
+    Filtering and ordering on the id keeps every page an index range scan.
+
+    With `sort_col` (a column of the id's table, e.g. created_at) rows are
+    ordered by (sort_col, id) and the cursor row's sort value is looked up by
+    id, so the client still only passes ids.
+    """
+    if before is not None and after is not None:
+        raise HTTPException(status_code=400, detail="Pass either before or after, not both")
+    keys = [id_col] if sort_col is None else [sort_col, id_col]
+    if after is not None:
+        rows = session.exec(stmt.where(_past_cursor(keys, after, newer=True)).order_by(*keys).limit(limit)).all()
+        return list(reversed(rows)) if newest_first else list(rows)
+    if before is not None:
+        stmt = stmt.where(_past_cursor(keys, before, newer=False))
+    rows = session.exec(stmt.order_by(*[k.desc() for k in keys]).limit(limit)).all()
+    return list(rows) if newest_first else list(reversed(rows))
+
+def _past_cursor(keys, cursor_id: int, newer: bool):
+    id_col = keys[-1]
+    if len(keys) == 1:
+        return id_col > cursor_id if newer else id_col < cursor_id
+    # Row-value comparison so the index on (..., sort_col, id) can seek to the cursor
+    cursor_key = tuple_(select(keys[0]).where(id_col == cursor_id).scalar_subquery(), cursor_id)
+    return tuple_(*keys) > cursor_key if newer else tuple_(*keys) < cursor_key
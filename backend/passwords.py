@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+# bcrypt work factor for new hashes. Existing hashes with a different cost are
+# rehashed transparently on the next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# Worker processes dedicated to bcrypt, so a burst of logins cannot starve the
+# shared threadpool that serves every other sync endpoint
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", max(1, min(4, os.cpu_count() or 1))))
+# Hash/verify calls allowed in flight (running + queued) before rejecting with 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+logger = logging.getLogger("uvicorn.error")
+
+# These run inside the worker processes
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify(password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(password, hashed_password)
+
+def bcrypt_rounds(hashed_password: str) -> Optional[int]:
+    # "$2b$12$<salt+digest>"
+    try:
+        return int(hashed_password.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+def needs_rehash(hashed_password: str) -> bool:
+    return bcrypt_rounds(hashed_password) != BCRYPT_ROUNDS
+
+class PasswordHasher:
+    """
+    Bounded process pool for bcrypt. Callers await the result; once
+    PASSWORD_HASH_MAX_PENDING calls are outstanding new ones fail fast with 503
+    instead of queueing without limit.
+    """
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self.pool: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        # spawn: forking a process that already runs threads and an event loop is unsafe
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        logger.info("Password hashing: %d worker processes, bcrypt rounds=%d, max pending=%d",
+                    self.workers, BCRYPT_ROUNDS, self.max_pending)
+
+    def stop(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    async def _run(self, fn, *args):
+        if self.pool is None:
+            self.start()
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many sign-ins in progress, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(_verify, password, hashed_password)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+        }
+
+hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
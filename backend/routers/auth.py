@@ -2,10 +2,12 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlmodel import Session
 from datetime import timedelta
-from ..database import get_session
+from ..database import get_session, run_db
 from ..models import User
-from ..auth import get_password_hash, verify_password, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, get_current_user
+from ..auth import get_password_hash_async, verify_password_async, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, get_current_user, get_current_admin
 from pydantic import BaseModel
+from ..user_cache import get_cache_stats
+from ..passwords import needs_rehash, hasher
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -18,38 +20,47 @@ class Token(BaseModel):
     access_token: str
     token_type: str
 
-@router.post("/signup", response_model=Token)
-def signup(user: UserCreate, session: Session = Depends(get_session)):
-    db_user = session.query(User).filter(User.username == user.username).first()
-    if db_user:
-        raise HTTPException(status_code=400, detail="Username already registered")
-    
-    hashed_pwd = get_password_hash(user.password)
-    new_user = User(username=user.username, email=user.email, hashed_password=hashed_pwd)
-    session.add(new_user)
+def _get_user_by_username(session: Session, username: str):
+    return session.query(User).filter(User.username == username).first()
+
+def _save(session: Session, obj):
+    session.add(obj)
     session.commit()
-    session.refresh(new_user)
-    
+    session.refresh(obj)
+    return obj
+
+def _token_for(user: User):
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": new_user.username}, expires_delta=access_token_expires
+        data={"sub": user.username}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
+@router.post("/signup", response_model=Token)
+async def signup(user: UserCreate, session: Session = Depends(get_session)):
+    db_user = await run_db(_get_user_by_username, session, user.username)
+    if db_user:
+        raise HTTPException(status_code=400, detail="Username already registered")
+    
+    hashed_pwd = await get_password_hash_async(user.password)
+    new_user = User(username=user.username, email=user.email, hashed_password=hashed_pwd)
+    new_user = await run_db(_save, session, new_user)
+    return _token_for(new_user)
+
 @router.post("/token", response_model=Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), session: Session = Depends(get_session)):
-    user = session.query(User).filter(User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), session: Session = Depends(get_session)):
+    user = await run_db(_get_user_by_username, session, form_data.username)
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    # Upgrade hashes made with an older BCRYPT_ROUNDS while we have the plaintext
+    if needs_rehash(user.hashed_password):
+        user.hashed_password = await get_password_hash_async(form_data.password)
+        await run_db(_save, session, user)
+    return _token_for(user)
 
 class UserRead(BaseModel):
     id: int
@@ -65,22 +76,32 @@ class UserUpdate(BaseModel):
 
 @router.put("/me", response_model=UserRead)
 def update_user_me(user_update: UserUpdate, current_user: User = Depends(get_current_user), session: Session = Depends(get_session)):
-    current_user.email = user_update.email
-    session.add(current_user)
+    # current_user may be a cached snapshot, so write through a fresh row
+    user = session.get(User, current_user.id)
+    user.email = user_update.email
+    session.add(user)
     session.commit()
-    session.refresh(current_user)
-    return current_user
+    session.refresh(user)
+    return user
 
 class PasswordChange(BaseModel):
     current_password: str
     new_password: str
 
 @router.post("/change-password")
-def change_password(pwd_change: PasswordChange, current_user: User = Depends(get_current_user), session: Session = Depends(get_session)):
-    if not verify_password(pwd_change.current_password, current_user.hashed_password):
+async def change_password(pwd_change: PasswordChange, current_user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+    user = await run_db(session.get, User, current_user.id)
+    if not await verify_password_async(pwd_change.current_password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect current password")
     
-    current_user.hashed_password = get_password_hash(pwd_change.new_password)
-    session.add(current_user)
-    session.commit()
+    user.hashed_password = await get_password_hash_async(pwd_change.new_password)
+    await run_db(_save, session, user)
     return {"message": "Password updated successfully"}
+
+@router.get("/hash-stats")
+def password_hash_stats(admin: User = Depends(get_current_admin)):
+    return hasher.stats()
+
+@router.get("/cache-stats")
+def user_cache_stats(admin: User = Depends(get_current_admin)):
+    return get_cache_stats()
@@ -1,21 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
 from typing import List, Optional
 from datetime import datetime
+from contextlib import aclosing
 from pydantic import BaseModel
-import io
+import anyio
+import asyncio
+import json
 import logging
 
-from ..database import get_session
+from ..database import get_session, engine, run_db
 from ..models import User, ChatSession, ChatMessage
 from ..auth import get_current_user
-from ..ai_service import generate_chat_response
-
-# Try importing pypdf
-try:
-    from pypdf import PdfReader
-except ImportError:
-    PdfReader = None
+from ..chat_context import build_ai_context
+from ..pagination import page_limit, keyset_page
+from ..ingestion import read_upload, extract_content, UPLOAD_MAX_CHARS
+from .. import doc_index
+from ..ai_service import generate_chat_response, stream_chat_response, generate_chat_title, CHAT_FALLBACK_MESSAGE
+from ..llm_gateway import LLMUnavailable
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
@@ -37,10 +41,16 @@ class ChatMessageRead(BaseModel):
 # --- Endpoints ---
 
 @router.get("/sessions", response_model=List[ChatSessionRead])
-def get_sessions(user: User = Depends(get_current_user), session: Session = Depends(get_session)):
-    stmt = select(ChatSession).where(ChatSession.user_id == user.id).order_by(ChatSession.created_at.desc())
-    results = session.exec(stmt).all()
-    return results
+def get_sessions(
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = Depends(page_limit),
+    user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    # Newest first; pass before=<last id> to load older sessions
+    stmt = select(ChatSession).where(ChatSession.user_id == user.id)
+    return keyset_page(session, stmt, ChatSession.id, before, after, limit, newest_first=True)
 
 @router.post("/sessions", response_model=ChatSessionRead)
 def create_session(user: User = Depends(get_current_user), session: Session = Depends(get_session)):
@@ -51,83 +61,192 @@ def create_session(user: User = Depends(get_current_user), session: Session = De
     return new_session
 
 @router.get("/sessions/{session_id}", response_model=List[ChatMessageRead])
-def get_messages(session_id: int, user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+def get_messages(
+    session_id: int,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = Depends(page_limit),
+    user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
     chat_session = session.get(ChatSession, session_id)
     if not chat_session or chat_session.user_id != user.id:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    # Sort messages by timestamp
-    return sorted(chat_session.messages, key=lambda m: m.timestamp)
+    # Latest messages in chronological order; before=<first id> loads older ones
+    stmt = select(ChatMessage).where(ChatMessage.session_id == session_id)
+    return keyset_page(session, stmt, ChatMessage.id, before, after, limit, newest_first=False)
 
-@router.post("/sessions/{session_id}/messages", response_model=ChatMessageRead)
-async def send_message(session_id: int, message: ChatMessageCreate, user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+def _get_owned_chat(session: Session, session_id: int, user: User):
     chat_session = session.get(ChatSession, session_id)
     if not chat_session or chat_session.user_id != user.id:
         raise HTTPException(status_code=404, detail="Session not found")
+    return chat_session
+
+def _save(session: Session, obj):
+    session.add(obj)
+    session.commit()
+    session.refresh(obj)
+    return obj
+
+@router.post("/sessions/{session_id}/messages", response_model=ChatMessageRead)
+async def send_message(session_id: int, message: ChatMessageCreate, user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+    chat_session = await run_db(_get_owned_chat, session, session_id, user)
 
     # 1. Save User Message
     user_msg = ChatMessage(session_id=session_id, role="user", content=message.content)
-    session.add(user_msg)
-    session.commit()
-    session.refresh(user_msg)
+    await run_db(_save, session, user_msg)
 
     # 2. Update Title if it's the first message and title is default
     if chat_session.title == "New Chat":
         # Generate title using AI
-        from ..ai_service import generate_chat_title
         new_title = await generate_chat_title(message.content)
         chat_session.title = new_title
-        session.add(chat_session)
-        session.commit()
-        session.refresh(chat_session)
+        await run_db(_save, session, chat_session)
 
     # 3. Build Context for AI
-    # Fetch all previous messages to maintain context history
-    # Limit to last 10-20 to avoid token limits? For now, let's take last 20.
-    all_msgs = sorted(chat_session.messages, key=lambda m: m.timestamp)
-    # We need to construct the list for the AI service
-    ai_context = [{"role": "system", "content": "You are a helpful and encouraging educational AI mentor."}]
-    for m in all_msgs:
-        ai_context.append({"role": m.role, "content": m.content})
+    ai_context = await build_ai_context(chat_session, session)
     
-    # 4. Generate AI Response
+    # 4. Generate AI Response. On failure LLMUnavailable becomes a 503; the
+    # user's message is kept so it can be retried
     ai_response_text = await generate_chat_response(ai_context)
 
     # 5. Save AI Message
     ai_msg = ChatMessage(session_id=session_id, role="assistant", content=ai_response_text)
-    session.add(ai_msg)
-    session.commit()
-    session.refresh(ai_msg)
+    return await run_db(_save, session, ai_msg)
+
+def _save_stream_result(session_id: int, title: Optional[str], content: str):
+    # The request-scoped session may already be closed once streaming starts
+    ai_msg = None
+    with Session(engine) as db:
+        if title:
+            db_chat = db.get(ChatSession, session_id)
+            if db_chat:
+                db_chat.title = title
+                db.add(db_chat)
+        if content:
+            ai_msg = ChatMessage(session_id=session_id, role="assistant", content=content)
+            db.add(ai_msg)
+        db.commit()
+        if ai_msg:
+            db.refresh(ai_msg)
+            return ChatMessageRead(id=ai_msg.id, role=ai_msg.role, content=ai_msg.content, timestamp=ai_msg.timestamp)
+    return None
+
+@router.post("/sessions/{session_id}/messages/stream")
+async def send_message_stream(session_id: int, message: ChatMessageCreate, request: Request, user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+    """
+    Streaming variant of send_message. Responds with NDJSON lines:
+    {"type": "delta", "content": "..."} for each chunk from the model, then
+    {"type": "done", "message": {...}} once the assistant message is saved.
+    If the model fails before its first chunk the request gets a 503 like
+    send_message; if it fails mid-stream the last line is
+    {"type": "error", "detail": "..."}. A reply cut short by a model failure or
+    a client disconnect is not saved.
+    """
+    chat_session = await run_db(_get_owned_chat, session, session_id, user)
 
-    return ai_msg
+    user_msg = ChatMessage(session_id=session_id, role="user", content=message.content)
+    await run_db(_save, session, user_msg)
+
+    # Title generation runs alongside the reply so it doesn't delay the first token
+    title_task = None
+    if chat_session.title == "New Chat":
+        title_task = asyncio.create_task(generate_chat_title(message.content))
+
+    ai_context = await build_ai_context(chat_session, session)
+
+    # Wait for the first chunk before answering, so an unavailable model is
+    # still reported with a status code rather than inside a 200 stream
+    deltas = stream_chat_response(ai_context)
+    try:
+        first_delta = await anext(deltas, None)
+    except BaseException:
+        await deltas.aclose()
+        if title_task:
+            title_task.cancel()
+        raise
+
+    async def event_stream():
+        chunks = []
+        new_title = None
+        ai_msg = None
+        completed = False
+        try:
+            try:
+                async with aclosing(deltas):
+                    if first_delta is not None:
+                        chunks.append(first_delta)
+                        yield json.dumps({"type": "delta", "content": first_delta}) + "\n"
+                    async for delta in deltas:
+                        if await request.is_disconnected():
+                            break
+                        chunks.append(delta)
+                        yield json.dumps({"type": "delta", "content": delta}) + "\n"
+                    else:
+                        completed = True
+            except LLMUnavailable:
+                yield json.dumps({"type": "error", "detail": CHAT_FALLBACK_MESSAGE}) + "\n"
+            new_title = await title_task if title_task else None
+        finally:
+            if title_task and not title_task.done():
+                title_task.cancel()
+            # A reply cut off by a model failure or a disconnect is not saved
+            # as if it were complete; the user's message stays to be retried
+            content = "".join(chunks) if completed else ""
+            if content or new_title:
+                # Shielded so a finished reply is still saved when the client
+                # disconnects while the title is awaited
+                with anyio.CancelScope(shield=True):
+                    ai_msg = await run_db(_save_stream_result, session_id, new_title, content)
+
+        if ai_msg:
+            yield json.dumps({"type": "done", "title": new_title, "message": jsonable_encoder(ai_msg)}) + "\n"
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+def _index_upload(session: Session, session_id: int, user: User, filename: str, result: dict):
+    _get_owned_chat(session, session_id, user)
+    return doc_index.index_document(session, session_id, filename, result["content_hash"], result["content"], result["truncated"])
 
 @router.post("/upload")
-async def upload_file(file: UploadFile = File(...), user: User = Depends(get_current_user)):
-    content = ""
+async def upload_file(
+    file: UploadFile = File(...),
+    session_id: Optional[int] = Form(None),
+    user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    # With a session_id the whole file is indexed for that chat and only the
+    # passages relevant to each question are sent to the model; without one
+    # (or without FTS5) the truncated text is returned to be inlined.
+    indexed = session_id is not None and doc_index.index_available()
     try:
-        file_bytes = await file.read()
-        
-        if file.filename.lower().endswith(".pdf"):
-            if PdfReader:
-                reader = PdfReader(io.BytesIO(file_bytes))
-                for page in reader.pages:
-                    content += page.extract_text() + "\n"
-            else:
-                return {"text": "[Server] PDF file detected but pypdf is not installed. Please upload text files."}
-        else:
-            # Assume text/code file
-            content = file_bytes.decode("utf-8", errors="ignore")
-            
-        # Limit content length to avoid exploding context?
-        # Let's truncate if huge, e.g. 10k chars
-        if len(content) > 20000:
-            content = content[:20000] + "\n...[truncated]"
+        if indexed:
+            await run_db(_get_owned_chat, session, session_id, user)
+        data, content_hash = await read_upload(file)
+        max_chars = doc_index.DOC_INDEX_MAX_CHARS if indexed else UPLOAD_MAX_CHARS
+        result = await extract_content(file.filename, data, content_hash, max_chars)
+        if result is None:
+            return {"text": "[Server] PDF file detected but pypdf is not installed. Please upload text files."}
 
+        content = result["content"]
         if not content.strip():
             return {"text": "[Server] Useable text could not be extracted from this file."}
 
+        if indexed:
+            doc = await run_db(_index_upload, session, session_id, user, file.filename, result)
+            note = f"[Attached to this chat: {doc.char_count} characters in {doc.chunk_count} sections"
+            if doc.truncated:
+                note += ", only the beginning of the file was read"
+            note += ". Relevant passages are looked up for each question.]"
+            return {"text": note, "document_id": doc.id, "chunks": doc.chunk_count}
+
+        if result["truncated"]:
+            content += "\n...[truncated]"
         return {"text": f"Context from file '{file.filename}':\n\n{content}"}
 
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"File upload error: {e}")
         raise HTTPException(status_code=500, detail="Failed to process file")
@@ -143,6 +262,7 @@ def delete_session(session_id: int, user: User = Depends(get_current_user), sess
     # but to be safe/explicit let's delete messages first if cascade isn't configured in DB
     for msg in chat_session.messages:
         session.delete(msg)
+    doc_index.delete_session_documents(session, session_id)
         
     session.delete(chat_session)
     session.commit()
@@ -1,10 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session
 from typing import List, Optional
-from ..database import get_session
-from ..models import User, Module, Slide, Quiz, Progress, Topic
-from ..auth import get_current_user
-from ..ai_service import generate_module_content_ai
+from ..database import get_session, run_db
+from ..models import User, Module, Quiz, Progress, Topic
+from ..auth import get_current_user, get_current_admin
+from ..user_stats import record_quiz_result
+from ..activity import record_activity
+from ..content_generation import ensure_module_content, schedule_prefetch, record_module_open, get_prefetch_stats
 from pydantic import BaseModel
 import json
 from datetime import datetime
@@ -37,8 +39,7 @@ class QuizSubmitItem(BaseModel):
 class QuizSubmit(BaseModel):
     answers: List[QuizSubmitItem]
 
-@router.get("/module/{module_id}", response_model=ModuleContent)
-async def get_module_content(module_id: int, user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+def _owned_module(session: Session, module_id: int, user: User) -> Module:
     # Verify access (user owns the topic of this module)
     # Join Module -> Topic -> User
     module = session.get(Module, module_id)
@@ -48,37 +49,16 @@ async def get_module_content(module_id: int, user: User = Depends(get_current_us
     topic = session.get(Topic, module.topic_id)
     if topic.user_id != user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
-    
+    return module
+
+def _get_owned_module(session: Session, module_id: int, user: User):
+    module = _owned_module(session, module_id, user)
     # Check if content exists
-    if not module.slides:
-        # Generate content
-        content_data = await generate_module_content_ai(topic.title, module.title)
-        
-        # Save slides
-        slides_data = content_data.get("slides", [])
-        for s in slides_data:
-            db_slide = Slide(
-                content=s.get("content"), 
-                order_index=s.get("order_index"), 
-                module_id=module.id
-            )
-            session.add(db_slide)
-        
-        # Save quiz
-        quizzes_data = content_data.get("quizzes", [])
-        for q_data in quizzes_data:
-            db_quiz = Quiz(
-                question=q_data.get("question"),
-                options=json.dumps(q_data.get("options")), # Store as JSON string
-                correct_answer=q_data.get("correct_answer"),
-                module_id=module.id
-            )
-            session.add(db_quiz)
-        
-        session.commit()
+    return module, bool(module.slides)
+
+def _module_content_response(session: Session, module: Module, generated: bool):
+    if generated:
         session.refresh(module)
-    
-    # Construct response
     slides_resp = [SlideRead(id=s.id, content=s.content, order_index=s.order_index) for s in module.slides]
     slides_resp.sort(key=lambda x: x.order_index)
     
@@ -99,17 +79,39 @@ async def get_module_content(module_id: int, user: User = Depends(get_current_us
         quizzes=quizzes_resp
     )
 
+@router.get("/module/{module_id}", response_model=ModuleContent)
+async def get_module_content(module_id: int, user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+    module, has_content = await run_db(_get_owned_module, session, module_id, user)
+    record_module_open(module.id, has_content)
+    # Get the next module ready while the user works through this one
+    await schedule_prefetch(user.id, module.id)
+    if not has_content:
+        # Generate content (shared with any concurrent request for this module)
+        await ensure_module_content(module.id)
+    
+    # Construct response
+    return await run_db(_module_content_response, session, module, not has_content)
+
+@router.get("/prefetch-stats")
+def prefetch_stats(admin: User = Depends(get_current_admin)):
+    return get_prefetch_stats()
+
 @router.post("/module/{module_id}/complete_slide")
 def complete_slide(module_id: int):
     # Optional endpoint if we want to track slide-by-slide progress
     return {"ok": True}
 
 @router.post("/module/{module_id}/submit_quiz")
-def submit_quiz(module_id: int, submit: QuizSubmit, user: User = Depends(get_current_user), session: Session = Depends(get_session)):
-    # Verify access
-    module = session.get(Module, module_id)
-    if not module:
-        raise HTTPException(status_code=404, detail="Module not found")
+async def submit_quiz(module_id: int, submit: QuizSubmit, user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+    result = await run_db(grade_quiz, session, module_id, submit, user)
+    if result["passed"]:
+        await schedule_prefetch(user.id, module_id)
+    return result
+
+def grade_quiz(session: Session, module_id: int, submit: QuizSubmit, user: User):
+    # Verify access before grading, and before submit_quiz prefetches the
+    # next module with the owner's content
+    module = _owned_module(session, module_id, user)
     
     # Get all quizzes
     db_quizzes = session.query(Quiz).filter(Quiz.module_id == module.id).all()
@@ -145,6 +147,7 @@ def submit_quiz(module_id: int, submit: QuizSubmit, user: User = Depends(get_cur
     ).first()
     
     if progress:
+        was_completed, old_score = progress.is_completed, progress.score
         # Only mark completed if passed
         if passed:
             progress.is_completed = True 
@@ -153,6 +156,8 @@ def submit_quiz(module_id: int, submit: QuizSubmit, user: User = Depends(get_cur
         progress.score = score_percentage
         progress.completed_at = datetime.utcnow()
         session.add(progress)
+        record_quiz_result(session, progress, was_completed, old_score)
+        record_activity(session, user.id, "quiz", ref_id=module_id, score=score_percentage, passed=passed, at=progress.completed_at)
         session.commit()
     
     return {
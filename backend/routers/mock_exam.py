@@ -1,42 +1,52 @@
 from fastapi import APIRouter, Depends, HTTPException, Body
 from sqlmodel import Session, select
-from typing import List, Dict, Any
-import json
-from ..database import get_session
-from ..models import User, MockExam, MockAttempt
-from ..auth import get_current_user
-from ..ai_service import generate_mock_exam
+from sqlalchemy import func, case
+from typing import List, Dict, Any, Optional
+from ..database import get_session, run_db
+from ..models import User, MockExam, MockAttempt, MockQuestion
+from ..auth import get_current_user, get_current_admin
+from ..user_stats import record_mock_attempt
+from ..activity import record_activity
+from ..ai_service import generate_mock_exam, is_fallback
+from ..llm_gateway import LLMUnavailable
+from ..pagination import page_limit, keyset_page
+from ..mock_questions import (
+    question_rows, question_dict, get_questions, answer_rows, grade_attempt,
+    is_passed, review_rows, question_miss_stats,
+)
 
 router = APIRouter(prefix="/mock-exam", tags=["mock-exam"])
 
-@router.get("/debug-history")
-async def get_debug_history(
-    user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+DIAGNOSTIC_SAMPLE_SIZE = 50
+
+@router.get("/admin/diagnostics")
+def get_history_diagnostics(
+    user_id: int,
+    admin: User = Depends(get_current_admin),
+    session: Session = Depends(get_session),
 ):
-    total_attempts = session.exec(select(MockAttempt)).all()
-    user_attempts = session.exec(
-        select(MockAttempt).where(MockAttempt.user_id == user.id)
+    # Replaces the old /debug-history, which loaded every attempt in the
+    # database. Everything here is bounded by the user_id indexes.
+    attempt_count = session.exec(
+        select(func.count(MockAttempt.id)).where(MockAttempt.user_id == user_id)
+    ).one()
+    orphaned = session.exec(
+        select(MockAttempt.id, MockAttempt.mock_exam_id)
+        .outerjoin(MockExam, MockExam.id == MockAttempt.mock_exam_id)
+        .where(MockAttempt.user_id == user_id, MockExam.id == None)
+        .limit(DIAGNOSTIC_SAMPLE_SIZE)
     ).all()
-    
-    # Get all exam IDs referenced by user attempts
-    exam_ids = {a.mock_exam_id for a in user_attempts}
-    exams = session.exec(
-        select(MockExam).where(MockExam.id.in_(exam_ids))
+    exams_without_questions = session.exec(
+        select(MockExam.id)
+        .where(MockExam.user_id == user_id)
+        .where(~select(MockQuestion.id).where(MockQuestion.mock_exam_id == MockExam.id).exists())
+        .limit(DIAGNOSTIC_SAMPLE_SIZE)
     ).all()
-    found_exam_ids = {e.id for e in exams}
-    
     return {
-        "user_id": user.id,
-        "username": user.username,
-        "total_db_attempts": len(total_attempts),
-        "user_db_attempts": len(user_attempts),
-        "user_attempts_details": [
-            {"id": a.id, "exam_id": a.mock_exam_id, "score": a.score}
-            for a in user_attempts
-        ],
-        "found_exams": list(found_exam_ids),
-        "missing_exams": list(exam_ids - found_exam_ids),
+        "user_id": user_id,
+        "attempts": attempt_count,
+        "orphaned_attempts": [{"id": a, "exam_id": e} for a, e in orphaned],
+        "exams_without_questions": list(exams_without_questions),
     }
 
 @router.post("/generate")
@@ -49,26 +59,41 @@ async def create_generated_exam(
 ):
     # 1. Generate via AI
     exam_data = await generate_mock_exam(topic_name, difficulty, count)
+    if is_fallback(exam_data):
+        # A placeholder exam must not be saved and graded as a real one
+        raise LLMUnavailable("Mock exam could not be generated")
     
     # 2. Save to DB
     # exam_data is {"questions": [...]}
     questions_list = exam_data.get("questions", [])
-    questions_str = json.dumps(questions_list)
     
     mock_exam = MockExam(
         user_id=user.id,
         topic_name=topic_name,
         difficulty=difficulty,
-        questions_json=questions_str,
     )
+    return await run_db(_save_exam, session, mock_exam, questions_list)
+
+def _save_exam(session: Session, mock_exam: MockExam, questions: List[Dict[str, Any]]):
     session.add(mock_exam)
+    session.flush()
+    rows = question_rows(mock_exam.id, questions)
+    session.add_all(rows)
+    # Built before the commit expires the objects; questions_json is legacy
+    # (always "[]") and is left out
+    response = {
+        "id": mock_exam.id,
+        "user_id": mock_exam.user_id,
+        "topic_name": mock_exam.topic_name,
+        "difficulty": mock_exam.difficulty,
+        "created_at": mock_exam.created_at,
+        "questions": [question_dict(q) for q in rows],
+    }
     session.commit()
-    session.refresh(mock_exam)
-    
-    return mock_exam
+    return response
 
 @router.post("/{exam_id}/submit")
-async def submit_exam(
+def submit_exam(
     exam_id: int,
     answers: List[Dict[str, Any]] = Body(...),  # [{"question_index": 0, "answer": "A"}, ...]
     user: User = Depends(get_current_user),
@@ -77,41 +102,32 @@ async def submit_exam(
     exam = session.get(MockExam, exam_id)
     if not exam:
         raise HTTPException(status_code=404, detail="Exam not found")
-        
-    questions = json.loads(exam.questions_json)
-    score = 0
-    total = len(questions)
     
-    # Grading Logic
-    for ans_obj in answers:
-        q_idx = ans_obj.get("question_index")
-        user_ans = ans_obj.get("answer")
-        
-        if q_idx is not None and 0 <= q_idx < total:
-            question = questions[q_idx]
-            q_type = question.get("type", "mcq")
-            
-            if q_type in ["mcq", "boolean"]:
-                correct = question.get("correct_answer")
-                if str(user_ans).lower().strip() == str(correct).lower().strip():
-                    score += 1
-            elif q_type == "code":
-                # Simple heuristic for now: logic should ideally be client-side test passing
-                # or AI grading. We'll award point if length > 10.
-                if user_ans and len(str(user_ans)) > 10:
-                    score += 1
-                    
-    passed = (score / total) >= 0.75 if total > 0 else False
+    question_ids = dict(session.exec(
+        select(MockQuestion.position, MockQuestion.id).where(MockQuestion.mock_exam_id == exam.id)
+    ).all())
+    total = len(question_ids)
     
     attempt = MockAttempt(
         mock_exam_id=exam.id,
         user_id=user.id,
-        score=score,
+        score=0,
         total_questions=total,
-        answers_json=json.dumps(answers),
-        passed=passed,
+        passed=False,
     )
     session.add(attempt)
+    session.flush()
+    
+    # Grading happens in SQL against the stored questions
+    session.add_all(answer_rows(attempt.id, question_ids, answers))
+    session.flush()
+    score = grade_attempt(session, attempt.id)
+    passed = is_passed(score, total)
+    attempt.score = score
+    attempt.passed = passed
+    
+    record_mock_attempt(session, attempt)
+    record_activity(session, user.id, "mock_exam", ref_id=attempt.id, score=score, passed=passed, at=attempt.created_at)
     session.commit()
     
     return {
@@ -123,48 +139,103 @@ async def submit_exam(
 
 # ------- IMPORTANT: history & attempt BEFORE /{exam_id} -------- #
 
+def _history_filters(stmt, user: User, topic: Optional[str], difficulty: Optional[str], passed: Optional[bool]):
+    stmt = stmt.where(MockAttempt.user_id == user.id)
+    if topic:
+        stmt = stmt.where(func.lower(MockExam.topic_name) == topic.strip().lower())
+    if difficulty:
+        stmt = stmt.where(MockExam.difficulty == difficulty)
+    if passed is not None:
+        stmt = stmt.where(MockAttempt.passed == passed)
+    return stmt
+
+# Standard XP: 10 per correct answer if passed
+_ATTEMPT_XP = case((MockAttempt.passed, MockAttempt.score * 10), else_=0)
+
+def _history_items(session: Session, user: User, topic, difficulty, passed, before, after, limit):
+    rows_stmt = _history_filters(
+        select(
+            MockAttempt.id,
+            func.coalesce(MockExam.topic_name, "Unknown"),
+            func.coalesce(MockExam.difficulty, "N/A"),
+            MockAttempt.score,
+            MockAttempt.total_questions,
+            MockAttempt.passed,
+            MockAttempt.created_at,
+            _ATTEMPT_XP,
+        ).outerjoin(MockExam, MockExam.id == MockAttempt.mock_exam_id),
+        user, topic, difficulty, passed
+    )
+    # Newest attempts first; pass before=<last id> for the next page
+    rows = keyset_page(session, rows_stmt, MockAttempt.id, before, after, limit, newest_first=True, sort_col=MockAttempt.created_at)
+    return [
+        {
+            "id": att_id,
+            "topic": topic_name,
+            "difficulty": att_difficulty,
+            "score": score,
+            "total": total,
+            "passed": att_passed,
+            "date": created_at,
+            "xp": att_xp,
+        }
+        for att_id, topic_name, att_difficulty, score, total, att_passed, created_at, att_xp in rows
+    ]
+
 @router.get("/history")
-async def get_exam_history(
+def get_exam_history(
+    topic: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    passed: Optional[bool] = None,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = Depends(page_limit),
     user: User = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
-    # Simple query for all attempts of the user
-    attempts = session.exec(
-        select(MockAttempt).where(MockAttempt.user_id == user.id)
-    ).all()
+    # Stays a bare list of attempts; /history/page adds has_more and totals
+    return _history_items(session, user, topic, difficulty, passed, before, after, limit)
+
+@router.get("/history/page")
+def get_exam_history_page(
+    topic: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    passed: Optional[bool] = None,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = Depends(page_limit),
+    user: User = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    items = _history_items(session, user, topic, difficulty, passed, before, after, limit)
     
-    history = []
-    for att in attempts:
-        topic_name = "Unknown"
-        difficulty = "N/A"
-        
-        # Try to fetch exam details
-        try:
-            exam = session.get(MockExam, att.mock_exam_id)
-            if exam:
-                topic_name = exam.topic_name
-                difficulty = exam.difficulty
-        except Exception:
-            pass
-            
-        # Standard XP: 10 per correct answer if passed
-        xp = (att.score * 10) if att.passed else 0
-            
-        history.append({
-            "id": att.id,
-            "topic": topic_name,
-            "difficulty": difficulty,
-            "score": att.score,
-            "total": att.total_questions,
-            "passed": att.passed,
-            "date": att.created_at,
-            "xp": xp
-        })
-            
-    return history
+    # Totals over every attempt matching the filters, not just this page
+    count, passed_count, xp_total, score_sum, question_sum = session.exec(
+        _history_filters(
+            select(
+                func.count(MockAttempt.id),
+                func.coalesce(func.sum(case((MockAttempt.passed, 1), else_=0)), 0),
+                func.coalesce(func.sum(_ATTEMPT_XP), 0),
+                func.coalesce(func.sum(MockAttempt.score), 0),
+                func.coalesce(func.sum(MockAttempt.total_questions), 0),
+            ).outerjoin(MockExam, MockExam.id == MockAttempt.mock_exam_id),
+            user, topic, difficulty, passed
+        )
+    ).one()
+    
+    return {
+        "items": items,
+        "has_more": len(items) == limit,
+        "totals": {
+            "attempts": count,
+            "passed": passed_count,
+            "xp": xp_total,
+            "average_percent": round(score_sum * 100 / question_sum) if question_sum else 0,
+        },
+    }
 
 @router.get("/attempt/{attempt_id}")
-async def get_attempt_details(
+def get_attempt_details(
     attempt_id: int,
     user: User = Depends(get_current_user),
     session: Session = Depends(get_session),
@@ -181,36 +252,17 @@ async def get_attempt_details(
         # Should not happen if foreign keys are enforced, but handle gracefully
         raise HTTPException(status_code=404, detail="Associated exam not found")
         
-    questions = json.loads(exam.questions_json)
-    user_answers = json.loads(attempt.answers_json)
-    
-    # Merge data
-    # user_answers structure: [{"question_index": 0, "answer": "A"}, ...]
-    ans_map = {a.get("question_index"): a.get("answer") for a in user_answers}
-    
     review_data = []
-    for i, q in enumerate(questions):
-        user_ans = ans_map.get(i)
-        correct_ans = q.get("correct_answer")
-        q_type = q.get("type", "mcq")
-        
-        is_correct = False
-        if q_type in ["mcq", "boolean"] and user_ans:
-            if str(user_ans).lower().strip() == str(correct_ans).lower().strip():
-                is_correct = True
-        elif q_type == "code":
-            # Loose check for now as per submit logic
-            if user_ans and len(str(user_ans)) > 10:
-                is_correct = True
-                
+    for q, ans in review_rows(session, exam.id, attempt.id):
+        question = question_dict(q)
         review_data.append({
-            "question": q.get("question"),
-            "options": q.get("options"),
-            "type": q_type,
-            "user_answer": user_ans,
-            "correct_answer": correct_ans,
-            "is_correct": is_correct,
-            "explanation": q.get("explanation", "No explanation provided."),
+            "question": q.question,
+            "options": question.get("options"),
+            "type": q.type,
+            "user_answer": ans.answer if ans else None,
+            "correct_answer": q.correct_answer,
+            "is_correct": bool(ans and ans.is_correct),
+            "explanation": q.explanation or "No explanation provided.",
         })
         
     return {
@@ -225,9 +277,30 @@ async def get_attempt_details(
         "review_data": review_data,
     }
 
+@router.get("/{exam_id}/question-stats")
+def get_question_stats(
+    exam_id: int,
+    user: User = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    exam = session.get(MockExam, exam_id)
+    if not exam or exam.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Exam not found")
+    return [
+        {
+            "question_index": position,
+            "question": question,
+            "type": q_type,
+            "attempts": attempts,
+            "missed": missed,
+            "miss_rate": round(missed / attempts, 3) if attempts else None,
+        }
+        for position, question, q_type, attempts, missed in question_miss_stats(session, exam.id)
+    ]
+
 # This MUST stay last so it doesn't shadow /history, /attempt, etc.
 @router.get("/{exam_id}")
-async def get_exam(
+def get_exam(
     exam_id: int,
     user: User = Depends(get_current_user),
     session: Session = Depends(get_session),
@@ -235,10 +308,9 @@ async def get_exam(
     exam = session.get(MockExam, exam_id)
     if not exam:
         raise HTTPException(status_code=404, detail="Exam not found")
-    # Return questions parsed
     return {
         "id": exam.id,
         "topic": exam.topic_name,
         "difficulty": exam.difficulty,
-        "questions": json.loads(exam.questions_json),
+        "questions": [question_dict(q) for q in get_questions(session, exam.id)],
     }
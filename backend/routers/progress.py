@@ -1,97 +1,78 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select
-from typing import List, Dict, Any
-from datetime import datetime, timedelta
-from ..database import get_session
-from ..models import User, Progress, Topic, Module, MockAttempt
+from sqlalchemy import func
+from typing import List, Dict, Any, Optional
+from datetime import datetime, timedelta, date
+from ..database import get_session, run_db
+from ..models import User, Progress, Topic, Module
 from ..auth import get_current_user
-from ..ai_service import client, MODEL
+from ..user_stats import get_user_stats, current_streak
+from ..activity import get_daily_activity
+from ..ai_service import gateway, MODEL
 import json
 
 router = APIRouter(prefix="/progress", tags=["progress"])
 
+HEATMAP_DAYS = 365
+MAX_ACTIVITY_RANGE_DAYS = 3 * 366
+
 @router.get("/dashboard")
-async def get_progress_dashboard(user: User = Depends(get_current_user), session: Session = Depends(get_session)):
-    # 1. Basic Stats
-    total_topics = len(user.topics)
+def get_progress_dashboard(user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+    # Totals come from the incrementally maintained UserStats row; the rest is
+    # aggregated in SQL with a fixed number of queries, so the cost doesn't grow
+    # with the number of topics or progress rows.
     
-    # Calculate modules completed and total
-    user_progress = session.query(Progress).filter(Progress.user_id == user.id).all()
-    
-    modules_completed = sum(1 for p in user_progress if p.is_completed)
-    total_modules_enrolled = sum(len(t.modules) for t in user.topics)
+    # 1. Basic Stats
+    stats = get_user_stats(session, user.id)
+    modules_completed = stats.modules_completed
     
     # Average Score
-    scores = [p.score for p in user_progress if p.score is not None and p.score > 0]
-    avg_score = int(sum(scores) / len(scores)) if scores else 0
+    avg_score = int(stats.score_sum / stats.score_count) if stats.score_count else 0
     
-    # 2. Streak Calculation & Heatmap Data
-    activity_dates = []
-    if user_progress:
-        valid_dates = [p.completed_at.date() for p in user_progress if p.completed_at]
-        valid_dates.sort()
-        
-        date_counts = {}
-        for d in valid_dates:
-            d_str = d.isoformat()
-            date_counts[d_str] = date_counts.get(d_str, 0) + 1
-            
-        activity_dates = [{"date": k, "count": v} for k, v in date_counts.items()]
+    # Modules and completions per topic
+    module_counts = (
+        select(Module.topic_id, func.count(Module.id).label("total"))
+        .join(Topic, Topic.id == Module.topic_id)
+        .where(Topic.user_id == user.id)
+        .group_by(Module.topic_id)
+        .subquery()
+    )
+    completed_counts = (
+        select(Progress.topic_id, func.count(Progress.id).label("completed"))
+        .where(Progress.user_id == user.id, Progress.is_completed)
+        .group_by(Progress.topic_id)
+        .subquery()
+    )
+    topic_rows = session.exec(
+        select(
+            Topic.id,
+            Topic.title,
+            func.coalesce(module_counts.c.total, 0),
+            func.coalesce(completed_counts.c.completed, 0)
+        )
+        .outerjoin(module_counts, module_counts.c.topic_id == Topic.id)
+        .outerjoin(completed_counts, completed_counts.c.topic_id == Topic.id)
+        .where(Topic.user_id == user.id)
+        .order_by(Topic.id)
+    ).all()
     
-    streak = 0
+    # 2. Streak Calculation & Heatmap Data (from the daily rollups, last year)
     today = datetime.utcnow().date()
-    if any(p.completed_at and p.completed_at.date() == today for p in user_progress):
-        streak = 1
-        check_date = today - timedelta(days=1)
-    else:
-        check_date = today - timedelta(days=1)
-        if any(p.completed_at and p.completed_at.date() == check_date for p in user_progress):
-            streak = 1
-            check_date = check_date - timedelta(days=1)
-        else:
-            streak = 0
-            
-    if streak > 0:
-        unique_dates_set = {p.completed_at.date() for p in user_progress if p.completed_at}
-        while check_date in unique_dates_set:
-            streak += 1
-            check_date -= timedelta(days=1)
+    rollups = get_daily_activity(session, user.id, today - timedelta(days=HEATMAP_DAYS - 1), today)
+    date_counts = {r.day.isoformat(): r.total for r in rollups}
+    activity_dates = [{"date": k, "count": v} for k, v in date_counts.items()]
+    
+    streak = current_streak(stats, today)
 
     # 3. Topic Breakdown
     topic_stats = []
-    total_xp = 0
     
-    # Mock Exam XP
-    mock_attempts = session.query(MockAttempt).filter(MockAttempt.user_id == user.id).all()
-    mock_passed = [m for m in mock_attempts if m.passed]
-    
-    for att in mock_passed:
-        total_xp += (att.score * 10) 
-    
-    topics_started_count = 0
-    topics_done_count = 0
-
-    for topic in user.topics:
-        t_modules_total = len(topic.modules)
-        t_completed_records = [p for p in user_progress if p.topic_id == topic.id and p.is_completed]
-        t_completed = len(t_completed_records)
-        
-        # XP Calculation
-        for p in t_completed_records:
-            total_xp += 10
-            if p.score:
-                total_xp += int(p.score / 10)
-        
+    for topic_id, title, t_modules_total, t_completed in topic_rows:
         percent = int((t_completed / t_modules_total) * 100) if t_modules_total > 0 else 0
         
-        if percent > 0:
-            topics_started_count += 1
-        if percent == 100:
-            topics_done_count += 1
-        
         topic_stats.append({
-            "id": topic.id,
-            "title": topic.title,
+            "id": topic_id,
+            "title": title,
             "total_modules": t_modules_total,
             "completed_modules": t_completed,
             "percent": percent
@@ -102,54 +83,52 @@ async def get_progress_dashboard(user: User = Depends(get_current_user), session
 
     # 5. Last 7 Days Activity
     chart_data = []
-    today_date = datetime.utcnow().date()
     for i in range(6, -1, -1):
-        d = today_date - timedelta(days=i)
-        count = 0
-        if user_progress:
-            count += sum(1 for p in user_progress if p.completed_at and p.completed_at.date() == d)
-        
-        # Add mock exams to daily activity
-        if mock_attempts:
-            count += sum(1 for m in mock_attempts if m.created_at and m.created_at.date() == d)
-        
+        d = today - timedelta(days=i)
         chart_data.append({
             "name": d.strftime("%a"),
-            "progress": count
+            "progress": date_counts.get(d.isoformat(), 0)
         })
         
     # 6. Resume Module
     resume_module = None
-    if user_progress:
-        last_completed = sorted([p for p in user_progress if p.completed_at], key=lambda x: x.completed_at, reverse=True)
-        if last_completed:
-            last_p = last_completed[0]
-            next_mod = session.query(Module).filter(
-                Module.topic_id == last_p.topic_id,
-                Module.order_index > session.get(Module, last_p.module_id).order_index
-            ).order_by(Module.order_index).first()
-            
-            if next_mod:
-                topic_title = session.get(Topic, last_p.topic_id).title
-                resume_module = {
-                    "id": next_mod.id,
-                    "title": next_mod.title,
-                    "topic_title": topic_title
-                }
+    last_completed = session.exec(
+        select(Progress.topic_id, Module.order_index, Topic.title)
+        .join(Module, Module.id == Progress.module_id)
+        .join(Topic, Topic.id == Progress.topic_id)
+        .where(Progress.user_id == user.id, Progress.completed_at != None)
+        .order_by(Progress.completed_at.desc(), Progress.id)
+        .limit(1)
+    ).first()
+    if last_completed:
+        last_topic_id, last_order_index, topic_title = last_completed
+        next_mod = session.exec(
+            select(Module.id, Module.title)
+            .where(Module.topic_id == last_topic_id, Module.order_index > last_order_index)
+            .order_by(Module.order_index)
+            .limit(1)
+        ).first()
+        
+        if next_mod:
+            resume_module = {
+                "id": next_mod[0],
+                "title": next_mod[1],
+                "topic_title": topic_title
+            }
 
     return {
         "stats": {
-            "total_topics": total_topics,
+            "total_topics": stats.total_topics,
             "modules_completed": modules_completed,
-            "total_modules": total_modules_enrolled,
+            "total_modules": stats.total_modules,
             "avg_score": avg_score,
             "streak": streak,
-            "total_xp": total_xp,
-            "topics_started": topics_started_count,
-            "topics_done": topics_done_count,
+            "total_xp": stats.progress_xp + stats.mock_xp,
+            "topics_started": stats.topics_started,
+            "topics_done": stats.topics_done,
             "estimated_hours": estimated_hours,
-            "mock_exams_taken": len(mock_attempts),
-            "mock_exams_passed": len(mock_passed)
+            "mock_exams_taken": stats.mock_taken,
+            "mock_exams_passed": stats.mock_passed
         },
         "heatmap": activity_dates,
         "topics": topic_stats,
@@ -157,20 +136,44 @@ async def get_progress_dashboard(user: User = Depends(get_current_user), session
         "resume_module": resume_module
     }
 
-@router.get("/ai-insights")
-async def get_ai_insights(user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+@router.get("/activity")
+def get_activity(start: Optional[date] = None, end: Optional[date] = None, user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+    """Daily activity counts in [start, end] (defaults to the last year), one entry per active day."""
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=HEATMAP_DAYS - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if (end - start).days >= MAX_ACTIVITY_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail="Date range too large")
+    
+    return [
+        {
+            "date": r.day.isoformat(),
+            "count": r.total,
+            "quizzes": r.quiz_count,
+            "mock_exams": r.mock_count
+        }
+        for r in get_daily_activity(session, user.id, start, end)
+    ]
+
+def _recent_scores(session: Session, user: User):
     recent_activity = session.query(Progress).filter(
         Progress.user_id == user.id,
         Progress.score != None
     ).order_by(Progress.completed_at.desc()).limit(10).all()
     
-    if not recent_activity:
-        return {"message": "Start learning to get AI insights!"}
-        
     data_summary = []
     for p in recent_activity:
         mod = session.get(Module, p.module_id)
         data_summary.append(f"Module: {mod.title}, Score: {p.score}%")
+    return data_summary
+
+@router.get("/ai-insights")
+async def get_ai_insights(user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+    data_summary = await run_db(_recent_scores, session, user)
+    
+    if not data_summary:
+        return {"message": "Start learning to get AI insights!"}
         
     prompt = f"""
     Analyze this student's recent performance:
@@ -184,7 +187,7 @@ async def get_ai_insights(user: User = Depends(get_current_user), session: Sessi
     """
     
     try:
-        response = await client.chat.completions.create(
+        response = await gateway.create(
             model=MODEL,
             messages=[
                 {"role": "system", "content": "You are an encouraging learning coach."},
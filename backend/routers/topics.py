@@ -1,10 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlmodel import Session
+from sqlmodel import Session, select
+from sqlalchemy import update
 from typing import List, Optional
-from ..database import get_session
-from ..models import User, Topic, Module, Progress
+from datetime import datetime
+from ..database import get_session, run_db
+from ..models import User, Topic, Module, Progress, Job
 from ..auth import get_current_user
-from ..ai_service import generate_roadmap_ai
+from ..user_stats import record_topic_created, record_topic_deleted
+from ..content_generation import generate_topic_roadmap, materialize_topic, content_status_by_module
+from ..jobs import runner, create_job
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/topics", tags=["topics"])
@@ -21,8 +25,24 @@ class TopicRead(BaseModel):
     difficulty: str
     duration_days: int
     description: str
+    status: str = "ready"
     # completed percentage could be computed here
 
+class TopicCreated(TopicRead):
+    job_id: str
+
+class JobRead(BaseModel):
+    id: str
+    kind: str
+    status: str
+    topic_id: Optional[int] = None
+    error: Optional[str] = None
+    progress_total: Optional[int] = None
+    progress_done: int = 0
+    progress_failed: int = 0
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
 class ModuleRead(BaseModel):
     id: int
     title: str
@@ -34,55 +54,119 @@ class ModuleRead(BaseModel):
 class TopicWithModules(TopicRead):
     modules: List[ModuleRead]
 
-@router.post("/", response_model=TopicRead)
-async def create_topic(topic_in: TopicCreate, user: User = Depends(get_current_user), session: Session = Depends(get_session)):
-    # 1. Generate Roadmap via AI
-    # (In a real prodd app, we might want to do this in background if it takes too long, 
-    # but for this demo we'll await it to give immediate feedback)
-    
-    roadmap_data = await generate_roadmap_ai(topic_in.title, topic_in.difficulty, topic_in.duration_days, topic_in.description)
-    
-    # 2. Save Topic
+class ModuleContentStatus(BaseModel):
+    id: int
+    title: str
+    order_index: int
+    status: str # ready, generating, pending
+
+def _create_topic_with_job(session: Session, topic_in: TopicCreate, user: User):
     db_topic = Topic(
         title=topic_in.title, 
         difficulty=topic_in.difficulty, 
         duration_days=topic_in.duration_days, 
         description=topic_in.description, 
-        user_id=user.id
+        user_id=user.id,
+        status="generating"
     )
     session.add(db_topic)
+    record_topic_created(session, user.id)
     session.commit()
     session.refresh(db_topic)
     
-    # 3. Save Modules and Init Progress
-    modules_list = roadmap_data.get("modules", [])
-    for mod in modules_list:
-        db_module = Module(
-            title=mod.get("title"),
-            description=mod.get("description"),
-            order_index=mod.get("order_index"),
-            topic_id=db_topic.id
-        )
-        session.add(db_module)
-        session.commit()
-        session.refresh(db_module)
-        
-        # Init progress
-        prog = Progress(
-            user_id=user.id,
-            topic_id=db_topic.id,
-            module_id=db_module.id,
-            is_completed=False,
-            score=0
-        )
-        session.add(prog)
+    job = create_job(session, "roadmap", user.id, topic_id=db_topic.id)
+    session.commit()
     
+    return TopicCreated(
+        id=db_topic.id,
+        title=db_topic.title,
+        difficulty=db_topic.difficulty,
+        duration_days=db_topic.duration_days,
+        description=db_topic.description,
+        status=db_topic.status,
+        job_id=job.id
+    )
+
+@router.post("/", response_model=TopicCreated)
+async def create_topic(topic_in: TopicCreate, user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+    # Save the topic right away; the roadmap is generated in the background
+    # and its progress can be polled via GET /topics/jobs/{job_id}
+    created = await run_db(_create_topic_with_job, session, topic_in, user)
+    # Submitted from the event loop thread since the job queue is an asyncio.Queue
+    runner.submit(created.job_id, generate_topic_roadmap, created.id)
+    return created
+
+@router.get("/jobs/{job_id}", response_model=JobRead)
+def get_job(job_id: str, user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+    job = session.get(Job, job_id)
+    if not job or job.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+def _get_owned_topic(session: Session, topic_id: int, user: User):
+    topic = session.get(Topic, topic_id)
+    if not topic or topic.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Topic not found")
+    return topic
+
+def _get_or_create_materialize_job(session: Session, topic_id: int, user: User):
+    topic = _get_owned_topic(session, topic_id, user)
+    if topic.status != "ready":
+        raise HTTPException(status_code=409, detail="The roadmap for this topic is not ready yet")
+    running = session.exec(
+        select(Job).where(Job.topic_id == topic_id, Job.kind == "materialize", Job.status.in_(["queued", "running"]))
+    ).first()
+    if running:
+        return running, False
+    job = create_job(session, "materialize", user.id, topic_id=topic_id)
+    session.commit()
+    session.refresh(job)
+    return job, True
+
+@router.post("/{topic_id}/materialize", response_model=JobRead)
+async def materialize_topic_content(topic_id: int, user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+    # Generates slides and quizzes for every module in the background, a few at
+    # a time; poll GET /topics/jobs/{job_id} for progress. Starting it again
+    # while it runs returns the running job.
+    job, created = await run_db(_get_or_create_materialize_job, session, topic_id, user)
+    if created:
+        runner.submit(job.id, materialize_topic, topic_id)
+    return job
+
+def _create_retry_job(session: Session, topic_id: int, user: User):
+    _get_owned_topic(session, topic_id, user)
+    # Conditional update, so two retries of the same topic can't both start a job
+    result = session.execute(
+        update(Topic).where(Topic.id == topic_id, Topic.status == "failed").values(status="generating")
+    )
+    if result.rowcount != 1:
+        session.rollback()
+        raise HTTPException(status_code=409, detail="Only a topic whose roadmap failed can be retried")
+    job = create_job(session, "roadmap", user.id, topic_id=topic_id)
     session.commit()
-    return db_topic
+    session.refresh(job)
+    return job
+
+@router.post("/{topic_id}/retry", response_model=JobRead)
+async def retry_topic_roadmap(topic_id: int, user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+    # Generates the roadmap of a failed topic again; poll the returned job
+    job = await run_db(_create_retry_job, session, topic_id, user)
+    runner.submit(job.id, generate_topic_roadmap, topic_id)
+    return job
+
+@router.get("/{topic_id}/content-status", response_model=List[ModuleContentStatus])
+def get_content_status(topic_id: int, user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+    _get_owned_topic(session, topic_id, user)
+    return [
+        ModuleContentStatus(id=m.id, title=m.title, order_index=m.order_index, status=status)
+        for m, status in content_status_by_module(session, topic_id)
+    ]
 
 @router.get("/", response_model=List[TopicRead])
 def get_topics(user: User = Depends(get_current_user), session: Session = Depends(get_session)):
-    return user.topics
+    # user may be a detached snapshot from the token cache, so its relationships
+    # can't be loaded; query the topics directly
+    return session.exec(select(Topic).where(Topic.user_id == user.id).order_by(Topic.id)).all()
 
 @router.get("/{topic_id}", response_model=TopicWithModules)
 def get_topic_details(topic_id: int, user: User = Depends(get_current_user), session: Session = Depends(get_session)):
@@ -118,6 +202,7 @@ def get_topic_details(topic_id: int, user: User = Depends(get_current_user), ses
         difficulty=topic.difficulty,
         duration_days=topic.duration_days,
         description=topic.description,
+        status=topic.status,
         modules=modules_resp
     )
 
@@ -127,6 +212,8 @@ def delete_topic(topic_id: int, user: User = Depends(get_current_user), session:
     if not topic:
         raise HTTPException(status_code=404, detail="Topic not found")
     
+    record_topic_deleted(session, user.id, topic_id)
+    
     # Check if there are related records to delete manually to avoid FK constraints
     # Delete Progress
     session.query(Progress).filter(Progress.topic_id == topic_id).delete()
@@ -145,6 +232,7 @@ def delete_topic(topic_id: int, user: User = Depends(get_current_user), session:
         session.query(Slide).filter(Slide.module_id == mod.id).delete()
     
     session.query(Module).filter(Module.topic_id == topic_id).delete()
+    session.query(Job).filter(Job.topic_id == topic_id).delete()
     
     session.delete(topic)
     session.commit()
@@ -0,0 +1,58 @@
+"""
+Tests run against a throwaway SQLite database and the stub LLM provider, so
+they need no network and no API key:
+
+    python -m pytest backend/tests
+"""
+import os
+import sys
+import tempfile
+
+# Settings are read at import time, so they are set before backend is imported
+_tmp = tempfile.mkdtemp(prefix="ai-learning-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/test.db"
+os.environ["LLM_PROVIDER"] = "stub"
+os.environ["LLM_STUB_LATENCY_MS"] = "0"
+os.environ["LLM_STUB_TOKENS_PER_SECOND"] = "0"
+os.environ["LLM_REQUESTS_PER_MINUTE"] = "0"
+os.environ["LLM_TOKENS_PER_MINUTE"] = "0"
+os.environ["PREFETCH_ENABLED"] = "0"
+os.environ["BCRYPT_ROUNDS"] = "4"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import pytest
+from sqlmodel import Session
+from backend.database import engine, create_db_and_tables
+from backend.models import User
+
+create_db_and_tables()
+
+@pytest.fixture
+def session():
+    with Session(engine) as session:
+        yield session
+
+_users = 0
+
+@pytest.fixture
+def user(session):
+    global _users
+    _users += 1
+    user = User(username=f"user{_users}", email=f"user{_users}@example.com", hashed_password="x")
+    session.add(user)
+    session.commit()
+    session.refresh(user)
+    return user
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from backend.main import app
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture
+def auth_headers(user):
+    from backend.auth import create_access_token
+    return {"Authorization": f"Bearer {create_access_token({'sub': user.username})}"}
@@ -0,0 +1,14 @@
+import pytest
+from backend import auth
+
+# Process-wide operational stats, only for admins (ADMIN_USERNAMES)
+ADMIN_STATS_ENDPOINTS = ["/learning/prefetch-stats", "/auth/hash-stats", "/auth/cache-stats"]
+
+@pytest.mark.parametrize("path", ADMIN_STATS_ENDPOINTS)
+def test_stats_hidden_from_regular_users(client, auth_headers, path):
+    assert client.get(path, headers=auth_headers).status_code == 403
+
+@pytest.mark.parametrize("path", ADMIN_STATS_ENDPOINTS)
+def test_stats_visible_to_admins(client, auth_headers, user, monkeypatch, path):
+    monkeypatch.setattr(auth, "ADMIN_USERNAMES", {user.username})
+    assert client.get(path, headers=auth_headers).status_code == 200
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import httpx
+import openai
+import pytest
+from sqlmodel import select
+from backend import ai_service
+from backend.ai_service import CHAT_FALLBACK_MESSAGE
+from backend.llm_providers import ChunkStream, _chunk, _completion
+from backend.models import ChatSession, ChatMessage
+
+class ScriptedProvider:
+    """Replies with `reply`; streams fail after `fail_after` chunks if set."""
+    def __init__(self, reply="", fail_after=None):
+        self.reply = reply
+        self.fail_after = fail_after
+
+    async def create(self, **request):
+        if self.fail_after == 0:
+            raise openai.BadRequestError("rejected", response=httpx.Response(400, request=httpx.Request("POST", "http://llm.test")), body=None)
+        if not request.get("stream"):
+            return _completion(self.reply, "m", 1)
+        words = self.reply.split(" ")
+        if self.fail_after is None:
+            return ChunkStream([_chunk(w + " ", "m") for w in words])
+        return FailingStream([_chunk(w + " ", "m") for w in words[:self.fail_after]])
+
+class FailingStream(ChunkStream):
+    async def _iterate(self):
+        for chunk in self._chunks:
+            yield chunk
+        raise openai.APIConnectionError(request=httpx.Request("POST", "http://llm.test"))
+
+@pytest.fixture
+def chat(session, user):
+    chat = ChatSession(user_id=user.id, title="Graphs")
+    session.add(chat)
+    session.commit()
+    return chat
+
+@pytest.fixture
+def provider(monkeypatch):
+    def use(**kwargs):
+        monkeypatch.setattr(ai_service.gateway, "provider", ScriptedProvider(**kwargs))
+    return use
+
+def _replies(session, chat):
+    session.expire_all()
+    return session.exec(select(ChatMessage.content).where(ChatMessage.session_id == chat.id, ChatMessage.role == "assistant")).all()
+
+def _stream(client, headers, chat):
+    response = client.post(f"/chat/sessions/{chat.id}/messages/stream", json={"content": "hi"}, headers=headers)
+    lines = [json.loads(line) for line in response.text.splitlines() if line.strip()] if response.status_code == 200 else []
+    return response, lines
+
+def test_reply_matching_fallback_text_is_a_normal_reply(client, auth_headers, session, chat, provider):
+    provider(reply=CHAT_FALLBACK_MESSAGE)
+    response = client.post(f"/chat/sessions/{chat.id}/messages", json={"content": "hi"}, headers=auth_headers)
+    assert response.status_code == 200
+    assert _replies(session, chat) == [CHAT_FALLBACK_MESSAGE]
+
+def test_failed_reply_is_503_and_not_saved(client, auth_headers, session, chat, provider):
+    provider(fail_after=0)
+    response = client.post(f"/chat/sessions/{chat.id}/messages", json={"content": "hi"}, headers=auth_headers)
+    assert response.status_code == 503
+    assert _replies(session, chat) == []
+
+def test_stream_failing_before_first_token_is_503(client, auth_headers, session, chat, provider):
+    provider(fail_after=0)
+    response, _ = _stream(client, auth_headers, chat)
+    assert response.status_code == 503
+    assert _replies(session, chat) == []
+
+def test_stream_failing_midway_reports_error_and_saves_nothing(client, auth_headers, session, chat, provider):
+    provider(reply="one two three four", fail_after=2)
+    response, lines = _stream(client, auth_headers, chat)
+    assert [line["type"] for line in lines] == ["delta", "delta", "error"]
+    assert _replies(session, chat) == []
+
+def test_stream_saves_complete_reply(client, auth_headers, session, chat, provider):
+    provider(reply="one two three")
+    response, lines = _stream(client, auth_headers, chat)
+    assert lines[-1]["type"] == "done"
+    assert _replies(session, chat) == ["one two three "]
+
+def test_stream_disconnect_saves_nothing(client, auth_headers, session, chat, provider):
+    provider(reply="one two three four five six")
+    body = json.dumps({"content": "hi"}).encode()
+    received = []
+
+    async def receive():
+        if not received:
+            received.append(body)
+            return {"type": "http.request", "body": body, "more_body": False}
+        # The client goes away while the reply is streaming
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        pass
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": f"/chat/sessions/{chat.id}/messages/stream", "raw_path": b"",
+        "query_string": b"", "root_path": "", "client": ("test", 1), "server": ("test", 80),
+        "headers": [(b"content-type", b"application/json"),
+                    (b"authorization", auth_headers["Authorization"].encode())],
+    }
+    asyncio.run(client.app(scope, receive, send))
+    assert _replies(session, chat) == []
@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from backend import content_generation
+from backend.content_generation import _claim, _generate_once, generate_topic_roadmap, GENERATION_LEASE_SECONDS
+from backend.llm_gateway import LLMUnavailable
+from backend.models import Topic, Module
+
+def _module(session, user, **fields):
+    topic = Topic(title="Graphs", difficulty="Beginner", duration_days=3, description="", user_id=user.id)
+    session.add(topic)
+    session.flush()
+    module = Module(title="Intro", description="", order_index=1, topic_id=topic.id, **fields)
+    session.add(module)
+    session.commit()
+    return module
+
+def test_claim_unclaimed_module(session, user):
+    module = _module(session, user)
+    assert _claim(session, module.id)
+    session.refresh(module)
+    assert module.content_status == "generating"
+
+def test_claim_ready_module_is_refused(session, user):
+    module = _module(session, user, content_status="ready")
+    assert not _claim(session, module.id)
+    session.refresh(module)
+    assert module.content_status == "ready"
+
+def test_claim_respects_live_lease(session, user):
+    module = _module(session, user, content_status="generating", generation_started_at=datetime.utcnow())
+    assert not _claim(session, module.id)
+
+def test_claim_takes_over_stale_lease(session, user):
+    stale = datetime.utcnow() - timedelta(seconds=GENERATION_LEASE_SECONDS + 60)
+    module = _module(session, user, content_status="generating", generation_started_at=stale)
+    assert _claim(session, module.id)
+
+def test_cancelled_generation_releases_claim(session, user, monkeypatch):
+    module = _module(session, user)
+    started = asyncio.Event()
+
+    async def never_finishes(topic, module_title):
+        started.set()
+        await asyncio.sleep(3600)
+    monkeypatch.setattr(content_generation, "generate_module_content_ai", never_finishes)
+
+    async def scenario():
+        task = asyncio.create_task(_generate_once(module.id))
+        await started.wait()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    asyncio.run(scenario())
+
+    session.refresh(module)
+    assert module.content_status is None
+
+def test_failed_roadmap_marks_topic_failed(session, user, monkeypatch):
+    topic = Topic(title="Graphs", difficulty="Beginner", duration_days=3, description="", user_id=user.id, status="generating")
+    session.add(topic)
+    session.commit()
+
+    async def fallback(*request):
+        return {"fallback": True, "modules": []}
+    monkeypatch.setattr(content_generation, "generate_roadmap_ai", fallback)
+
+    with pytest.raises(LLMUnavailable):
+        asyncio.run(generate_topic_roadmap("job", topic.id))
+    session.refresh(topic)
+    assert topic.status == "failed"
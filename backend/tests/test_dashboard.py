@@ -0,0 +1,55 @@
+from datetime import datetime
+from sqlalchemy import event
+from sqlmodel import select
+from backend.auth import create_access_token
+from backend.content_generation import save_roadmap
+from backend.database import engine
+from backend.models import User, Topic, Progress
+
+def _add_topics(session, user, topics: int, modules: int):
+    first_modules = []
+    for t in range(topics):
+        topic = Topic(title=f"Topic {t}", difficulty="Beginner", duration_days=modules, description="", user_id=user.id)
+        session.add(topic)
+        session.flush()
+        roadmap = [{"title": f"M{i}", "description": "", "order_index": i} for i in range(1, modules + 1)]
+        first_modules.append(save_roadmap(session, topic, roadmap)[0].id)
+    session.flush()
+    # Complete the first module of every topic so the resume lookup runs too
+    for progress in session.exec(select(Progress).where(Progress.module_id.in_(first_modules))).all():
+        progress.is_completed = True
+        progress.score = 80
+        progress.completed_at = datetime.utcnow()
+        session.add(progress)
+    session.commit()
+
+def _dashboard_queries(client, user):
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': user.username})}"}
+    # The first call also builds the user's stats row and caches the token
+    assert client.get("/progress/dashboard", headers=headers).status_code == 200
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        response = client.get("/progress/dashboard", headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert response.status_code == 200
+    return len(statements), response.json()
+
+def test_dashboard_query_count_does_not_grow_with_topics(client, session, user):
+    _add_topics(session, user, topics=1, modules=2)
+    small, small_body = _dashboard_queries(client, user)
+    assert len(small_body["topics"]) == 1
+
+    big_user = User(username=f"{user.username}-big", email=f"big-{user.email}", hashed_password="x")
+    session.add(big_user)
+    session.commit()
+    session.refresh(big_user)
+    _add_topics(session, big_user, topics=12, modules=6)
+    big, big_body = _dashboard_queries(client, big_user)
+    assert len(big_body["topics"]) == 12
+    assert big_body["stats"]["total_modules"] == 72
+
+    assert big == small
+    assert big_body["resume_module"] is not None
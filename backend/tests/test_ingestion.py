@@ -0,0 +1,36 @@
+import asyncio
+import time
+import pytest
+from fastapi import HTTPException
+from backend.ingestion import DocumentExtractor
+
+def test_timeout_does_not_kill_other_extractions():
+    extractor = DocumentExtractor(workers=2, max_pending=4, timeout=4)
+
+    async def scenario():
+        # Spawn both workers first so start-up time doesn't count against the timeout
+        await asyncio.gather(extractor._run(time.sleep, 0.5), extractor._run(time.sleep, 0.5))
+        old_pool = extractor.pool
+        stuck = asyncio.create_task(extractor._run(time.sleep, 60))
+        await asyncio.sleep(2)
+        # Still running on the old pool when the stuck call times out
+        healthy = asyncio.create_task(extractor._run(time.sleep, 3))
+
+        with pytest.raises(HTTPException) as error:
+            await stuck
+        assert error.value.status_code == 422
+        assert extractor.pool is not old_pool
+        processes = list(old_pool._processes.values())
+        assert all(p.is_alive() for p in processes)
+
+        assert await healthy is None
+        # Retired once its last call finished, taking the stuck worker with it
+        for process in processes:
+            process.join(5)
+        assert not any(p.is_alive() for p in processes)
+        assert await extractor._run(time.sleep, 0) is None
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        extractor.stop()
@@ -0,0 +1,31 @@
+import json
+from backend.models import Topic, Module, Quiz, Progress, User
+
+def _module_with_quiz(session, owner):
+    topic = Topic(title="Graphs", difficulty="Beginner", duration_days=2, description="", user_id=owner.id)
+    session.add(topic)
+    session.flush()
+    module = Module(title="Intro", description="", order_index=1, topic_id=topic.id, content_status="ready")
+    session.add(module)
+    session.flush()
+    quiz = Quiz(question="q", options=json.dumps(["a", "b"]), correct_answer="a", module_id=module.id)
+    session.add_all([quiz, Progress(user_id=owner.id, topic_id=topic.id, module_id=module.id, is_completed=False, score=0)])
+    session.commit()
+    return module, quiz
+
+def test_submit_quiz_on_someone_elses_module_is_forbidden(client, session, auth_headers):
+    owner = User(username="quiz-owner", email="quiz-owner@example.com", hashed_password="x")
+    session.add(owner)
+    session.commit()
+    module, quiz = _module_with_quiz(session, owner)
+
+    answers = {"answers": [{"quiz_id": quiz.id, "selected_option": "a"}]}
+    response = client.post(f"/learning/module/{module.id}/submit_quiz", json=answers, headers=auth_headers)
+    assert response.status_code == 403
+
+def test_submit_quiz_grades_own_module(client, session, user, auth_headers):
+    module, quiz = _module_with_quiz(session, user)
+    answers = {"answers": [{"quiz_id": quiz.id, "selected_option": "a"}]}
+    response = client.post(f"/learning/module/{module.id}/submit_quiz", json=answers, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["score"] == 100
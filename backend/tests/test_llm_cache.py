@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlmodel import Session
+from backend import llm_cache
+from backend.database import engine
+from backend.models import LLMCacheEntry
+
+def _writes_during(fn, *args):
+    statements = []
+    listener = lambda conn, cursor, statement, *rest: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        result = fn(*args)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    return result, [s for s in statements if not s.lstrip().upper().startswith("SELECT")]
+
+def test_recent_hit_is_read_only():
+    llm_cache.put("recent-hit", "test", {"a": 1})
+    result, writes = _writes_during(llm_cache.get, "recent-hit")
+    assert result == {"a": 1}
+    assert writes == []
+
+def test_hit_refreshes_old_access_time():
+    llm_cache.put("old-hit", "test", {"a": 1})
+    old = datetime.utcnow() - timedelta(seconds=llm_cache.LLM_CACHE_TOUCH_SECONDS + 60)
+    with Session(engine) as session:
+        entry = session.get(LLMCacheEntry, "old-hit")
+        entry.last_accessed = old
+        session.add(entry)
+        session.commit()
+
+    result, writes = _writes_during(llm_cache.get, "old-hit")
+    assert result == {"a": 1}
+    assert len(writes) == 1
+    with Session(engine) as session:
+        assert session.get(LLMCacheEntry, "old-hit").last_accessed > old
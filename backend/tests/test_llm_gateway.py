@@ -0,0 +1,62 @@
+import asyncio
+import httpx
+import openai
+import pytest
+from backend.llm_gateway import LLMGateway, CircuitBreaker, LLMUnavailable
+
+class FakeProvider:
+    def __init__(self):
+        self.block = False
+        self.fail = False
+        self.calls = 0
+
+    async def create(self, **request):
+        self.calls += 1
+        if self.block:
+            await asyncio.sleep(3600)
+        if self.fail:
+            raise openai.APIConnectionError(request=httpx.Request("POST", "http://llm.test"))
+        return "ok"
+
+def _half_open_gateway():
+    provider = FakeProvider()
+    gateway = LLMGateway(provider)
+    gateway.breaker = CircuitBreaker(max_failures=1, reset_seconds=0.05)
+    gateway.breaker.record_failure()
+    return gateway, provider
+
+def test_cancelled_trial_releases_half_open_slot():
+    async def scenario():
+        gateway, provider = _half_open_gateway()
+        await asyncio.sleep(0.06)
+        assert gateway.breaker.state == "half_open"
+
+        provider.block = True
+        trial = asyncio.create_task(gateway.create(model="m", messages=[]))
+        await asyncio.sleep(0.01)
+        assert gateway.breaker.trial_running
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        assert not gateway.breaker.trial_running
+
+        # The next call becomes the trial and closes the breaker
+        provider.block = False
+        assert await gateway.create(model="m", messages=[]) == "ok"
+        assert gateway.breaker.state == "closed"
+    asyncio.run(scenario())
+
+def test_failed_trial_reopens_breaker(monkeypatch):
+    monkeypatch.setattr("backend.llm_gateway.LLM_MAX_RETRIES", 0)
+    async def scenario():
+        gateway, provider = _half_open_gateway()
+        await asyncio.sleep(0.06)
+        provider.fail = True
+        with pytest.raises(LLMUnavailable):
+            await gateway.create(model="m", messages=[])
+        assert gateway.breaker.state == "open"
+        calls = provider.calls
+        with pytest.raises(LLMUnavailable):
+            await gateway.create(model="m", messages=[])
+        assert provider.calls == calls
+    asyncio.run(scenario())
@@ -0,0 +1,22 @@
+from backend import auth, metrics
+
+def test_metrics_requires_authentication(client):
+    assert client.get("/metrics").status_code == 401
+
+def test_metrics_hidden_from_regular_users(client, auth_headers):
+    assert client.get("/metrics", headers=auth_headers).status_code == 403
+
+def test_metrics_for_admins(client, auth_headers, user, monkeypatch):
+    monkeypatch.setattr(auth, "ADMIN_USERNAMES", {user.username})
+    response = client.get("/metrics", headers=auth_headers)
+    assert response.status_code == 200
+    assert "http_request_duration_seconds_bucket" in response.text
+
+def test_metrics_for_scraper_token(client, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "scrape-secret")
+    assert client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"}).status_code == 200
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+
+def test_metrics_public_opt_out(client, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_PUBLIC", True)
+    assert client.get("/metrics").status_code == 200
@@ -0,0 +1,87 @@
+import pytest
+from sqlmodel import select
+from backend.models import MockExam, MockAttempt, MockQuestion
+from backend.mock_questions import question_rows, answer_rows, grade_attempt
+
+def test_generated_exam_response_leaves_out_legacy_column(client, auth_headers):
+    body = {"topic_name": "Sorting", "difficulty": "Easy", "count": 3}
+    response = client.post("/mock-exam/generate", json=body, headers=auth_headers)
+    assert response.status_code == 200
+    exam = response.json()
+    assert "questions_json" not in exam
+    assert exam["topic_name"] == "Sorting"
+    assert exam["questions"]
+
+    stored = client.get(f"/mock-exam/{exam['id']}", headers=auth_headers).json()
+    assert stored["questions"] == exam["questions"]
+
+def _take_exam(client, auth_headers):
+    body = {"topic_name": "Heaps", "difficulty": "Medium", "count": 2}
+    exam = client.post("/mock-exam/generate", json=body, headers=auth_headers).json()
+    answers = [{"question_index": i, "answer": q.get("correct_answer")} for i, q in enumerate(exam["questions"])]
+    client.post(f"/mock-exam/{exam['id']}/submit", json=answers, headers=auth_headers)
+
+def test_history_stays_a_bare_list(client, auth_headers):
+    _take_exam(client, auth_headers)
+    history = client.get("/mock-exam/history", headers=auth_headers).json()
+    assert isinstance(history, list)
+    assert history[0]["topic"] == "Heaps"
+
+def test_history_page_adds_totals(client, auth_headers):
+    _take_exam(client, auth_headers)
+    _take_exam(client, auth_headers)
+    page = client.get("/mock-exam/history/page", params={"limit": 1}, headers=auth_headers).json()
+    assert len(page["items"]) == 1
+    assert page["has_more"]
+    assert page["totals"]["attempts"] == 2
+
+QUESTIONS = [
+    {"type": "mcq", "question": "q0", "options": ["Heap", "Stack"], "correct_answer": "Heap"},
+    {"type": "boolean", "question": "q1", "correct_answer": "True"},
+    {"type": "mcq", "question": "q2", "options": ["1", "2"], "correct_answer": 2},
+    {"type": "code", "question": "q3", "test_case_input": "1", "test_case_output": "1"},
+    {"type": "essay", "question": "q4", "correct_answer": "anything"},
+]
+
+ANSWER_SETS = [
+    [],
+    [{"question_index": i, "answer": a} for i, a in enumerate(["Heap", "True", "2", "def f(x): return x", "anything"])],
+    [{"question_index": i, "answer": a} for i, a in enumerate(["  heap ", True, 2, "short", "x"])],
+    [{"question_index": i, "answer": a} for i, a in enumerate(["Stack", "false", "1", None, None])],
+    [{"question_index": 0, "answer": "HEAP"}, {"question_index": 3, "answer": 12345678901}, {"question_index": 9, "answer": "Heap"}],
+]
+
+def _json_score(questions, answers):
+    # Grading as submit_exam did it over questions_json, before MockAnswer rows
+    score = 0
+    for ans_obj in answers:
+        q_idx = ans_obj.get("question_index")
+        user_ans = ans_obj.get("answer")
+        if q_idx is not None and 0 <= q_idx < len(questions):
+            question = questions[q_idx]
+            q_type = question.get("type", "mcq")
+            if q_type in ["mcq", "boolean"]:
+                if str(user_ans).lower().strip() == str(question.get("correct_answer")).lower().strip():
+                    score += 1
+            elif q_type == "code":
+                if user_ans and len(str(user_ans)) > 10:
+                    score += 1
+    return score
+
+@pytest.mark.parametrize("answers", ANSWER_SETS)
+def test_sql_grading_matches_json_grading(session, user, answers):
+    exam = MockExam(user_id=user.id, topic_name="Heaps", difficulty="Easy")
+    session.add(exam)
+    session.flush()
+    session.add_all(question_rows(exam.id, QUESTIONS))
+    attempt = MockAttempt(mock_exam_id=exam.id, user_id=user.id, score=0, total_questions=len(QUESTIONS), passed=False)
+    session.add(attempt)
+    session.flush()
+    question_ids = dict(session.exec(
+        select(MockQuestion.position, MockQuestion.id).where(MockQuestion.mock_exam_id == exam.id)
+    ).all())
+    session.add_all(answer_rows(attempt.id, question_ids, answers))
+    session.flush()
+
+    assert grade_attempt(session, attempt.id) == _json_score(QUESTIONS, answers)
+    session.rollback()
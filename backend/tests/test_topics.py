@@ -0,0 +1,28 @@
+import time
+from backend.models import Topic
+
+def _topic(session, user, status):
+    topic = Topic(title="Graphs", difficulty="Beginner", duration_days=3, description="", user_id=user.id, status=status)
+    session.add(topic)
+    session.commit()
+    return topic
+
+def test_retry_regenerates_failed_roadmap(client, session, user, auth_headers):
+    topic = _topic(session, user, "failed")
+    response = client.post(f"/topics/{topic.id}/retry", headers=auth_headers)
+    assert response.status_code == 200
+    job_id = response.json()["id"]
+
+    for _ in range(100):
+        job = client.get(f"/topics/jobs/{job_id}", headers=auth_headers).json()
+        if job["status"] not in ("queued", "running"):
+            break
+        time.sleep(0.05)
+    assert job["status"] == "done"
+    details = client.get(f"/topics/{topic.id}", headers=auth_headers).json()
+    assert details["status"] == "ready"
+    assert details["modules"]
+
+def test_retry_only_for_failed_topics(client, session, user, auth_headers):
+    topic = _topic(session, user, "ready")
+    assert client.post(f"/topics/{topic.id}/retry", headers=auth_headers).status_code == 409
@@ -0,0 +1,49 @@
+import time
+from sqlmodel import select
+from backend.models import Quiz, UserStats
+from backend.user_stats import COUNTERS, compute_user_stats
+
+def _assert_stats_match(session, user):
+    session.expire_all()
+    stored = session.get(UserStats, user.id)
+    fresh = compute_user_stats(session, user.id)
+    assert {n: getattr(stored, n) for n in COUNTERS} == {n: getattr(fresh, n) for n in COUNTERS}
+
+def _create_topic(client, headers):
+    body = {"title": "Tries", "difficulty": "Beginner", "duration_days": 2, "description": ""}
+    created = client.post("/topics/", json=body, headers=headers).json()
+    for _ in range(100):
+        job = client.get(f"/topics/jobs/{created['job_id']}", headers=headers).json()
+        if job["status"] not in ("queued", "running"):
+            break
+        time.sleep(0.05)
+    assert job["status"] == "done"
+    return client.get(f"/topics/{created['id']}", headers=headers).json()
+
+def test_incremental_stats_match_recomputed_stats(client, session, user, auth_headers):
+    # The first dashboard read builds the row; everything after is incremental
+    assert client.get("/progress/dashboard", headers=auth_headers).status_code == 200
+    topic = _create_topic(client, auth_headers)
+    _assert_stats_match(session, user)
+
+    module_id = topic["modules"][0]["id"]
+    assert client.get(f"/learning/module/{module_id}", headers=auth_headers).status_code == 200
+    quizzes = session.exec(select(Quiz).where(Quiz.module_id == module_id)).all()
+    answers = [{"quiz_id": q.id, "selected_option": q.correct_answer} for q in quizzes]
+    response = client.post(f"/learning/module/{module_id}/submit_quiz", json={"answers": answers}, headers=auth_headers)
+    assert response.status_code == 200
+    _assert_stats_match(session, user)
+
+    exam = client.post("/mock-exam/generate", json={"topic_name": "Tries", "difficulty": "Easy", "count": 2}, headers=auth_headers).json()
+    exam_answers = [{"question_index": i, "answer": q.get("correct_answer")} for i, q in enumerate(exam["questions"])]
+    assert client.post(f"/mock-exam/{exam['id']}/submit", json=exam_answers, headers=auth_headers).status_code == 200
+    _assert_stats_match(session, user)
+
+    chat = client.post("/chat/sessions", headers=auth_headers).json()
+    assert client.post(f"/chat/sessions/{chat['id']}/messages", json={"content": "hi"}, headers=auth_headers).status_code == 200
+    _assert_stats_match(session, user)
+
+    stored = session.get(UserStats, user.id)
+    assert stored.total_modules == len(topic["modules"])
+    assert stored.modules_completed == 1
+    assert stored.mock_taken == 1
@@ -0,0 +1,72 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from sqlalchemy import event
+from .models import User
+
+# Maps a validated access token to a snapshot of its user so authenticated
+# requests skip both the JWT signature check and the User lookup.
+USER_CACHE_ENABLED = os.getenv("USER_CACHE_ENABLED", "1") == "1"
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", 60))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", 10000))
+
+cache_stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+_entries = OrderedDict()  # token -> (expires_at, username, user fields)
+_lock = threading.Lock()
+
+def get(token: str):
+    if not USER_CACHE_ENABLED:
+        return None
+    now = time.time()
+    with _lock:
+        entry = _entries.get(token)
+        if entry is None or entry[0] <= now:
+            if entry is not None:
+                del _entries[token]
+            cache_stats["misses"] += 1
+            return None
+        _entries.move_to_end(token)
+        cache_stats["hits"] += 1
+        data = entry[2]
+    # Every caller gets its own detached copy, never a shared instance. It has
+    # no session, so relationships (user.topics) can't load; query by user.id
+    return User(**data)
+
+def put(token: str, token_expires_at: float, user: User):
+    if not USER_CACHE_ENABLED:
+        return
+    expires_at = min(time.time() + USER_CACHE_TTL_SECONDS, token_expires_at)
+    with _lock:
+        _entries[token] = (expires_at, user.username, user.model_dump())
+        _entries.move_to_end(token)
+        while len(_entries) > USER_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+            cache_stats["evictions"] += 1
+
+def invalidate_user(username: str):
+    with _lock:
+        stale = [token for token, entry in _entries.items() if entry[1] == username]
+        for token in stale:
+            del _entries[token]
+        cache_stats["invalidations"] += len(stale)
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+def get_cache_stats():
+    lookups = cache_stats["hits"] + cache_stats["misses"]
+    return {
+        **cache_stats,
+        "size": len(_entries),
+        "hit_rate": round(cache_stats["hits"] / lookups, 3) if lookups else None,
+    }
+
+# Any ORM update or delete of a user (email change, password change, account
+# removal) drops that user's cached tokens.
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_on_write(mapper, connection, target):
+    invalidate_user(target.username)
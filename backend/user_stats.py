@@ -0,0 +1,248 @@
+"""
+Per-user dashboard totals, maintained incrementally by the write paths
+(quiz submit, mock exam submit, topic create/delete) inside their own
+transactions, so the dashboard reads a single row. The streak follows the
+DailyActivity rollups written by activity.py.
+
+rebuild_user_stats recomputes a row from the raw Progress/MockAttempt/Module
+rows and is the reference definition. To rebuild or check every user:
+
+    python -m backend.user_stats rebuild
+    python -m backend.user_stats check
+"""
+import sys
+from datetime import datetime, timedelta, date
+from typing import Optional
+from sqlmodel import Session, select
+from sqlalchemy import func, case, update
+from .models import UserStats, Progress, Module, Topic, MockAttempt, User, DailyActivity
+
+COUNTERS = [
+    "total_topics", "total_modules", "modules_completed", "topics_started", "topics_done",
+    "score_sum", "score_count", "progress_xp", "mock_taken", "mock_passed", "mock_xp",
+    "streak_days", "last_active_date",
+]
+
+def progress_xp(is_completed: bool, score: Optional[int]) -> int:
+    # 10 per completed module plus a tenth of its score
+    return (10 + (score or 0) // 10) if is_completed else 0
+
+def current_streak(stats: UserStats, today: Optional[date] = None) -> int:
+    today = today or datetime.utcnow().date()
+    if stats.last_active_date and stats.last_active_date >= today - timedelta(days=1):
+        return stats.streak_days
+    return 0
+
+def get_user_stats(session: Session, user_id: int) -> UserStats:
+    stats = session.get(UserStats, user_id)
+    if stats is None:
+        stats = rebuild_user_stats(session, user_id)
+        session.commit()
+    return stats
+
+def _bump(session: Session, user_id: int, **deltas):
+    """Applies counter deltas atomically (col = col + delta). Pending changes are
+    flushed first so a missing row is rebuilt including them."""
+    session.flush()
+    if session.get(UserStats, user_id) is None:
+        rebuild_user_stats(session, user_id)
+        return False
+    deltas = {k: v for k, v in deltas.items() if v}
+    if deltas:
+        session.execute(
+            update(UserStats)
+            .where(UserStats.user_id == user_id)
+            .values(updated_at=datetime.utcnow(), **{k: getattr(UserStats, k) + v for k, v in deltas.items()})
+        )
+    return True
+
+def _topic_completion(session: Session, user_id: int, topic_id: int):
+    total = session.exec(select(func.count(Module.id)).where(Module.topic_id == topic_id)).one()
+    completed = session.exec(
+        select(func.count(Progress.id)).where(Progress.user_id == user_id, Progress.topic_id == topic_id, Progress.is_completed)
+    ).one()
+    return total, completed
+
+def record_quiz_result(session: Session, progress: Progress, was_completed: bool, old_score: Optional[int]):
+    """Call after updating a Progress row for a quiz attempt, before committing."""
+    user_id = progress.user_id
+    newly_completed = progress.is_completed and not was_completed
+    deltas = {
+        "modules_completed": 1 if newly_completed else 0,
+        "score_sum": (progress.score if (progress.score or 0) > 0 else 0) - (old_score if (old_score or 0) > 0 else 0),
+        "score_count": (1 if (progress.score or 0) > 0 else 0) - (1 if (old_score or 0) > 0 else 0),
+        "progress_xp": progress_xp(progress.is_completed, progress.score) - progress_xp(was_completed, old_score),
+    }
+    if newly_completed:
+        total, completed = _topic_completion(session, user_id, progress.topic_id)
+        if completed == 1:
+            deltas["topics_started"] = 1
+        if total > 0 and completed == total:
+            deltas["topics_done"] = 1
+    _bump(session, user_id, **deltas)
+
+def record_active_day(session: Session, user_id: int, day: date):
+    """Extends or restarts the streak; called by activity.record_activity."""
+    if not _bump(session, user_id):
+        return
+    stats = session.get(UserStats, user_id)
+    session.refresh(stats)
+    if stats.last_active_date is None or day > stats.last_active_date:
+        if stats.last_active_date == day - timedelta(days=1):
+            stats.streak_days += 1
+        else:
+            stats.streak_days = 1
+        stats.last_active_date = day
+        session.add(stats)
+
+def record_mock_attempt(session: Session, attempt: MockAttempt):
+    _bump(
+        session,
+        attempt.user_id,
+        mock_taken=1,
+        mock_passed=1 if attempt.passed else 0,
+        mock_xp=attempt.score * 10 if attempt.passed else 0
+    )
+
+def record_topic_created(session: Session, user_id: int):
+    _bump(session, user_id, total_topics=1)
+
+def record_modules_added(session: Session, user_id: int, count: int):
+    _bump(session, user_id, total_modules=count)
+
+def record_topic_deleted(session: Session, user_id: int, topic_id: int):
+    """Call before deleting the topic's rows."""
+    if session.get(UserStats, user_id) is None:
+        # Rebuilt from scratch on next read
+        return
+    total, completed = _topic_completion(session, user_id, topic_id)
+    score_sum, score_count, xp = session.exec(
+        select(
+            func.coalesce(func.sum(case((Progress.score > 0, Progress.score))), 0),
+            func.count(case((Progress.score > 0, 1))),
+            func.coalesce(func.sum(case((Progress.is_completed, 10 + func.coalesce(Progress.score, 0) // 10))), 0)
+        ).where(Progress.user_id == user_id, Progress.topic_id == topic_id)
+    ).one()
+    _bump(
+        session,
+        user_id,
+        total_topics=-1,
+        total_modules=-total,
+        modules_completed=-completed,
+        topics_started=-1 if completed > 0 else 0,
+        topics_done=-1 if total > 0 and completed == total else 0,
+        score_sum=-score_sum,
+        score_count=-score_count,
+        progress_xp=-xp
+    )
+
+def _compute_streak(session: Session, user_id: int):
+    """Returns (streak_days, last_active_date) for the run of active days ending at the latest one."""
+    days = session.exec(
+        select(DailyActivity.day)
+        .where(DailyActivity.user_id == user_id, DailyActivity.total > 0)
+        .order_by(DailyActivity.day.desc())
+    )
+    streak = 0
+    last_active_date = None
+    expected = None
+    for d in days:
+        if expected is None:
+            last_active_date = expected = d
+        if d != expected:
+            break
+        streak += 1
+        expected = d - timedelta(days=1)
+    return streak, last_active_date
+
+def compute_user_stats(session: Session, user_id: int) -> UserStats:
+    """Computes the stats row from raw rows without saving it."""
+    modules_completed, score_sum, score_count, xp = session.exec(
+        select(
+            func.count(case((Progress.is_completed, 1))),
+            func.coalesce(func.sum(case((Progress.score > 0, Progress.score))), 0),
+            func.count(case((Progress.score > 0, 1))),
+            func.coalesce(func.sum(case((Progress.is_completed, 10 + func.coalesce(Progress.score, 0) // 10))), 0)
+        ).where(Progress.user_id == user_id)
+    ).one()
+
+    module_counts = select(Module.topic_id, func.count(Module.id).label("total")).group_by(Module.topic_id).subquery()
+    completed_counts = (
+        select(Progress.topic_id, func.count(Progress.id).label("completed"))
+        .where(Progress.user_id == user_id, Progress.is_completed)
+        .group_by(Progress.topic_id)
+        .subquery()
+    )
+    topic_rows = session.exec(
+        select(func.coalesce(module_counts.c.total, 0), func.coalesce(completed_counts.c.completed, 0))
+        .select_from(Topic)
+        .outerjoin(module_counts, module_counts.c.topic_id == Topic.id)
+        .outerjoin(completed_counts, completed_counts.c.topic_id == Topic.id)
+        .where(Topic.user_id == user_id)
+    ).all()
+
+    mock_taken, mock_passed, mock_xp = session.exec(
+        select(
+            func.count(MockAttempt.id),
+            func.count(case((MockAttempt.passed, 1))),
+            func.coalesce(func.sum(case((MockAttempt.passed, MockAttempt.score * 10))), 0)
+        ).where(MockAttempt.user_id == user_id)
+    ).one()
+
+    streak, last_active_date = _compute_streak(session, user_id)
+
+    return UserStats(
+        user_id=user_id,
+        total_topics=len(topic_rows),
+        total_modules=sum(total for total, _ in topic_rows),
+        modules_completed=modules_completed,
+        topics_started=sum(1 for total, completed in topic_rows if total > 0 and completed > 0),
+        topics_done=sum(1 for total, completed in topic_rows if total > 0 and completed == total),
+        score_sum=score_sum,
+        score_count=score_count,
+        progress_xp=xp,
+        mock_taken=mock_taken,
+        mock_passed=mock_passed,
+        mock_xp=mock_xp,
+        streak_days=streak,
+        last_active_date=last_active_date,
+    )
+
+def rebuild_user_stats(session: Session, user_id: int) -> UserStats:
+    fresh = compute_user_stats(session, user_id)
+    stats = session.get(UserStats, user_id) or UserStats(user_id=user_id)
+    for name in COUNTERS:
+        setattr(stats, name, getattr(fresh, name))
+    stats.updated_at = datetime.utcnow()
+    session.add(stats)
+    session.flush()
+    return stats
+
+def main(argv):
+    from .database import engine, create_db_and_tables
+    if len(argv) != 1 or argv[0] not in ("rebuild", "check"):
+        print("usage: python -m backend.user_stats rebuild|check")
+        return 2
+    create_db_and_tables()
+    mismatched = 0
+    with Session(engine) as session:
+        user_ids = session.exec(select(User.id)).all()
+        for user_id in user_ids:
+            if argv[0] == "rebuild":
+                rebuild_user_stats(session, user_id)
+                continue
+            stored = session.get(UserStats, user_id)
+            fresh = compute_user_stats(session, user_id)
+            diffs = {n: (getattr(stored, n, None), getattr(fresh, n)) for n in COUNTERS if getattr(stored, n, None) != getattr(fresh, n)}
+            if diffs:
+                mismatched += 1
+                print(f"user {user_id}: " + ", ".join(f"{n} stored={a} actual={b}" for n, (a, b) in diffs.items()))
+        session.commit()
+    if argv[0] == "rebuild":
+        print(f"Rebuilt stats for {len(user_ids)} users")
+    else:
+        print(f"{mismatched} of {len(user_ids)} users out of date")
+    return 1 if mismatched else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
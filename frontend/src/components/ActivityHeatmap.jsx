@@ -1,21 +1,20 @@
 import React from 'react';
 
 const ActivityHeatmap = ({ data }) => {
-    // Data is list of { date: "YYYY-MM-DD", count: int }
-    // We need to generate a grid of last 365 days (or similar)
-    // For simplicity MVP: Last 60 days
+    // Data is list of { date: "YYYY-MM-DD", count: int }, one entry per active day
+    // We generate a grid of the last 365 days
 
     const generateDays = () => {
+        const counts = new Map(data.map(item => [item.date, item.count]));
         const days = [];
         const today = new Date();
-        for (let i = 59; i >= 0; i--) {
+        for (let i = 364; i >= 0; i--) {
             const d = new Date(today);
             d.setDate(d.getDate() - i);
             const dateStr = d.toISOString().split('T')[0];
-            const activity = data.find(item => item.date === dateStr);
             days.push({
                 date: dateStr,
-                count: activity ? activity.count : 0
+                count: counts.get(dateStr) || 0
             });
         }
         return days;
@@ -32,7 +31,7 @@ const ActivityHeatmap = ({ data }) => {
 
     return (
         <div className="glass-panel" style={{ padding: '1.5rem', marginTop: '1rem' }}>
-            <h3 style={{ marginTop: 0 }}>Activity (Last 60 Days)</h3>
+            <h3 style={{ marginTop: 0 }}>Activity (Last Year)</h3>
             <div style={{
                 display: 'flex',
                 flexWrap: 'wrap',
@@ -6,6 +6,10 @@ import toast from 'react-hot-toast';
 import ReactMarkdown from 'react-markdown';
 import remarkGfm from 'remark-gfm';
 
+// Sessions and messages are paged by id; older pages load on demand
+const SESSION_PAGE_SIZE = 30;
+const MESSAGE_PAGE_SIZE = 50;
+
 const ChatMentor = () => {
     const { user } = useAuth();
     const [sessions, setSessions] = useState([]);
@@ -16,6 +20,9 @@ const ChatMentor = () => {
     const [uploading, setUploading] = useState(false);
     const [pendingFile, setPendingFile] = useState(null);
     const messagesEndRef = useRef(null);
+    const keepScrollRef = useRef(false);
+    const [hasMoreSessions, setHasMoreSessions] = useState(false);
+    const [hasOlderMessages, setHasOlderMessages] = useState(false);
     const [isSidebarOpen, setIsSidebarOpen] = useState(true);
 
     useEffect(() => {
@@ -33,6 +40,11 @@ const ChatMentor = () => {
     }, [currentSessionId]);
 
     useEffect(() => {
+        // Prepending older history should not jump to the bottom
+        if (keepScrollRef.current) {
+            keepScrollRef.current = false;
+            return;
+        }
         scrollToBottom();
     }, [messages]);
 
@@ -40,10 +52,11 @@ const ChatMentor = () => {
         messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
     };
 
-    const loadSessions = async () => {
+    const loadSessions = async (before) => {
         try {
-            const res = await api.get('/chat/sessions');
-            setSessions(res.data);
+            const res = await api.get('/chat/sessions', { params: { limit: SESSION_PAGE_SIZE, before } });
+            setSessions(prev => before ? [...prev, ...res.data] : res.data);
+            setHasMoreSessions(res.data.length === SESSION_PAGE_SIZE);
         } catch (err) {
             console.error(err);
         }
@@ -51,10 +64,25 @@ const ChatMentor = () => {
 
     const loadMessages = async (id) => {
         try {
-            const res = await api.get(`/chat/sessions/${id}`);
+            const res = await api.get(`/chat/sessions/${id}`, { params: { limit: MESSAGE_PAGE_SIZE } });
             setMessages(res.data);
+            setHasOlderMessages(res.data.length === MESSAGE_PAGE_SIZE);
+        } catch (err) {
+            console.error(err);
+        }
+    };
+
+    const loadOlderMessages = async () => {
+        const oldest = messages.find(m => m.id);
+        if (!oldest) return;
+        try {
+            const res = await api.get(`/chat/sessions/${currentSessionId}`, { params: { limit: MESSAGE_PAGE_SIZE, before: oldest.id } });
+            keepScrollRef.current = true;
+            setMessages(prev => [...res.data, ...prev]);
+            setHasOlderMessages(res.data.length === MESSAGE_PAGE_SIZE);
         } catch (err) {
             console.error(err);
+            toast.error("Failed to load older messages");
         }
     };
 
@@ -65,6 +93,7 @@ const ChatMentor = () => {
             setSessions([res.data, ...sessions]);
             setCurrentSessionId(res.data.id);
             setMessages([]);
+            setHasOlderMessages(false);
             setPendingFile(null);
             if (window.innerWidth < 768) setIsSidebarOpen(false);
         } catch (err) {
@@ -97,6 +126,8 @@ const ChatMentor = () => {
                 setUploading(true);
                 const formData = new FormData();
                 formData.append('file', pendingFile);
+                // Indexed for this chat; only relevant passages reach the model
+                formData.append('session_id', currentSessionId);
 
                 try {
                     const uploadRes = await api.post('/chat/upload', formData, {
@@ -125,8 +156,46 @@ const ChatMentor = () => {
             setMessages(prev => [...prev, optimisticMsg]);
             setInput('');
 
-            const res = await api.post(`/chat/sessions/${currentSessionId}/messages`, { content: finalContent });
-            setMessages(prev => [...prev, res.data]);
+            // Stream the reply so tokens render as soon as they arrive
+            const res = await fetch(`${api.defaults.baseURL}/chat/sessions/${currentSessionId}/messages/stream`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    Authorization: `Bearer ${localStorage.getItem('token')}`
+                },
+                body: JSON.stringify({ content: finalContent })
+            });
+            if (!res.ok || !res.body) throw new Error(`Stream failed: ${res.status}`);
+
+            setMessages(prev => [...prev, { role: 'assistant', content: '' }]);
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                for (const line of lines) {
+                    if (!line.trim()) continue;
+                    const event = JSON.parse(line);
+                    if (event.type === 'error') {
+                        // The reply broke off mid-stream and was not saved, so drop it
+                        setMessages(prev => prev.slice(0, -1));
+                        toast.error(event.detail);
+                        continue;
+                    }
+                    setMessages(prev => {
+                        const next = [...prev];
+                        const last = next[next.length - 1];
+                        next[next.length - 1] = event.type === 'done'
+                            ? event.message
+                            : { ...last, content: last.content + event.content };
+                        return next;
+                    });
+                }
+            }
 
             // If it's a new chat, refresh to get the AI-generated title
             if (messages.length === 0) loadSessions();
@@ -318,6 +387,14 @@ const ChatMentor = () => {
                             </button>
                         </div>
                     ))}
+                    {hasMoreSessions && (
+                        <button
+                            onClick={() => loadSessions(sessions[sessions.length - 1].id)}
+                            style={{ width: '100%', background: 'transparent', border: 'none', color: '#94a3b8', padding: '0.75rem', cursor: 'pointer', fontSize: '0.85rem' }}
+                        >
+                            Load older sessions
+                        </button>
+                    )}
                     {sessions.length === 0 && (
                         <div style={{ padding: '2rem 1rem', textAlign: 'center', color: '#64748b', fontSize: '0.85rem', fontStyle: 'italic' }}>
                             No past sessions found. Start a new topic!
@@ -391,6 +468,14 @@ const ChatMentor = () => {
                         </div>
                     ) : (
                         <div style={{ maxWidth: '900px', margin: '0 auto', width: '100%', display: 'flex', flexDirection: 'column', gap: '2rem' }}>
+                            {hasOlderMessages && (
+                                <button
+                                    onClick={loadOlderMessages}
+                                    style={{ alignSelf: 'center', background: 'rgba(255,255,255,0.05)', border: '1px solid rgba(255,255,255,0.1)', color: '#94a3b8', padding: '0.5rem 1.25rem', borderRadius: '999px', cursor: 'pointer', fontSize: '0.85rem' }}
+                                >
+                                    Load earlier messages
+                                </button>
+                            )}
                             {messages.map((msg, idx) => (
                                 <div key={idx} style={{
                                     display: 'flex',
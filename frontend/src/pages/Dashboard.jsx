@@ -44,12 +44,13 @@ const Dashboard = () => {
         e.preventDefault();
         setLoading(true);
         try {
-            await api.post('/topics/', newTopic);
+            const created = await api.post('/topics/', newTopic);
             setShowModal(false);
             setNewTopic({ title: '', difficulty: 'Medium', duration_days: 7, description: '' });
             // Refresh
             const res = await api.get('/topics/');
             setTopics(res.data);
+            waitForRoadmap(created.data.job_id);
         } catch (err) {
             alert('Failed to create topic');
             console.error(err);
@@ -59,6 +60,33 @@ const Dashboard = () => {
     };
 
 
+    // The roadmap is generated in the background; poll its job until it finishes
+    const waitForRoadmap = async (jobId) => {
+        try {
+            let job;
+            do {
+                await new Promise(resolve => setTimeout(resolve, 2000));
+                job = (await api.get(`/topics/jobs/${jobId}`)).data;
+            } while (job.status === 'queued' || job.status === 'running');
+            const res = await api.get('/topics/');
+            setTopics(res.data);
+        } catch (err) {
+            console.error(err);
+        }
+    };
+
+    const handleRetry = async (id) => {
+        try {
+            const job = await api.post(`/topics/${id}/retry`);
+            const res = await api.get('/topics/');
+            setTopics(res.data);
+            waitForRoadmap(job.data.id);
+        } catch (err) {
+            alert('Failed to retry roadmap generation');
+            console.error(err);
+        }
+    };
+
     const handleDelete = async (id) => {
         if (!window.confirm("Delete this topic?")) return;
         try {
@@ -183,10 +211,21 @@ const Dashboard = () => {
                         <p style={{ color: 'var(--text-secondary)', fontSize: '0.9rem', marginBottom: '1.5rem' }}>
                             {topic.description}
                         </p>
-                        <Link to={`/roadmap/${topic.id}`} className="btn-primary" style={{ display: 'inline-flex', alignItems: 'center', textDecoration: 'none' }}>
-                            <BookOpen size={18} style={{ marginRight: '8px' }} />
-                            Start Learning
-                        </Link>
+                        {topic.status === 'generating' ? (
+                            <span style={{ color: 'var(--text-secondary)', fontSize: '0.9rem' }}>Generating roadmap...</span>
+                        ) : topic.status === 'failed' ? (
+                            <div style={{ display: 'flex', alignItems: 'center', gap: '1rem' }}>
+                                <span style={{ color: '#ef4444', fontSize: '0.9rem' }}>Roadmap generation failed</span>
+                                <button onClick={() => handleRetry(topic.id)} className="btn-secondary">
+                                    Retry
+                                </button>
+                            </div>
+                        ) : (
+                            <Link to={`/roadmap/${topic.id}`} className="btn-primary" style={{ display: 'inline-flex', alignItems: 'center', textDecoration: 'none' }}>
+                                <BookOpen size={18} style={{ marginRight: '8px' }} />
+                                Start Learning
+                            </Link>
+                        )}
                     </div>
                 ))}
             </div>
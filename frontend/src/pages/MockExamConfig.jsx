@@ -5,6 +5,8 @@ import { PenTool, ArrowLeft, BrainCircuit, History } from 'lucide-react';
 import toast from 'react-hot-toast';
 import { useAuth } from '../context/AuthContext';
 
+const HISTORY_PAGE_SIZE = 24;
+
 const MockExamConfig = () => {
     const navigate = useNavigate();
     const { user } = useAuth();
@@ -15,18 +17,34 @@ const MockExamConfig = () => {
     });
     const [loading, setLoading] = useState(false);
     const [history, setHistory] = useState([]);
+    const [hasMoreHistory, setHasMoreHistory] = useState(false);
+    const [historyTotals, setHistoryTotals] = useState(null);
+    const [historyFilters, setHistoryFilters] = useState({ difficulty: '', passed: '' });
+
+    // History is paged newest first; older pages are fetched with ?before=<last id>.
+    // Filters and totals are computed server-side.
+    const fetchHistory = async (before) => {
+        const params = { limit: HISTORY_PAGE_SIZE, before };
+        if (historyFilters.difficulty) params.difficulty = historyFilters.difficulty;
+        if (historyFilters.passed) params.passed = historyFilters.passed;
+        const res = await api.get('/mock-exam/history/page', { params });
+        setHistory(prev => before ? [...prev, ...res.data.items] : res.data.items);
+        setHasMoreHistory(res.data.has_more);
+        setHistoryTotals(res.data.totals);
+    };
 
     useEffect(() => {
-        const fetchHistory = async () => {
-            try {
-                const res = await api.get('/mock-exam/history');
-                setHistory(res.data);
-            } catch (err) {
-                console.error("Failed to fetch history", err);
-            }
-        };
-        fetchHistory();
-    }, []);
+        fetchHistory().catch(err => console.error("Failed to fetch history", err));
+    }, [historyFilters]);
+
+    const loadOlderHistory = async () => {
+        try {
+            await fetchHistory(history[history.length - 1].id);
+        } catch (err) {
+            console.error("Failed to fetch history", err);
+            toast.error("Failed to load older attempts");
+        }
+    };
 
     const handleStart = async (e) => {
         e.preventDefault();
@@ -146,21 +164,42 @@ const MockExamConfig = () => {
             <div style={{ width: '100%', maxWidth: '800px', marginTop: '3rem', marginBottom: '2rem' }}>
                 <div style={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center', marginBottom: '1rem' }}>
                     <h3 style={{ display: 'flex', alignItems: 'center', gap: '10px', margin: 0, color: '#cbd5e1' }}>
-                        <History size={20} /> Past Attempts ({history.length})
+                        <History size={20} /> Past Attempts ({historyTotals ? historyTotals.attempts : history.length})
                     </h3>
+                    {historyTotals && historyTotals.attempts > 0 && (
+                        <span style={{ fontSize: '0.85rem', color: '#94a3b8' }}>
+                            {historyTotals.passed} passed · {historyTotals.average_percent}% avg · +{historyTotals.xp} XP
+                        </span>
+                    )}
+                    <select
+                        value={historyFilters.difficulty}
+                        onChange={e => setHistoryFilters({ ...historyFilters, difficulty: e.target.value })}
+                        style={{ background: 'transparent', border: '1px solid #475569', color: '#94a3b8', padding: '0.25rem 0.5rem', borderRadius: '4px', fontSize: '0.8rem' }}
+                    >
+                        <option value="">All levels</option>
+                        <option value="Beginner">Beginner</option>
+                        <option value="Medium">Medium</option>
+                        <option value="Hard">Hard</option>
+                        <option value="Expert">Expert</option>
+                    </select>
+                    <select
+                        value={historyFilters.passed}
+                        onChange={e => setHistoryFilters({ ...historyFilters, passed: e.target.value })}
+                        style={{ background: 'transparent', border: '1px solid #475569', color: '#94a3b8', padding: '0.25rem 0.5rem', borderRadius: '4px', fontSize: '0.8rem' }}
+                    >
+                        <option value="">All results</option>
+                        <option value="true">Passed</option>
+                        <option value="false">Failed</option>
+                    </select>
                     <button
-                        onClick={() => {
-                            const fetchHistory = async () => {
-                                try {
-                                    const res = await api.get('/mock-exam/history');
-                                    setHistory(res.data);
-                                    toast.success("History refreshed");
-                                } catch (err) {
-                                    console.error("Failed to fetch history", err);
-                                    toast.error("Failed to fetch history");
-                                }
-                            };
-                            fetchHistory();
+                        onClick={async () => {
+                            try {
+                                await fetchHistory();
+                                toast.success("History refreshed");
+                            } catch (err) {
+                                console.error("Failed to fetch history", err);
+                                toast.error("Failed to fetch history");
+                            }
                         }}
                         style={{ background: 'transparent', border: '1px solid #475569', color: '#94a3b8', padding: '0.25rem 0.75rem', borderRadius: '4px', cursor: 'pointer', fontSize: '0.8rem' }}
                     >
@@ -265,6 +304,14 @@ const MockExamConfig = () => {
                         ))}
                     </div>
                 )}
+                {hasMoreHistory && (
+                    <button
+                        onClick={loadOlderHistory}
+                        style={{ display: 'block', margin: '1.5rem auto 0', background: 'transparent', border: '1px solid #475569', color: '#94a3b8', padding: '0.5rem 1.5rem', borderRadius: '4px', cursor: 'pointer', fontSize: '0.85rem' }}
+                    >
+                        Load older attempts
+                    </button>
+                )}
             </div>
         </div>
     );
@@ -7,6 +7,7 @@ import ProfileDropdown from '../components/ProfileDropdown';
 const Roadmap = () => {
     const { topicId } = useParams();
     const [topic, setTopic] = useState(null);
+    const [prepareJob, setPrepareJob] = useState(null);
 
     useEffect(() => {
         const fetchTopic = async () => {
@@ -20,6 +21,23 @@ const Roadmap = () => {
         fetchTopic();
     }, [topicId]);
 
+    // Generates every module's content in the background so the topic works offline
+    const prepareAllModules = async () => {
+        try {
+            let job = (await api.post(`/topics/${topicId}/materialize`)).data;
+            setPrepareJob(job);
+            while (job.status === 'queued' || job.status === 'running') {
+                await new Promise(resolve => setTimeout(resolve, 2000));
+                job = (await api.get(`/topics/jobs/${job.id}`)).data;
+                setPrepareJob(job);
+            }
+        } catch (err) {
+            console.error(err);
+        }
+    };
+
+    const preparing = prepareJob && (prepareJob.status === 'queued' || prepareJob.status === 'running');
+
     if (!topic) return <div className="layout">Loading...</div>;
 
     return (
@@ -31,6 +49,15 @@ const Roadmap = () => {
             <div style={{ textAlign: 'center', marginBottom: '4rem' }}>
                 <h1 style={{ fontSize: '3rem', marginBottom: '1rem' }}>{topic.title} Roadmap</h1>
                 <p style={{ color: 'var(--text-secondary)', maxWidth: '600px', margin: '0 auto' }}>{topic.description}</p>
+                <button className="btn-secondary" style={{ marginTop: '1.5rem' }} onClick={prepareAllModules} disabled={preparing}>
+                    {preparing ? 'Preparing modules...' : 'Prepare all modules'}
+                </button>
+                {prepareJob && prepareJob.progress_total !== null && (
+                    <p style={{ color: 'var(--text-secondary)', fontSize: '0.9rem', marginTop: '0.5rem' }}>
+                        {prepareJob.progress_done} of {prepareJob.progress_total} modules ready
+                        {prepareJob.progress_failed > 0 && `, ${prepareJob.progress_failed} failed`}
+                    </p>
+                )}
             </div>
 
             <div style={{ maxWidth: '800px', margin: '0 auto', position: 'relative' }}>